@@ -0,0 +1,224 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Union
+
+# Compressed bitmap of ids (like roaring bitmaps); chunks of 2^16 ids, each a sorted array while sparse
+#   or a 2^16 bit int once dense
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+# Above this many ids a sorted array is larger than the bitmap
+SPARSE_LIMIT = 4096
+
+Container = Union[array, int]
+
+
+def _to_int(container: Container) -> int:
+    if isinstance(container, int):
+        return container
+    bits = bytearray(CHUNK_BYTES)
+    for low in container:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _to_array(bits: int) -> array:
+    result = array('H')
+    for index, byte in enumerate(bits.to_bytes(CHUNK_BYTES, "little")):
+        if byte:
+            base = index << 3
+            result.extend(base + bit for bit in range(8) if byte >> bit & 1)
+    return result
+
+
+def _count(container: Container) -> int:
+    if isinstance(container, int):
+        # int.bit_count is python 3.10+
+        return container.bit_count() if hasattr(container, "bit_count") else bin(container).count("1")
+    return len(container)
+
+
+def _fit(container: Container) -> Container:
+    # The smaller representation; None if empty
+    if isinstance(container, int):
+        if container == 0:
+            return None
+        if _count(container) <= SPARSE_LIMIT:
+            return _to_array(container)
+        return container
+    return container if len(container) > 0 else None
+
+
+def _filter(container: array, bits: int, keep: bool) -> array:
+    # The ids of an array that are (or are not) in a bitmap
+    data = bits.to_bytes(CHUNK_BYTES, "little")
+    return array('H', (low for low in container if bool(data[low >> 3] >> (low & 7) & 1) == keep))
+
+
+def _and(a: Container, b: Container) -> Container:
+    if isinstance(a, int) and isinstance(b, int):
+        return _fit(a & b)
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        return _fit(_filter(a, b, True))
+    return _fit(array('H', sorted(set(a).intersection(b))))
+
+
+def _or(a: Container, b: Container) -> Container:
+    if not isinstance(a, int) and not isinstance(b, int) and len(a) + len(b) <= SPARSE_LIMIT:
+        return array('H', sorted(set(a).union(b)))
+    return _fit(_to_int(a) | _to_int(b))
+
+
+def _and_not(a: Container, b: Container) -> Container:
+    if isinstance(a, int):
+        return _fit(a & ~_to_int(b))
+    if isinstance(b, int):
+        return _fit(_filter(a, b, False))
+    removed = set(b)
+    return _fit(array('H', (low for low in a if low not in removed)))
+
+
+class Bitmap:
+    """
+    A set of ids; results of '&', '|' and '-' may share chunks with the operands, 'copy' one before changing it.
+    """
+    __slots__ = ("chunks",)
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self.chunks: Dict[int, Container] = {}
+        ids = sorted(set(ids))
+        start = 0
+        while start < len(ids):
+            # The (sorted) ids of one chunk are a slice
+            high = ids[start] >> CHUNK_BITS
+            end = bisect_left(ids, (high + 1) << CHUNK_BITS, start)
+            base = high << CHUNK_BITS
+            chunk = array('H', [id - base for id in ids[start:end]])
+            self.chunks[high] = _to_int(chunk) if len(chunk) > SPARSE_LIMIT else chunk
+            start = end
+
+    @classmethod
+    def _from_chunks(cls, chunks: Dict[int, Container]) -> 'Bitmap':
+        bitmap = cls()
+        bitmap.chunks = {high: chunk for high, chunk in chunks.items() if chunk is not None}
+        return bitmap
+
+    def copy(self) -> 'Bitmap':
+        return Bitmap._from_chunks({high: chunk if isinstance(chunk, int) else array('H', chunk)
+                                    for high, chunk in self.chunks.items()})
+
+    def add(self, id: int):
+        high, low = id >> CHUNK_BITS, id & CHUNK_MASK
+        chunk = self.chunks.get(high)
+        if chunk is None:
+            self.chunks[high] = array('H', [low])
+        elif isinstance(chunk, int):
+            self.chunks[high] = chunk | (1 << low)
+        else:
+            index = bisect_left(chunk, low)
+            if index == len(chunk) or chunk[index] != low:
+                chunk.insert(index, low)
+                if len(chunk) > SPARSE_LIMIT:
+                    self.chunks[high] = _to_int(chunk)
+
+    def discard(self, id: int):
+        high, low = id >> CHUNK_BITS, id & CHUNK_MASK
+        chunk = self.chunks.get(high)
+        if chunk is None:
+            return
+        if isinstance(chunk, int):
+            # Left dense; it is only converted back by a set operation
+            chunk &= ~(1 << low)
+            if chunk:
+                self.chunks[high] = chunk
+            else:
+                del self.chunks[high]
+        else:
+            index = bisect_left(chunk, low)
+            if index < len(chunk) and chunk[index] == low:
+                del chunk[index]
+                if not chunk:
+                    del self.chunks[high]
+
+    def __contains__(self, id: int) -> bool:
+        chunk = self.chunks.get(id >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        low = id & CHUNK_MASK
+        if isinstance(chunk, int):
+            return bool(chunk >> low & 1)
+        index = bisect_left(chunk, low)
+        return index < len(chunk) and chunk[index] == low
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def __len__(self) -> int:
+        return sum(_count(chunk) for chunk in self.chunks.values())
+
+    def __iter__(self) -> Iterator[int]:
+        # In ascending order
+        for high in sorted(self.chunks):
+            chunk = self.chunks[high]
+            base = high << CHUNK_BITS
+            for low in (_to_array(chunk) if isinstance(chunk, int) else chunk):
+                yield base | low
+
+    def after(self, id: Optional[int] = None, descending: bool = False) -> Iterator[int]:
+        # In order, from the first id past the given one (which need not be in the bitmap); every id if None
+        start = None if id is None else id >> CHUNK_BITS
+        for high in sorted(self.chunks, reverse=descending):
+            if start is not None and (high > start if descending else high < start):
+                continue
+            chunk = self.chunks[high]
+            lows = _to_array(chunk) if isinstance(chunk, int) else chunk
+            if high == start:
+                low = id & CHUNK_MASK
+                lows = lows[:bisect_left(lows, low)] if descending else lows[bisect_right(lows, low):]
+            base = high << CHUNK_BITS
+            for low in (reversed(lows) if descending else lows):
+                yield base | low
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        return Bitmap._from_chunks({high: _and(chunk, other.chunks[high])
+                                    for high, chunk in self.chunks.items() if high in other.chunks})
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        chunks = dict(self.chunks)
+        for high, chunk in other.chunks.items():
+            chunks[high] = _or(chunks[high], chunk) if high in chunks else chunk
+        return Bitmap._from_chunks(chunks)
+
+    def __sub__(self, other: 'Bitmap') -> 'Bitmap':
+        return Bitmap._from_chunks({high: _and_not(chunk, other.chunks[high]) if high in other.chunks else chunk
+                                    for high, chunk in self.chunks.items()})
+
+    def nbytes(self) -> int:
+        # Approximate; without the python object overhead
+        return sum(CHUNK_BYTES if isinstance(chunk, int) else chunk.itemsize * len(chunk)
+                   for chunk in self.chunks.values())
+
+    def count_in(self, bitmaps: Dict[Any, 'Bitmap']) -> Dict[Any, int]:
+        # The size of each bitmap's intersection with this one, without building it (e.g. facet counts)
+        sets: Dict[int, Set[int]] = {}
+        ints: Dict[int, int] = {}
+        counts = {}
+        for key, bitmap in bitmaps.items():
+            count = 0
+            for high, chunk in bitmap.chunks.items():
+                own = self.chunks.get(high)
+                if own is None:
+                    continue
+                if isinstance(chunk, int):
+                    if high not in ints:
+                        ints[high] = _to_int(own)
+                    count += _count(chunk & ints[high])
+                else:
+                    if high not in sets:
+                        sets[high] = set(_to_array(own) if isinstance(own, int) else own)
+                    count += len(sets[high].intersection(chunk))
+            counts[key] = count
+        return counts
@@ -0,0 +1,136 @@
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, Optional, Tuple
+
+from pydantic import BaseModel
+
+from FileTagServer import config
+
+# WRITE GENERATION
+# Bumped whenever a pooled connection changed any row (see pool.ConnectionPool.connection), after its commit
+#   Anything computed from the database is current while the generation it was computed at is
+#   Writes by other processes (e.g. a scan) bump it too; noticed by the next checkout of a pooled connection that
+#   sees them (see DBI.changes)
+
+__generation = 0
+__generation_lock = Lock()
+
+
+def write_generation() -> int:
+    return __generation
+
+
+def bump_write_generation() -> int:
+    global __generation
+    with __generation_lock:
+        __generation += 1
+        return __generation
+
+
+class ResultCacheUsage(BaseModel):
+    entries: int
+    # Bytes of cached ids
+    bytes: int
+    hits: int
+    misses: int
+
+
+class ResultCache:
+    """
+    An LRU cache of (ordered) id lists; bounded by entries and by the bytes of the ids.
+
+    An entry is only returned while the write generation it was computed at is current; older entries are dropped
+    when found (or evicted as the least recently used).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.entries: 'OrderedDict[Hashable, Tuple[int, array]]' = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[array]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] != write_generation():
+                self.__remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, generation: int, ids: array):
+        # 'generation' is the write generation from BEFORE the ids were read
+        size = ids.itemsize * len(ids)
+        if size > self.max_bytes or self.max_entries <= 0 or generation != write_generation():
+            return
+        with self.lock:
+            if key in self.entries:
+                self.__remove(key)
+            self.entries[key] = (generation, ids)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.__remove(next(iter(self.entries)))
+
+    def __remove(self, key: Hashable):
+        _, ids = self.entries.pop(key)
+        self.bytes -= ids.itemsize * len(ids)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def usage(self) -> ResultCacheUsage:
+        with self.lock:
+            return ResultCacheUsage(entries=len(self.entries), bytes=self.bytes, hits=self.hits, misses=self.misses)
+
+
+class ValueCache:
+    """
+    An LRU cache of small values (e.g. counts); bounded by entries, and dropped with the write generation like
+    ResultCache.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries: 'OrderedDict[Hashable, Tuple[int, Any]]' = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != write_generation():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, generation: int, value: Any):
+        # 'generation' is the write generation from BEFORE the value was read
+        if self.max_entries <= 0 or generation != write_generation():
+            return
+        with self.lock:
+            self.entries[key] = (generation, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Tag searches of files; normalized search -> every matching file id, in sort order (see old_file.search_files)
+search_cache = ResultCache(config.search_cache_entries, config.search_cache_bytes)
+# Counts of tables & searches; see DBI.counts
+count_cache = ValueCache(config.count_cache_entries)
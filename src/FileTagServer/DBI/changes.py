@@ -0,0 +1,89 @@
+import uuid
+from sqlite3 import Connection
+from typing import Dict, List
+
+# CHANGE COUNTS
+# Rows changed per kind, kept by triggers; one count for every writer, and one per process for its own writes
+#   A process's own count is raised by TEMP triggers of its pooled connections, in the same transaction as the write;
+#   the difference of the two only grows when another process (e.g. a scan, or the sqlite3 shell) writes
+#   See pool.ConnectionPool, tag.index & tag.autocomplete
+
+# (table, event, kind); a file update is its own kind, the tag index does not care for it
+counted = [
+    ('file', 'INSERT', 'file'),
+    ('file', 'DELETE', 'file'),
+    ('file', 'UPDATE', 'file_update'),
+    ('file_tag', 'INSERT', 'file_tag'),
+    ('file_tag', 'DELETE', 'file_tag'),
+    ('file_tag', 'UPDATE', 'file_tag'),
+    ('tag', 'INSERT', 'tag'),
+    ('tag', 'DELETE', 'tag'),
+    ('tag', 'UPDATE', 'tag'),
+    ('folder', 'INSERT', 'folder'),
+    ('folder', 'DELETE', 'folder'),
+]
+kinds = sorted({kind for _, _, kind in counted})
+
+create_tables = [
+    """CREATE TABLE IF NOT EXISTS change_count(
+    kind TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS process_change_count(
+    token TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (token, kind)
+) WITHOUT ROWID""",
+    *(f"INSERT OR IGNORE INTO change_count (kind) VALUES ('{kind}')" for kind in kinds),
+]
+create_triggers = [
+    f"""CREATE TRIGGER IF NOT EXISTS change_count_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+    UPDATE change_count SET count = count + 1 WHERE kind = '{kind}';
+END""" for table, event, kind in counted
+]
+
+# Identifies this process's own counts; a new one per run
+token = uuid.uuid4().hex
+
+# Own counts start at the total, so the difference starts at 0
+insert_own = "INSERT OR IGNORE INTO process_change_count (token, kind, count) SELECT ?, kind, count FROM change_count"
+delete_own = "DELETE FROM process_change_count WHERE token = ?"
+select_outside = "SELECT change_count.kind, change_count.count - process_change_count.count FROM change_count " \
+                 "JOIN process_change_count ON process_change_count.kind = change_count.kind " \
+                 "AND process_change_count.token = ?"
+
+
+def _own_triggers() -> List[str]:
+    # The token is a hex string; triggers cannot bind parameters
+    return [f"""CREATE TEMP TRIGGER IF NOT EXISTS process_change_count_{table}_{event.lower()}
+AFTER {event} ON main.{table} BEGIN
+    UPDATE process_change_count SET count = count + 1 WHERE token = '{token}' AND kind = '{kind}';
+END""" for table, event, kind in counted]
+
+
+def install(conn: Connection) -> bool:
+    """
+    Counts the connection's writes as this process's own; False (and nothing counted) before the tables exist.
+    """
+    cursor = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'process_change_count'")
+    if cursor.fetchone()[0] == 0:
+        return False
+    for statement in _own_triggers():
+        conn.execute(statement)
+    conn.execute(insert_own, [token])
+    conn.commit()
+    return True
+
+
+def uninstall(conn: Connection):
+    # Once this process is done with the database; a crashed process leaves a few stale rows behind
+    conn.execute(delete_own, [token])
+    conn.commit()
+
+
+def outside_changes(conn: Connection) -> Dict[str, int]:
+    """
+    Rows changed per kind by other processes since this one first opened the database; empty before it was installed.
+    """
+    return {kind: count for kind, count in conn.execute(select_outside, [token]).fetchall()}
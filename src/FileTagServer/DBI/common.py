@@ -2,20 +2,24 @@ import json
 import os
 from contextlib import contextmanager
 from os.path import join
-from sqlite3 import Connection, Cursor, connect, Row
-from typing import List, Tuple, Optional, Union, AbstractSet, Mapping, Any, Dict, Callable, Set
+from sqlite3 import Connection, Cursor, Row
+from typing import List, Tuple, Optional, Union, AbstractSet, Mapping, Any, Dict, Callable, Set, Iterator
 
 from pydantic import BaseModel
 
 from FileTagServer import config
+from FileTagServer.DBI.models import construct_from_row
 from FileTagServer.DBI.old_models import Tag, File, Folder
+from FileTagServer.DBI.pool import get_pool
+from FileTagServer.DBI.migrations import migrate
+from FileTagServer.DBI.statements import validate_statements
 
 
 def find_src_root():
     # Lazy implimentation
     # This is at src\FileTagServer\DBI\common.py
     # Therefore....
-    root = os.path.abspath(fr"{__file__}\..\..\..")
+    root = os.path.abspath(join(os.path.dirname(__file__), "..", ".."))
     # Should be src
     return root
 
@@ -43,45 +47,51 @@ def validate_fields(value: str, fields: Union[List[str], Dict[str, Any], Set[str
 
 
 def row_to_folder(r: Row) -> Folder:
-    r: Dict = dict(r)
-    return Folder(**r)
+    return construct_from_row(Folder, r)
 
 
-def row_to_file(r: Row, *, tags: List[Tag] = None, tag_lookup: Dict[int, Tag] = None, ) -> File:
-    r: Dict = dict(r)
-    if tags:
-        r['tags'] = tags
-    elif r['tags'] is not None:
-        if tag_lookup:
-            f_tags = r['tags']
-            f_tags = [int(tag_id) for tag_id in f_tags.split(",")]
-            r['tags'] = [tag_lookup[id] for id in f_tags]
-    else:
-        r['tags'] = []
-    return File(**r)
+def row_to_file(r: Row, *, tags: List[Tag] = None, tag_ids: List[int] = None,
+                tag_lookup: Dict[int, Tag] = None, include: AbstractSet[str] = None) -> File:
+    # tag_ids come from relations.load_relation (file_tags); tag_lookup maps them to loaded tags
+    if not tags:
+        tags = [tag_lookup[id] for id in tag_ids] if tag_ids and tag_lookup else []
+    return construct_from_row(File, r, include, tags=tags)
 
 
-def row_to_tag(r: Row) -> Tag:
-    r: Dict = dict(r)
-    return Tag(**r)
+def row_to_tag(r: Row, include: AbstractSet[str] = None) -> Tag:
+    return construct_from_row(Tag, r, include)
 
 
 @contextmanager
-def _connect(path: str = None, **kwargs) -> Tuple[Connection, Cursor]:
-    path = path or config.db_path
-    with connect(path, **kwargs) as conn:
-        conn.execute("PRAGMA foreign_keys = 1")
+def _connect(path: str = None, shared: bool = True) -> Tuple[Connection, Cursor]:
+    # Connections are pooled per database file; pragmas (foreign_keys, WAL, etc.) are applied by the pool
+    #   Nested calls on a thread share its connection; not 'shared' when held across yields (see ConnectionPool)
+    with get_pool(path).connection(shared) as conn:
         cursor = conn.cursor()
         cursor.row_factory = Row
-        yield conn, cursor
+        try:
+            yield conn, cursor
+        finally:
+            cursor.close()
+
+
+def fetch_batches(cursor: Cursor, size: int = None) -> Iterator[List[Row]]:
+    """
+    Yields the cursor's remaining rows a batch at a time; memory is bounded by the batch size, not the result size.
+    """
+    size = size or config.db_fetch_size
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
 
 
 def initialize_database(path: str = None):
-    with _connect(path) as (conn, cursor):
-        dirs = ['file', 'tag', 'file_tag', 'folder', 'folder_tag', 'folder_file', 'folder_folder']
-        for dir in dirs:
-            sql_part = read_sql_file(f"../static/sql/{dir}/create.sql")
-            cursor.execute(sql_part)
+    # Creates the tables on a new database, or upgrades an existing one in place
+    migrate(path)
+    # Every statement is prepared once up front; a broken .sql file fails here instead of mid-request
+    validate_statements(path)
 
 
 IntStr = Union[int, str]
@@ -0,0 +1,55 @@
+import sys
+from sqlite3 import Cursor
+from typing import Callable, Hashable
+
+from pydantic import BaseModel
+
+from FileTagServer.DBI.cache import count_cache, write_generation
+from FileTagServer.DBI.common import _connect
+
+# COUNTS
+# Totals for paging (e.g. PaginationUtil.get_pagination) without reading the rows
+#   A table is COUNT(*)-ed on its smallest covering index (sqlite picks it); no row of the table is read
+#   A search is counted on the tag index if built, or in SQL while it cannot match more than config.count_exact_limit
+#   files; otherwise it is estimated from the tag counts (exact=False)
+#   Counts are cached until the next write, by this process or another (see DBI.cache)
+
+counted_tables = ["file", "folder", "tag"]
+
+
+class Count(BaseModel):
+    count: int
+    # False if estimated
+    exact: bool = True
+
+
+def cached_count(path: str, key: Hashable, counter: Callable[[Cursor], Count]) -> Count:
+    """
+    The cached count for the key; counted (and cached) on a miss.
+    """
+    key = (path, key)
+    # Looked up once checked out; the checkout notices writes by other processes (see pool)
+    with _connect(path) as (conn, cursor):
+        count = count_cache.get(key)
+        if count is None:
+            generation = write_generation()
+            count = counter(cursor)
+            count_cache.put(key, generation, count)
+    return count
+
+
+def count_table(path: str, table: str) -> Count:
+    if table not in counted_tables:
+        raise ValueError(f"Cannot count '{table}'; expected one of {counted_tables}")
+
+    def counter(cursor: Cursor) -> Count:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        return Count.construct(count=cursor.fetchone()[0], exact=True)
+    return cached_count(path, table, counter)
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.DBI.counts ../local.db'
+    db_path = sys.argv[1] if len(sys.argv) > 1 else None
+    for table in counted_tables:
+        print(f"{table}: {count_table(db_path, table).count}")
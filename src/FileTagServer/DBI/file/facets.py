@@ -0,0 +1,108 @@
+import heapq
+import json
+from sqlite3 import Cursor
+from typing import List, Optional, Sequence, Dict
+
+from pydantic import BaseModel
+
+from FileTagServer.DBI.bitmap import Bitmap
+from FileTagServer.DBI.common import fetch_batches
+from FileTagServer.DBI.search import Clause
+from FileTagServer.DBI.tag import queries as tag_queries
+from FileTagServer.DBI.tag.index import TagIndex
+
+# FACETS
+# The number of files per tag (and per mime type) among every file matching a query; e.g. for a tag sidebar
+#   Every file: the tag counts are tag_count (kept by triggers)
+#   Some files: with the TagIndex, each tag's bitmap is counted against the matches (one pass over the index);
+#   without it (or when the matches are few enough that reading their own tags is cheaper) a single GROUP BY over
+#   the matches' file_tag rows
+#   Mime types are always a single GROUP BY over the matching rows
+
+# A file_tag row read by sqlite costs about this many ids counted in a bitmap
+#   Counting every tag's bitmap reads every edge, reading the matches' own tags reads (matches / files) of them;
+#   so the index is used once more than 1 / SCAN_COST of the files match
+SCAN_COST = 8
+
+
+class TagFacet(BaseModel):
+    id: int
+    name: Optional[str] = None
+    count: int
+
+
+class MimeFacet(BaseModel):
+    mime: Optional[str] = None
+    count: int
+
+
+class Facets(BaseModel):
+    # Every matching file, not just a page
+    files: int
+    # The most used first, at most the requested number of each
+    tags: List[TagFacet]
+    mimes: List[MimeFacet]
+
+
+def __where(clauses: List[Clause], ids: Optional[Sequence[int]]) -> Clause:
+    if ids is not None:
+        return "file.id IN (SELECT value FROM json_each(?))", [json.dumps(list(ids))]
+    if not clauses:
+        return "1", []
+    return " AND ".join(f"({clause})" for clause, _ in clauses), [arg for _, args in clauses for arg in args]
+
+
+def __matching_ids(cursor: Cursor, where: Clause) -> List[int]:
+    cursor.execute(f"SELECT file.id FROM file WHERE {where[0]}", where[1])
+    ids = []
+    for rows in fetch_batches(cursor):
+        ids.extend(row[0] for row in rows)
+    return ids
+
+
+def __index_counts(cursor: Cursor, index: TagIndex, where: Clause, ids: Optional[Sequence[int]]) -> Dict[int, int]:
+    matches = Bitmap(ids if ids is not None else __matching_ids(cursor, where))
+    with index.lock:
+        return matches.count_in(index.tags)
+
+
+def __scan_counts(cursor: Cursor, where: Clause, limit: int) -> Dict[int, int]:
+    cursor.execute(f"SELECT file_tag.tag_id, COUNT(*) FROM file_tag "
+                   f"WHERE file_tag.file_id IN (SELECT file.id FROM file WHERE {where[0]}) "
+                   f"GROUP BY file_tag.tag_id ORDER BY COUNT(*) DESC, file_tag.tag_id LIMIT ?", where[1] + [limit])
+    return {tag_id: count for tag_id, count in cursor.fetchall()}
+
+
+def file_facets(cursor: Cursor, clauses: List[Clause], limit: int, index: TagIndex = None,
+                ids: Optional[Sequence[int]] = None) -> Facets:
+    """
+    The facets of the files matching every clause (or with the given ids, if known); the top 'limit' of each.
+    """
+    where = __where(clauses, ids)
+    cursor.execute(f"SELECT file.mime, COUNT(*) FROM file WHERE {where[0]} GROUP BY file.mime", where[1])
+    mimes = [MimeFacet.construct(mime=mime, count=count) for mime, count in cursor.fetchall()]
+    files = sum(mime.count for mime in mimes)
+    mimes = heapq.nsmallest(limit, mimes, key=lambda mime: (-mime.count, mime.mime or ""))
+
+    if files == 0:
+        counts = {}
+    elif not clauses and ids is None:
+        cursor.execute(f"SELECT tag_id, {tag_queries.file_count} FROM tag_count "
+                       f"WHERE {tag_queries.file_count} > 0 ORDER BY {tag_queries.file_count} DESC, tag_id LIMIT ?",
+                       [limit])
+        counts = {tag_id: count for tag_id, count in cursor.fetchall()}
+    elif index is not None and files * SCAN_COST > len(index.files):
+        counts = __index_counts(cursor, index, where, ids)
+    else:
+        counts = __scan_counts(cursor, where, limit)
+    top = heapq.nsmallest(limit, ((tag_id, count) for tag_id, count in counts.items() if count > 0),
+                          key=lambda item: (-item[1], item[0]))
+
+    names = {}
+    if top:
+        sql, args = tag_queries.select_builder({'id', 'name'}).where_in("tag.id", [tag_id for tag_id, _ in top]).build()
+        cursor.execute(sql, args)
+        names = {row[0]: row[1] for row in cursor.fetchall()}
+    tags = [TagFacet.construct(id=tag_id, name=names.get(tag_id), count=count) for tag_id, count in top]
+    return Facets.construct(files=files, tags=tags, mimes=mimes)
+
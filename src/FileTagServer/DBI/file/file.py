@@ -1,45 +1,71 @@
-from sqlite3 import Row
-from typing import List, Dict
+from sqlite3 import Row, Cursor
+from typing import List, Optional
 
-from FileTagServer.DBI.common import replace_kwargs, AbstractDBI
+from FileTagServer.DBI import relations, full_search
+from FileTagServer.DBI.common import AbstractDBI
 from FileTagServer.DBI.error import ApiError
 from FileTagServer.DBI.file import queries
 from FileTagServer.DBI.models import File
+from FileTagServer.DBI.search import compile_search
 
 
 class FileDBI(AbstractDBI):
 
     @staticmethod
-    def parse_row(row: Row) -> File:
-        d: Dict = dict(row)
-        if d['tags']:
-            d['tags'] = [int(tag_id) for tag_id in d['tags'].split(",")]
-        return File(**d)
+    def parse_row(row: Row, tags: Optional[List[int]] = None) -> File:
+        return File.from_row(row, tags=tags)
+
+    @staticmethod
+    def parse_rows(cursor: Cursor, rows: List[Row]) -> List[File]:
+        # Every row's tags in one keyed query
+        file_tags = relations.load_relation(cursor, relations.file_tags, [row['id'] for row in rows])
+        return [FileDBI.parse_row(row, file_tags.get(row['id'])) for row in rows]
 
 
     def get_files(self, file_ids: List[int]) -> List[File]:
         if not file_ids:
             return []
         with self.connect() as (conn, cursor):
-            sql_placeholder = ", ".join(["?" for _ in range(len(file_ids))])
-            sql = replace_kwargs(queries.select_by_ids, file_ids=sql_placeholder)
-            cursor.execute(sql, file_ids)
+            sql, args = queries.select().where_in("file.id", file_ids).build()
+            cursor.execute(sql, args)
             rows = cursor.fetchall()
-            return [self.parse_row(row) for row in rows]
+            return self.parse_rows(cursor, rows)
 
 
     def get_file(self,file_id: int) -> File:
         with self.connect() as (conn, cursor):
-            cursor.execute(queries.select_by_id, (file_id,))
+            sql, args = queries.select().where("file.id = ?", file_id).build()
+            cursor.execute(sql, args)
             rows = cursor.fetchall()
             if len(rows) == 1:
-                return self.parse_row(rows[0])
+                return self.parse_rows(cursor, rows)[0]
             else:
                 raise ApiError(500, "Not Implemented")
 
 
     def get_orphaned_files(self) -> List[File]:
         with self.connect() as (conn, cursor):
-            cursor.execute(queries.select_orphaned_files)
+            sql, args = queries.select().where(queries.orphaned).build()
+            cursor.execute(sql, args)
+            rows = cursor.fetchall()
+            return self.parse_rows(cursor, rows)
+
+
+    def search_files(self, query: str, limit: Optional[int] = None) -> List[File]:
+        """
+        The files matching a search string (see DBI.full_search), by name; raises an ApiError (400) if invalid.
+        """
+        plan = full_search.plan(query)
+        if plan.search is None:
+            return []
+        with self.connect() as (conn, cursor):
+            clauses = compile_search(cursor, plan.search, relations.file_tags, "file.id")
+            if clauses is None:
+                return []
+            builder = queries.select().order_by("file.name", "file.id").limit(limit)
+            for clause, args in clauses:
+                builder.where(clause, *args)
+            sql, args = builder.build()
+            cursor.execute(sql, args)
             rows = cursor.fetchall()
-            return [self.parse_row(row) for row in rows]
+            return self.parse_rows(cursor, rows)
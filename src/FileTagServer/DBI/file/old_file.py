@@ -1,42 +1,75 @@
+import itertools
+import json
+from array import array
 from sqlite3 import Row, Cursor
-from typing import List, Dict, Optional, Union, Tuple
+from typing import List, Dict, Optional, Tuple, Iterator, Set, Hashable
 from pydantic import BaseModel, validator, Field
 from starlette import status
 
-from FileTagServer.DBI.common import _connect, SortQuery, Util, validate_fields, row_to_tag, row_to_file, read_sql_file
+from FileTagServer import config
+from FileTagServer.DBI import relations, full_search, simple_search
+from FileTagServer.DBI.bitmap import Bitmap
+from FileTagServer.DBI.cache import search_cache, write_generation
+from FileTagServer.DBI.counts import Count, cached_count, count_table
+from FileTagServer.DBI.common import _connect, SortQuery, validate_fields, row_to_tag, row_to_file, fetch_batches
 from FileTagServer.DBI.error import ApiError
+from FileTagServer.DBI.file import queries, text
+from FileTagServer.DBI.file.facets import Facets, file_facets
+from FileTagServer.DBI.search import SearchQuery, Clause, compile_search, estimate_search, count_search, \
+    search_index
+from FileTagServer.DBI.pagination import keyset_sort, keyset_where, decode_cursor, encode_cursor, order_by, \
+    validate_sort
+from FileTagServer.DBI.statements import get_sql
+from FileTagServer.DBI.tag import queries as tag_queries
+from FileTagServer.DBI.tag.index import TagIndex, find_tag_index, get_tag_index
 from FileTagServer.DBI.old_models import File, Tag
 
 
-def __run_exists(cursor: Cursor, path: str, args: Tuple) -> bool:
-    sql = read_sql_file(path)
+def __run_exists(cursor: Cursor, name: str, args: Tuple) -> bool:
+    sql = get_sql(name)
     cursor.execute(sql, args)
     row = cursor.fetchone()
     return row[0] == 1
 
 
 def __file_exists(cursor: Cursor, id: int) -> bool:
-    path = "../static/sql/file/exists.sql"
+    name = "file/exists"
     args = (str(id),)
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
 
 
 def __file_tag_exists(cursor: Cursor, id: int, tag_id: int) -> bool:
-    path = "../static/sql/file_tag/exists.sql"
+    name = "file_tag/exists"
     args = (str(id), str(tag_id))
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
+
+
+# Indexed columns of the file table (see queries.sort_indexes); tags & parent are generated and cannot be sorted
+#   (or paged) on, and a sort by description would read every file
+sortable_fields = ['id'] + list(dict.fromkeys(column for columns in queries.sort_indexes.values() for column in columns))
 
 
 class FilesQuery(BaseModel):
     sort: Optional[List[SortQuery]] = None
     fields: Optional[List[str]] = None
     tag_fields: Optional[List[str]] = None
+    # Paging; 'cursor' is the 'next_cursor' of the previous page
+    limit: Optional[int] = Field(None, ge=1)
+    cursor: Optional[str] = None
+    # The number of tags (& mime types) to count over every matching file; none are counted if None
+    facets: Optional[int] = Field(None, ge=1, le=config.max_facets)
 
     # Validators
     @validator('sort', each_item=True)
     def validate_sort(cls, value: SortQuery) -> SortQuery:
         # will raise error if failed
-        validate_fields(value.field, File.__fields__)
+        validate_fields(value.field, sortable_fields)
+        return value
+
+    @validator('sort')
+    def validate_indexed_sort(cls, value: Optional[List[SortQuery]]) -> Optional[List[SortQuery]]:
+        # Rejected up front rather than sorting every file
+        validate_sort(value, queries.sort_indexes)
         return value
 
     @validator('fields', each_item=True)
@@ -111,29 +144,24 @@ class CreateFileQuery(BaseModel):
         return File(id=id, path=self.path, mime=self.mime, name=self.name, description=self.description, tags=tags)
 
 
-class SearchQuery(BaseModel):
-    # AND
-    required: Optional[List[Union['SearchQuery', str]]] = None
-    # OR
-    include: Optional[List[Union['SearchQuery', str]]] = None
-    # NOT
-    exclude: Optional[List[Union['SearchQuery', str]]] = None
-
-
-class FileSearchQuery(BaseModel):
-    fields: Optional[List[str]] = None
-    tag_fields: Optional[List[str]] = None
-    sort: Optional[List[SortQuery]] = None
+class FileSearchQuery(FilesQuery):
+    # Paged like FilesQuery
     search: Optional[SearchQuery] = None
-    page: Optional[int] = Field(1, ge=1)
+    # A search string (see DBI.full_search); AND-ed with search
+    query: Optional[str] = None
+    # A simple search string (see DBI.simple_search); AND-ed with both
+    simple: Optional[str] = None
 
-    @validator('fields', each_item=True)
-    def validate_fields(cls, value: str) -> str:
-        return validate_fields(value, File.__fields__)
 
-    @validator('tag_fields', each_item=True)
-    def validate_tag_fields(cls, value: str) -> str:
-        return validate_fields(value, Tag.__fields__)
+class FileTextQuery(FileSearchQuery):
+    # The words to find in the names, descriptions & paths (see DBI.file.text); filtered by the tag searches
+    text: str
+
+    @validator('sort')
+    def validate_ranked(cls, value: Optional[List[SortQuery]]) -> Optional[List[SortQuery]]:
+        if value:
+            raise ValueError("Text searches are sorted by rank")
+        return value
 
 
 class FilePathQuery(BaseModel):
@@ -154,68 +182,316 @@ class FilePathQuery(BaseModel):
         return FileTagQuery(id=id, fields=self.tag_fields)
 
 
-def get_files(path:str,query: FilesQuery) -> List[File]:
-    with _connect(path) as (conn, cursor):
-        get_files_sql = read_sql_file("../static/sql/file/select.sql", True)
-        # SORT
-        if query.sort is not None:
-            sort_query = "ORDER BY " + SortQuery.list_sql(query.sort)
-        else:
-            sort_query = ''
-
-        sql = f"{get_files_sql} {sort_query}"
-        cursor.execute(sql)
+class FilesPage(BaseModel):
+    files: List[File]
+    # None on the last page
+    next_cursor: Optional[str] = None
+    # The executed plan of a simple search
+    search_plan: Optional[simple_search.SimpleSearchPlan] = None
+    # Counted if requested (see FilesQuery.facets)
+    facets: Optional[Facets] = None
+
+
+def __select_fields(fields: Optional[List[str]]) -> Set[str]:
+    # The requested fields (or all of them); only these are selected (or loaded)
+    return set(File.__fields__) if fields is None else set(fields)
+
+
+def __files_builder(query: FilesQuery, sort: List[SortQuery]):
+    # The sort columns are also needed for the next cursor
+    fields = __select_fields(query.fields).union(part.field for part in sort)
+    builder = queries.select(fields).order_by(*order_by(sort, "file"))
+    if query.cursor is not None:
+        builder.where_any(keyset_where(sort, decode_cursor(sort, query.cursor), "file"))
+    return builder
+
+
+def __load_tags(cursor: Cursor, rows: List[Row], tags: Dict[int, Tag], fields: Optional[Set[str]] = None,
+                tag_fields: Optional[List[str]] = None) -> Dict[int, List[int]]:
+    # Returns the tag ids of every row; adds the tags used by rows (and not already loaded) to tags
+    if fields is not None and 'tags' not in fields:
+        return {}
+    file_tags = relations.load_relation(cursor, relations.file_tags, [row['id'] for row in rows])
+    tag_ids = {tag_id for ids in file_tags.values() for tag_id in ids}
+    tag_ids.difference_update(tags.keys())
+    if tag_ids:
+        tag_include = set(tag_fields) if tag_fields is not None else None
+        sql, args = tag_queries.select_builder(tag_include).where_in("tag.id", tag_ids).build()
+        cursor.execute(sql, args)
+        for row in cursor.fetchall():
+            tags[row['id']] = row_to_tag(row, tag_include)
+    return file_tags
+
+
+def __search_clauses(cursor: Cursor, search: Optional[SearchQuery],
+                     simple: Optional[simple_search.SimpleSearchQuery]) \
+        -> Tuple[Optional[List[Clause]], Optional[simple_search.SimpleSearchPlan]]:
+    # The clauses (None if nothing can match) of both searches, and the executed plan of the simple search
+    search_plan = None
+    clauses = []
+    if simple is not None:
+        search_plan = simple_search.plan(cursor, simple)
+        clauses = simple_search.execute(cursor, search_plan, relations.file_tags, "file.id")
+    if clauses is not None:
+        search_clauses = compile_search(cursor, search, relations.file_tags, "file.id")
+        clauses = clauses + search_clauses if search_clauses is not None else None
+    return clauses, search_plan
+
+
+def __search_matches(cursor: Cursor, index: TagIndex, search: Optional[SearchQuery],
+                     simple: Optional[simple_search.SimpleSearchQuery]) \
+        -> Tuple[Bitmap, Optional[simple_search.SimpleSearchPlan]]:
+    # As __search_clauses, on the index's bitmaps
+    search_plan = None
+    matches = search_index(cursor, search, index)
+    if simple is not None:
+        search_plan = simple_search.plan(cursor, simple)
+        matches = matches & simple_search.execute_index(search_plan, index)
+    return matches, search_plan
+
+
+def __search_key(path: str, sort: List[SortQuery], search: Optional[SearchQuery],
+                 simple: Optional[simple_search.SimpleSearchQuery]) -> Hashable:
+    # Equivalent searches share a cache entry; search strings are already normalized into search (see full_search),
+    #   and the order (or repetition) of a simple search's tags does not matter
+    simple_key = None
+    if simple is not None:
+        simple_key = tuple(tuple(sorted(set(terms or []))) for terms in [simple.required, simple.include, simple.exclude])
+    return path, SortQuery.list_to_str(sort), search.json() if search is not None else None, simple_key
+
+
+def __search_ids(cursor: Cursor, sort: List[SortQuery], index: Optional[TagIndex], search: Optional[SearchQuery],
+                 simple: Optional[simple_search.SimpleSearchQuery]) \
+        -> Tuple[array, Optional[simple_search.SimpleSearchPlan]]:
+    # Every matching id, in sort order; and the executed plan of the simple search
+    if index is not None:
+        matches, search_plan = __search_matches(cursor, index, search, simple)
+        return __matching_ids(cursor, sort, matches), search_plan
+    clauses, search_plan = __search_clauses(cursor, search, simple)
+    ids = array('q')
+    if clauses is None:
+        return ids, search_plan
+    builder = queries.select(['id']).order_by(*order_by(sort, "file"))
+    for clause, clause_args in clauses:
+        builder.where(clause, *clause_args)
+    sql, args = builder.build()
+    cursor.execute(sql, args)
+    for rows in fetch_batches(cursor):
+        ids.extend(row[0] for row in rows)
+    return ids, search_plan
+
+
+def __matching_ids(cursor: Cursor, sort: List[SortQuery], matches: Bitmap, values: Optional[List] = None,
+                   limit: Optional[int] = None) -> array:
+    # The ids in matches, in sort order from after the cursor's values (if any); up to limit
+    #   Sorted by id alone (see keyset_sort), straight from the bitmap; otherwise the sort order is read a batch at a
+    #   time (a seek on its index), skipping the ids not in matches
+    ids = array('q')
+    if len(sort) == 1:
+        ids.extend(itertools.islice(matches.after(values[0] if values is not None else None, not sort[0].ascending),
+                                    limit))
+        return ids
+    fields = [part.field for part in sort]
+    while limit is None or len(ids) < limit:
+        builder = queries.select(fields).order_by(*order_by(sort, "file")).limit(config.db_fetch_size)
+        if values is not None:
+            builder.where_any(keyset_where(sort, values, "file"))
+        sql, args = builder.build()
+        cursor.execute(sql, args)
         rows = cursor.fetchall()
-        tags = {tag.id: tag for tag in get_files_tags(query)}
-        results = [row_to_file(row, tag_lookup=tags) for row in rows]
-        if query.fields is not None:
-            results = Util.copy(results, include=set(query.fields))
-        return results
+        ids.extend(row['id'] for row in rows if row['id'] in matches)
+        if len(rows) < config.db_fetch_size:
+            break
+        values = [rows[-1][field] for field in fields]
+    if limit is not None:
+        del ids[limit:]
+    return ids
+
+
+def __after(cursor: Cursor, sort: List[SortQuery], values: List, id: int) -> bool:
+    # Whether the file is ordered after the cursor's values; compared by sqlite, as a keyset page is
+    sql, args = queries.select(['id']).where("file.id = ?", id).where_any(keyset_where(sort, values, "file")).build()
+    cursor.execute(sql, args)
+    return cursor.fetchone() is not None
+
+
+def __cached_page(cursor: Cursor, query: FilesQuery, sort: List[SortQuery], ids: array) -> FilesPage:
+    # Every matching id is known; the page is a slice of them
+    start = 0
+    if query.cursor is not None:
+        # The ids are in sort order; a binary search reads a row per step
+        values = decode_cursor(sort, query.cursor)
+        end = len(ids)
+        while start < end:
+            middle = (start + end) // 2
+            if __after(cursor, sort, values, ids[middle]):
+                end = middle
+            else:
+                start = middle + 1
+    return __ids_page(cursor, query, sort, ids, start)
+
+
+def __ids_page(cursor: Cursor, query: FilesQuery, sort: List[SortQuery], ids: array, start: int) -> FilesPage:
+    # The page of the ids from start; only its rows are read
+    end = len(ids) if query.limit is None else min(start + query.limit, len(ids))
+    page_ids = ids[start:end].tolist()
+    rows = []
+    if page_ids:
+        fields = __select_fields(query.fields).union(part.field for part in sort)
+        sql, args = queries.select(fields).where("file.id IN (SELECT value FROM json_each(?))",
+                                                 json.dumps(page_ids)).build()
+        cursor.execute(sql, args)
+        positions = {id: position for position, id in enumerate(page_ids)}
+        rows = sorted(cursor.fetchall(), key=lambda row: positions[row['id']])
+    next_cursor = None
+    if end < len(ids) and rows:
+        next_cursor = encode_cursor(sort, [rows[-1][part.field] for part in sort])
+    return __files_page(cursor, query, rows, next_cursor)
 
 
-def get_files_tags(path:str, query: FilesQuery) -> List[Tag]:
+def __files_page(cursor: Cursor, query: FilesQuery, rows: List[Row], next_cursor: Optional[str]) -> FilesPage:
+    # Only the tags used on this page
+    include = set(query.fields) if query.fields is not None else None
+    tags = {}
+    file_tags = __load_tags(cursor, rows, tags, include, query.tag_fields)
+
+    results = [row_to_file(row, tag_ids=file_tags.get(row['id']), tag_lookup=tags, include=include)
+               for row in rows]
+    return FilesPage.construct(files=results, next_cursor=next_cursor)
+
+
+def __add_facets(path: str, cursor: Cursor, query: FilesQuery, page: FilesPage, clauses: Optional[List[Clause]],
+                 ids: Optional[array] = None) -> FilesPage:
+    # Over every matching file (the ids if known, else the clauses; None matches nothing), not just the page
+    if query.facets is None:
+        return page
+    if clauses is None and ids is None:
+        page.facets = Facets.construct(files=0, tags=[], mimes=[])
+    else:
+        page.facets = file_facets(cursor, clauses or [], query.facets, index=get_tag_index(path), ids=ids)
+    return page
+
+
+def __get_files_page(path: str, query: FilesQuery, search: Optional[SearchQuery] = None,
+                     simple: Optional[simple_search.SimpleSearchQuery] = None) -> FilesPage:
+    sort = keyset_sort(query.sort)
+
     with _connect(path) as (conn, cursor):
-        get_files_sql = read_sql_file("../static/sql/file/select.sql", True)
-        # SORT
-        if query.sort is not None:
-            sort_query = "ORDER BY " + SortQuery.list_sql(query.sort)
+        index = get_tag_index(path)
+        if search is None and simple is None:
+            clauses, search_plan = [], None
+        elif search_cache.max_entries > 0:
+            # Paging back and forth repeats the search; the matches are cached until the next write
+            key = __search_key(path, sort, search, simple)
+            ids = search_cache.get(key)
+            search_plan = None
+            if ids is None:
+                generation = write_generation()
+                ids, search_plan = __search_ids(cursor, sort, index, search, simple)
+                search_cache.put(key, generation, ids)
+            page = __cached_page(cursor, query, sort, ids)
+            # No plan on a cache hit; nothing was executed
+            page.search_plan = search_plan
+            return __add_facets(path, cursor, query, page, None, ids)
+        elif index is not None:
+            matches, search_plan = __search_matches(cursor, index, search, simple)
+            values = decode_cursor(sort, query.cursor) if query.cursor is not None else None
+            # One extra id to know if there is a next page
+            ids = __matching_ids(cursor, sort, matches, values, None if query.limit is None else query.limit + 1)
+            page = __ids_page(cursor, query, sort, ids, 0)
+            page.search_plan = search_plan
+            return __add_facets(path, cursor, query, page, None, matches)
         else:
-            sort_query = ''
-
-        sql = f"SELECT id from ({get_files_sql} {sort_query})"
-        sql = read_sql_file("../static/sql/tag/select_by_file_query.sql").replace("<file_query>", sql)
-        cursor.execute(sql)
+            clauses, search_plan = __search_clauses(cursor, search, simple)
+        if clauses is None:
+            # Uses a tag that does not exist
+            page = FilesPage.construct(files=[], next_cursor=None, search_plan=search_plan)
+            return __add_facets(path, cursor, query, page, clauses)
+
+        builder = __files_builder(query, sort)
+        if query.limit is not None:
+            # Fetch one extra row to know if there is a next page
+            builder.limit(query.limit + 1)
+        for clause, clause_args in clauses:
+            builder.where(clause, *clause_args)
+        sql, args = builder.build()
+        cursor.execute(sql, args)
         rows = cursor.fetchall()
+        next_cursor = None
+        if query.limit is not None and len(rows) > query.limit:
+            rows = rows[:query.limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(sort, [last[part.field] for part in sort])
+        page = __files_page(cursor, query, rows, next_cursor)
+        page.search_plan = search_plan
+        return __add_facets(path, cursor, query, page, clauses)
+
+
+def get_files_page(path: str, query: FilesQuery) -> FilesPage:
+    return __get_files_page(path, query)
+
+
+def iter_files(path: str, query: FilesQuery) -> Iterator[File]:
+    """
+    Streams the files matching the query (a batch of rows at a time); the connection is held until exhausted or closed.
+    """
+    sort = keyset_sort(query.sort)
+    builder = __files_builder(query, sort)
+    if query.limit is not None:
+        builder.limit(query.limit)
+    include = set(query.fields) if query.fields is not None else None
+
+    with _connect(path, shared=False) as (conn, cursor):
+        sql, args = builder.build()
+        cursor.execute(sql, args)
+        tag_cursor = conn.cursor()
+        tag_cursor.row_factory = Row
+        tags = {}
+        for rows in fetch_batches(cursor):
+            file_tags = __load_tags(tag_cursor, rows, tags, include, query.tag_fields)
+            for row in rows:
+                yield row_to_file(row, tag_ids=file_tags.get(row['id']), tag_lookup=tags, include=include)
 
-        def row_to_tag(r: Row) -> Tag:
-            r: Dict = dict(r)
-            return Tag(**r)
 
-        results = [row_to_tag(row) for row in rows]
-        if query.tag_fields is not None:
-            results = Util.copy(results, include=set(query.tag_fields))
-        return results
+def get_files(path:str,query: FilesQuery) -> List[File]:
+    return get_files_page(path, query).files
+
+
+def iter_files_tags(path: str, query: FilesQuery) -> Iterator[Tag]:
+    include = set(query.tag_fields) if query.tag_fields is not None else None
+    with _connect(path, shared=False) as (conn, cursor):
+        # Every tag used by a file; the files' sort does not change which tags those are
+        sql, args = tag_queries.select_builder(include, count=tag_queries.file_count) \
+            .where("tag.id IN (SELECT DISTINCT file_tag.tag_id FROM file_tag "
+                   "WHERE file_tag.file_id IN (SELECT file.id FROM file))").build()
+        cursor.execute(sql, args)
+        for rows in fetch_batches(cursor):
+            for row in rows:
+                yield row_to_tag(row, include)
+
+
+def get_files_tags(path:str, query: FilesQuery) -> List[Tag]:
+    return list(iter_files_tags(path, query))
 
 
 def get_file(path:str,query: FileQuery) -> File:
+    fields = __select_fields(query.fields)
+    include = set(query.fields) if query.fields is not None else None
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/file/select_by_id.sql")
-        cursor.execute(sql, (str(query.id),))
+        sql, args = queries.select(fields).where("file.id = ?", query.id).build()
+        cursor.execute(sql, args)
         rows = cursor.fetchall()
         if len(rows) < 1:
             raise ApiError(status.HTTP_410_GONE, f"No file found with the given id: '{query.id}'")
         elif len(rows) > 1:
             raise ApiError(status.HTTP_300_MULTIPLE_CHOICES, f"Too many files found with the given id: '{query.id}'")
-        tags = get_file_tags(query.create_tag_query())
-        result = row_to_file(rows[0], tags=tags)
-        if query.fields is not None:
-            result = result.copy(include=set(query.fields))
-        return result
+        tags = get_file_tags(path, query.create_tag_query()) if 'tags' in fields else []
+        return row_to_file(rows[0], tags=tags, include=include)
 
 
 def get_file_by_path(path:str,query: FilePathQuery) -> File:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/file/select_by_path.sql")
+        sql = get_sql("file/select_by_path")
         cursor.execute(sql, (str(query.path),))
         rows = cursor.fetchall()
         if len(rows) < 1:
@@ -223,17 +499,15 @@ def get_file_by_path(path:str,query: FilePathQuery) -> File:
         elif len(rows) > 1:
             raise ApiError(status.HTTP_300_MULTIPLE_CHOICES,
                            f"Too many files found with the given path: '{query.path}'")
-        result = row_to_file(rows[0])
-        tags = get_file_tags(query.create_tag_query(id=result.id))
-        result = row_to_file(rows[0], tags=tags)
-        if query.fields is not None:
-            result = result.copy(include=set(query.fields))
-        return result
+        include = set(query.fields) if query.fields is not None else None
+        tags = get_file_tags(path, query.create_tag_query(id=rows[0]['id'])) \
+            if include is None or 'tags' in include else []
+        return row_to_file(rows[0], tags=tags, include=include)
 
 
 def create_file(path:str,query: CreateFileQuery) -> File:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/file/insert.sql")
+        sql = get_sql("file/insert")
         sql_args = query.dict(include={'path', 'mime', 'description', 'name'})
         cursor.execute(sql, sql_args)
         id = cursor.lastrowid
@@ -245,6 +519,9 @@ def create_file(path:str,query: CreateFileQuery) -> File:
             # tags = get_file_tags(FileTagQuery(id=id))
 
         conn.commit()
+        index = find_tag_index(path)
+        if index is not None:
+            index.add_file(id)
         return query.create_file(id=id, tags=tags)
 
 
@@ -256,28 +533,37 @@ def delete_file(path:str,query: DeleteFileQuery):
     with _connect(path) as (conn, cursor):
         if not __file_exists(cursor, query.id):
             raise ApiError(status.HTTP_410_GONE, f"No file found with the given id: '{query.id}'")
-        sql = read_sql_file("../static/sql/file/delete_by_id.sql")
-        cursor.execute(sql, str(query.id))
+        # Read before the file is gone; for the index
+        cursor.execute("SELECT tag_id FROM file_tag WHERE file_id = ?", (query.id,))
+        tag_ids = [row[0] for row in cursor.fetchall()]
+        sql = get_sql("file/delete_by_id")
+        cursor.execute(sql, (query.id,))
         conn.commit()
+        index = find_tag_index(path)
+        if index is not None:
+            index.remove_file(query.id, tag_ids)
 
 
-# Does not commit
-def set_file_tags(cursor: Cursor, file_id: int, tags: List[int]):
-    q = FileTagQuery(id=file_id, fields=["id"])
-    current_tags = get_file_tags(q)
-    current_ids = [tag.id for tag in current_tags]
+# Does not commit; returns the added and removed tag ids
+def set_file_tags(cursor: Cursor, file_id: int, tags: List[int]) -> Tuple[List[int], List[int]]:
+    cursor.execute("SELECT tag_id FROM file_tag WHERE file_id = ?", (file_id,))
+    current_ids = [row[0] for row in cursor.fetchall()]
+    added, removed = [], []
     # ADD PASS
-    add_sql = read_sql_file("../static/sql/file_tag/insert.sql")
+    add_sql = get_sql("file_tag/insert")
     for tag in tags:
         if tag not in current_ids:
-            args = (str(file_id), str(tag))
+            args = {'file_id': file_id, 'tag_id': tag}
             cursor.execute(add_sql, args)
+            added.append(tag)
     # DEL PASS
-    del_sql = read_sql_file("../static/sql/file_tag/delete_pair.sql")
+    del_sql = get_sql("file_tag/delete_pair")
     for tag in current_ids:
         if tag not in tags:
             args = {'file_id': file_id, 'tag_id': tag}
             cursor.execute(del_sql, args)
+            removed.append(tag)
+    return added, removed
 
 
 def modify_file(path:str,query: FullModifyFileQuery):
@@ -290,13 +576,16 @@ def modify_file(path:str,query: FullModifyFileQuery):
         if not __file_exists(cursor, query.id):
             raise ApiError(status.HTTP_410_GONE, f"No file found with the given id: '{query.id}'")
         cursor.execute(sql, json)
-        if query.tags is not None:
-            set_file_tags(cursor, query.id, query.tags)
+        added, removed = set_file_tags(cursor, query.id, query.tags) if query.tags is not None else ([], [])
         conn.commit()
+        index = find_tag_index(path)
+        if index is not None:
+            index.add_file_tags(query.id, added)
+            index.remove_file_tags(query.id, removed)
 
 
 def set_file(path:str,query: FullSetFileQuery) -> None:
-    sql = read_sql_file("../static/sql/file/update.sql")
+    sql = get_sql("file/update")
     args = query.dict(exclude={'tags'})
     # HACK while tags is not implimented
     if query.tags is not None:
@@ -312,15 +601,14 @@ def set_file(path:str,query: FullSetFileQuery) -> None:
 
 
 def get_file_tags(path:str,query: FileTagQuery) -> List[Tag]:
+    include = set(query.fields) if query.fields is not None else None
     with _connect(path) as (conn, cursor):
         if not __file_exists(cursor, query.id):
             raise ApiError(status.HTTP_410_GONE, f"No file found with the given id: '{query.id}'")
-        sql = read_sql_file("../static/sql/tag/select_by_file_id.sql")
-        cursor.execute(sql, (str(query.id),))
-        results = [row_to_tag(row) for row in cursor.fetchall()]
-        if query.fields is not None:
-            results = Util.copy(results, include=set(query.fields))
-        return results
+        sql, args = tag_queries.select_builder(include, count=tag_queries.file_count) \
+            .where("tag.id IN (SELECT file_tag.tag_id FROM file_tag WHERE file_tag.file_id = ?)", query.id).build()
+        cursor.execute(sql, args)
+        return [row_to_tag(row, include) for row in cursor.fetchall()]
 
 
 def file_has_tag(path:str,file_id: int, tag_id: int) -> bool:
@@ -335,10 +623,10 @@ class FileDataQuery(BaseModel):
     range: Optional[str] = None
 
 
-def get_file_path(file_id: int) -> Optional[str]:
+def get_file_path(path: str, file_id: int) -> Optional[str]:
     # Dont need to check; it will raise an DBI error if it fails to get the file
     # Parent functions should handle the error as they need
-    file = get_file(FileQuery(id=file_id, fields=["path"]))
+    file = get_file(path, FileQuery(id=file_id, fields=["path"]))
     return file.path
 
 
@@ -349,9 +637,127 @@ def get_file_bytes(query: FileDataQuery):
     # return serve(local_path, range=query.range, headers={"Accept-Ranges": "bytes"})
 
 
-def search_files(query: FileSearchQuery) -> List[File]:
-    sort_sql = SortQuery.list_sql(query.sort) if query.sort else None
+def search_files(path: str, query: FileSearchQuery) -> FilesPage:
+    """
+    The page of files whose tags match query.search, query.query and query.simple (every file if all are None);
+    see DBI.search.
+    """
+    searches = __parse_searches(query)
+    if searches is None:
+        return __empty_page(query)
+    return __get_files_page(path, query, *searches)
+
+
+def __empty_page(query: FilesQuery) -> FilesPage:
+    # Nothing can match; no facets need counting
+    page = FilesPage.construct(files=[], next_cursor=None)
+    if query.facets is not None:
+        page.facets = Facets.construct(files=0, tags=[], mimes=[])
+    return page
+
+
+def __parse_searches(query: FileSearchQuery) \
+        -> Optional[Tuple[Optional[SearchQuery], Optional[simple_search.SimpleSearchQuery]]]:
+    # query.query AND-ed into query.search, and the parsed query.simple; None if the search string matches nothing
+    search = query.search
+    simple = simple_search.parse(query.simple) if query.simple is not None else None
+    if query.query is not None:
+        plan = full_search.plan(query.query)
+        if plan.search is None:
+            return None
+        search = plan.search if search is None else SearchQuery(required=[search, plan.search])
+    return search, simple
+
+
+def count_files(path: str, query: FileSearchQuery = None) -> Count:
+    """
+    The number of files matching the searches of query (every file if None); see DBI.counts.
+    """
+    searches = __parse_searches(query) if query is not None else (None, None)
+    if searches is None:
+        return Count.construct(count=0, exact=True)
+    search, simple = searches
+    total = count_table(path, "file")
+    if search is None and simple is None:
+        return total
+    # A page of the search (in the default order) may have cached every matching id; current, as count_table checked
+    #   out a connection (which notices writes by other processes) first
+    ids = search_cache.get(__search_key(path, keyset_sort(None), search, simple))
+    if ids is not None:
+        return Count.construct(count=len(ids), exact=True)
+
+    def counter(cursor: Cursor) -> Count:
+        # A simple search is the same (required, include, exclude) node as a search
+        combined = search
+        if simple is not None:
+            simple_query = SearchQuery(**simple.dict())
+            combined = simple_query if search is None else SearchQuery(required=[search, simple_query])
+        index = get_tag_index(path)
+        if index is not None:
+            return Count.construct(count=count_search(cursor, combined, index), exact=True)
+        estimate, bound = estimate_search(cursor, combined, total.count)
+        if config.count_exact_limit is not None and bound > config.count_exact_limit:
+            return Count.construct(count=estimate, exact=False)
+        clauses, _ = __search_clauses(cursor, search, simple)
+        if clauses is None:
+            return Count.construct(count=0, exact=True)
+        builder = queries.select(['id'])
+        for clause, clause_args in clauses:
+            builder.where(clause, *clause_args)
+        sql, args = builder.build()
+        cursor.execute(f"SELECT COUNT(*) FROM ({sql})", args)
+        return Count.construct(count=cursor.fetchone()[0], exact=True)
+    return cached_count(path, ("file", __search_key(path, [], search, simple)), counter)
+
+
+# Ranked pages are keyed on the rank (then the id); bm25 depends on the whole index, so a page may shift if files are
+#   written while paging
+text_sort = [SortQuery(field='rank', ascending=True), SortQuery(field='id', ascending=True)]
+
+
+def text_search_files(path: str, query: FileTextQuery) -> FilesPage:
+    """
+    The page of files matching query.text, best match first; filtered by the tag searches of search_files.
+    """
+    match = text.match_query(query.text)
+    searches = __parse_searches(query)
+    if not match or searches is None:
+        return __empty_page(query)
+    rank = text.rank()
+    builder = queries.select(query.fields)
+    where = [f"{queries.text_table} MATCH ?"]
+    args = [match]
+    if query.cursor is not None:
+        last_rank, last_id = decode_cursor(text_sort, query.cursor)
+        where.append(f"({rank} > ? OR ({rank} = ? AND file.id > ?))")
+        args.extend([last_rank, last_rank, last_id])
 
-    if sort_sql:
-        raise NotImplementedError
-    return []
+    with _connect(path) as (conn, cursor):
+        clauses, search_plan = __search_clauses(cursor, *searches)
+        if clauses is None:
+            page = FilesPage.construct(files=[], next_cursor=None, search_plan=search_plan)
+            return __add_facets(path, cursor, query, page, clauses)
+        for clause, clause_args in clauses:
+            where.append(f"({clause})")
+            args.extend(clause_args)
+        # The index finds (and ranks) the matches; only their rows of 'file' are read
+        sql = f"SELECT {', '.join(builder.columns)}, {rank} AS rank FROM {queries.text_table} " \
+              f"JOIN file ON file.id = {queries.text_table}.rowid WHERE {' AND '.join(where)} ORDER BY rank, file.id"
+        if query.limit is not None:
+            # Fetch one extra row to know if there is a next page
+            sql += f" LIMIT {int(query.limit) + 1}"
+        cursor.execute(sql, args)
+        rows = cursor.fetchall()
+        next_cursor = None
+        if query.limit is not None and len(rows) > query.limit:
+            rows = rows[:query.limit]
+            next_cursor = encode_cursor(text_sort, [rows[-1]['rank'], rows[-1]['id']])
+
+        include = set(query.fields) if query.fields is not None else None
+        tags = {}
+        file_tags = __load_tags(cursor, rows, tags, include, query.tag_fields)
+        results = [row_to_file(row, tag_ids=file_tags.get(row['id']), tag_lookup=tags, include=include)
+                   for row in rows]
+        page = FilesPage.construct(files=results, next_cursor=next_cursor, search_plan=search_plan)
+        matched = (f"file.id IN (SELECT rowid FROM {queries.text_table} WHERE {queries.text_table} MATCH ?)", [match])
+        return __add_facets(path, cursor, query, page, clauses + [matched])
@@ -1,7 +1,34 @@
-select = """SELECT file.id, file.path, file.mime, file.name, file.description, GROUP_CONCAT(DISTINCT file_tag.tag_id) as tags, folder_file.folder_id as parent_folder_id FROM file
-LEFT JOIN file_tag on file_tag.file_id = file.id
-LEFT JOIN folder_file on folder_file.file_id = file.id
-GROUP BY file.id"""
+from typing import Optional, Iterable
+
+from FileTagServer.DBI.query_builder import QueryBuilder
+
+# Tags are loaded separately (relations.file_tags); one row per file, nothing to aggregate
+field_columns = {
+    'id': "file.id",
+    'path': "file.path",
+    'mime': "file.mime",
+    'name': "file.name",
+    'description': "file.description",
+    'tag_count': "file.tag_count",
+    'parent_folder_id': "(SELECT folder_file.folder_id FROM folder_file WHERE folder_file.file_id = file.id LIMIT 1)"
+                        " as parent_folder_id",
+}
+columns = list(field_columns.values())
+joins = []
+
+
+def select(fields: Optional[Iterable[str]] = None) -> QueryBuilder:
+    """
+    Selects only the columns of the given fields (every column if None); the id is always selected.
+
+    Fields without a column (e.g. 'tags') are ignored; they are loaded separately, if at all.
+    """
+    if fields is None:
+        return QueryBuilder("file", columns, joins)
+    fields = set(fields)
+    fields.add('id')
+    return QueryBuilder("file", [column for field, column in field_columns.items() if field in fields], joins)
+
 
 create = """CREATE TABLE IF NOT EXISTS file(
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -12,7 +39,70 @@ create = """CREATE TABLE IF NOT EXISTS file(
     CONSTRAINT path_unique UNIQUE (path)
 )"""
 
-select_by_ids = f"""SELECT * FROM ({select}) WHERE id in ({{file_ids}})"""
-select_by_id = f"""SELECT * FROM ({select}) WHERE id = ?"""
+# Sorts a page can be read in; each is the columns of an index (sqlite ends every index with the rowid, the id)
+#   A sort is a prefix of one of them, in one direction, so the first page of a sorted listing is the start of an
+#   index walk (see pagination.keyset_sort), never a sort of every file
+sort_indexes = {
+    'file': [],
+    'path_unique': ['path'],
+    'file_name': ['name'],
+    'file_mime': ['mime'],
+    'file_mime_name': ['mime', 'name'],
+    'file_tag_count': ['tag_count'],
+}
+
+# The number of tags on each file; maintained by triggers on file_tag (see migrations)
+add_tag_count = "ALTER TABLE file ADD COLUMN tag_count INTEGER NOT NULL DEFAULT 0"
+create_tag_count_triggers = [
+    """CREATE TRIGGER IF NOT EXISTS file_tag_count_insert AFTER INSERT ON file_tag BEGIN
+    UPDATE file SET tag_count = tag_count + 1 WHERE id = NEW.file_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS file_tag_count_delete AFTER DELETE ON file_tag BEGIN
+    UPDATE file SET tag_count = tag_count - 1 WHERE id = OLD.file_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS file_tag_count_update AFTER UPDATE OF file_id ON file_tag
+    WHEN OLD.file_id != NEW.file_id BEGIN
+    UPDATE file SET tag_count = tag_count - 1 WHERE id = OLD.file_id;
+    UPDATE file SET tag_count = tag_count + 1 WHERE id = NEW.file_id;
+END""",
+]
+# Recounts every file from file_tag
+rebuild_tag_counts = "UPDATE file SET tag_count = (SELECT COUNT(*) FROM file_tag WHERE file_tag.file_id = file.id)"
+
+# The file on disk as of the last scan (see scan.walker); NULL until scanned
+#   mtime is in nanoseconds (st_mtime_ns); a rescan does not re-write a file whose fingerprint is unchanged
+add_fingerprint = {
+    'size': "ALTER TABLE file ADD COLUMN size INTEGER",
+    'mtime': "ALTER TABLE file ADD COLUMN mtime INTEGER",
+    'inode': "ALTER TABLE file ADD COLUMN inode INTEGER",
+}
+# Of the content (see scan.hashing); NULL until hashed. A known hash at a new path is the same file, moved
+add_hash = "ALTER TABLE file ADD COLUMN hash TEXT"
 
-select_orphaned_files = f"""SELECT * FROM ({select}) WHERE id not in (select DISTINCT folder_file.file_id from folder_file)"""
\ No newline at end of file
+orphaned = "NOT EXISTS (SELECT 1 FROM folder_file WHERE folder_file.file_id = file.id)"
+
+# Full text index of each file's name, description & path (see DBI.file.text)
+#   External content; the text is only stored in 'file', the index holds the terms
+#   unicode61 splits on punctuation, so every folder (and part of the file name) in a path is a term
+text_table = "file_text"
+create_text = f"""CREATE VIRTUAL TABLE IF NOT EXISTS {text_table} USING fts5(
+    name, description, path,
+    content='file', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+)"""
+# An external content index is told the old values to remove; they must match what was indexed
+create_text_triggers = [
+    f"""CREATE TRIGGER IF NOT EXISTS {text_table}_insert AFTER INSERT ON file BEGIN
+    INSERT INTO {text_table} (rowid, name, description, path) VALUES (NEW.id, NEW.name, NEW.description, NEW.path);
+END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {text_table}_delete AFTER DELETE ON file BEGIN
+    INSERT INTO {text_table} ({text_table}, rowid, name, description, path)
+    VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.path);
+END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {text_table}_update AFTER UPDATE OF id, name, description, path ON file BEGIN
+    INSERT INTO {text_table} ({text_table}, rowid, name, description, path)
+    VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.path);
+    INSERT INTO {text_table} (rowid, name, description, path) VALUES (NEW.id, NEW.name, NEW.description, NEW.path);
+END""",
+]
+# Reindexes every file from 'file'; backfills an existing database (or repairs the index)
+rebuild_text = f"INSERT INTO {text_table} ({text_table}) VALUES ('rebuild')"
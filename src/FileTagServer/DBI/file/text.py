@@ -0,0 +1,74 @@
+import sys
+from sqlite3 import DatabaseError
+from typing import List
+
+from FileTagServer import config
+from FileTagServer.DBI.common import _connect
+from FileTagServer.DBI.file import queries
+
+# FULL TEXT SEARCH
+# Searches the names, descriptions & paths of files (queries.text_table, maintained by triggers)
+#   Every word of the text has to match (in any of the columns); a word ending in '*' matches as a prefix
+#   Words are quoted, so FTS5's own syntax (columns, NEAR, operators) is never parsed from user input
+
+TEXT_PREFIX = '*'
+TEXT_QUOTE = '"'
+
+
+def match_query(text: str) -> str:
+    """
+    The FTS5 query of a search text; an empty string if the text has no words.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith(TEXT_PREFIX)
+        word = word.rstrip(TEXT_PREFIX)
+        if not word:
+            continue
+        term = TEXT_QUOTE + word.replace(TEXT_QUOTE, TEXT_QUOTE * 2) + TEXT_QUOTE
+        terms.append(term + TEXT_PREFIX if prefix else term)
+    return " ".join(terms)
+
+
+def rank() -> str:
+    # bm25 of the match, weighted per column (config.file_text_weights); lower is better
+    weights = ", ".join(str(float(config.file_text_weights[column])) for column in ['name', 'description', 'path'])
+    return f"bm25({queries.text_table}, {weights})"
+
+
+def rebuild_file_text(path: str = None) -> int:
+    """
+    Reindexes every file; backfills the index of an existing database or repairs one written around the triggers.
+
+    Returns the number of files indexed.
+    """
+    with _connect(path) as (conn, cursor):
+        cursor.execute(queries.rebuild_text)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM file")
+        return cursor.fetchone()[0]
+
+
+def check_file_text(path: str = None) -> List[str]:
+    """
+    Compares the index against the files; an empty list means the index is correct.
+    """
+    with _connect(path) as (conn, cursor):
+        try:
+            # A rank of 1 also checks the index against the content table
+            cursor.execute(f"INSERT INTO {queries.text_table} ({queries.text_table}, rank) VALUES ('integrity-check', 1)")
+        except DatabaseError as e:
+            return [str(e)]
+        return []
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.DBI.file.text ../local.db [--rebuild]'
+    args = [arg for arg in sys.argv[1:] if arg != "--rebuild"]
+    db_path = args[0] if len(args) > 0 else None
+    errors = check_file_text(db_path)
+    for error in errors:
+        print(error)
+    print(f"Found {len(errors)} error(s) in the file text index")
+    if "--rebuild" in sys.argv[1:]:
+        print(f"Reindexed {rebuild_file_text(db_path)} file(s)")
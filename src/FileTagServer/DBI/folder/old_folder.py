@@ -1,32 +1,34 @@
 from sqlite3 import Cursor
-from typing import List, Optional, Union, Tuple
+from typing import List, Optional, Tuple
 from pydantic import BaseModel, validator, Field
 from starlette import status
 
-from FileTagServer.DBI.common import _connect, SortQuery, Util, validate_fields, row_to_tag, row_to_folder, \
-    read_sql_file
+from FileTagServer.DBI.common import _connect, SortQuery, Util, validate_fields, row_to_tag, row_to_folder
+from FileTagServer.DBI.counts import Count, count_table
 from FileTagServer.DBI.error import ApiError
+from FileTagServer.DBI.search import SearchQuery
+from FileTagServer.DBI.statements import get_sql
 from FileTagServer.DBI.file.old_file import FileQuery, get_file
 from FileTagServer.DBI.old_models import Folder, File, Tag
 
 
-def __run_exists(cursor: Cursor, path: str, args: Tuple) -> bool:
-    sql = read_sql_file(path)
+def __run_exists(cursor: Cursor, name: str, args: Tuple) -> bool:
+    sql = get_sql(name)
     cursor.execute(sql, args)
     row = cursor.fetchone()
     return row[0] == 1
 
 
 def __folder_exists(cursor: Cursor, id: int) -> bool:
-    path = "../static/sql/folder/exists.sql"
+    name = "folder/exists"
     args = (str(id),)
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
 
 
 def __folder_tag_exists(cursor: Cursor, id: int, tag_id: int) -> bool:
-    path = "../static/sql/fold_tag/exists.sql"
+    name = "folder_tag/exists"
     args = (str(id), str(tag_id))
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
 
 
 class FoldersQuery(BaseModel):
@@ -130,15 +132,6 @@ class CreateFolderQuery(BaseModel):
         return Folder(id=id, path=self.path, name=self.name, description=self.description, tags=tags)
 
 
-class SearchQuery(BaseModel):
-    # AND
-    required: Optional[List[Union['SearchQuery', str]]] = None
-    # OR
-    include: Optional[List[Union['SearchQuery', str]]] = None
-    # NOT
-    exclude: Optional[List[Union['SearchQuery', str]]] = None
-
-
 class FolderSearchQuery(BaseModel):
     fields: Optional[List[str]] = None
     tag_fields: Optional[List[str]] = None
@@ -158,7 +151,7 @@ class FolderSearchQuery(BaseModel):
 #
 # def get_folders(query: FoldersQuery) -> List[Folder]:
 #     with __connect() as (conn, cursor):
-#         get_folders_sql = read_sql_file("../static/sql/folder/select.sql", True)
+#         get_folders_sql = get_sql("folder/select", True)
 #         # SORT
 #         if query.sort is not None:
 #             sort_query = "ORDER BY " + SortQuery.list_sql(query.sort)
@@ -177,7 +170,7 @@ class FolderSearchQuery(BaseModel):
 #
 # def get_folders_tags(query: FoldersQuery) -> List[Tag]:
 #     with __connect() as (conn, cursor):
-#         get_folders_sql = read_sql_file("../static/sql/folder/select.sql", True)
+#         get_folders_sql = get_sql("folder/select", True)
 #         # SORT
 #         if query.sort is not None:
 #             sort_query = "ORDER BY " + SortQuery.list_sql(query.sort)
@@ -185,7 +178,7 @@ class FolderSearchQuery(BaseModel):
 #             sort_query = ''
 #
 #         sql = f"SELECT id from ({get_folders_sql} {sort_query})"
-#         sql = read_sql_file("../static/sql/tag/select_by_folder_query.sql").replace("<folder_query>", sql)
+#         sql = get_sql("tag/select_by_folder_query").replace("<folder_query>", sql)
 #         cursor.execute(sql)
 #         rows = cursor.fetchall()
 #
@@ -201,7 +194,7 @@ class FolderSearchQuery(BaseModel):
 
 def __get_folder(path:str, id: int) -> Folder:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder/select_by_id.sql")
+        sql = get_sql("folder/select_by_id")
         cursor.execute(sql, (str(id),))
         rows = cursor.fetchall()
         if len(rows) < 1:
@@ -213,7 +206,7 @@ def __get_folder(path:str, id: int) -> Folder:
 
 def __get_subfolders(path:str, id: int) -> List[Folder]:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder_folder/get_subfolders.sql")
+        sql = get_sql("folder_folder/get_subfolders")
         cursor.execute(sql, (str(id),))
         rows = cursor.fetchall()
         if len(rows) < 1:
@@ -229,7 +222,7 @@ def __get_file(path:str, id: int) -> File:
 
 def __get_subfiles(path:str, id: int) -> List[File]:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder_file/get_subfiles.sql")
+        sql = get_sql("folder_file/get_subfiles")
         cursor.execute(sql, (str(id),))
         rows = cursor.fetchall()
         if len(rows) < 1:
@@ -255,9 +248,13 @@ def get_folder(path:str, query: FolderQuery) -> Folder:
     return folder
 
 
+def count_folders(path: str) -> Count:
+    return count_table(path, "folder")
+
+
 def get_root_folders(path:str) -> List[Folder]:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder_folder/get_root_folders.sql")
+        sql = get_sql("folder_folder/get_root_folders")
         cursor.execute(sql)  # , (str(query.id),))
         rows = cursor.fetchall()
         if len(rows) < 1:
@@ -268,7 +265,7 @@ def get_root_folders(path:str) -> List[Folder]:
 
 def get_folder_by_path(path:str,query: FolderPathQuery) -> Folder:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder/select_by_path.sql")
+        sql = get_sql("folder/select_by_path")
         cursor.execute(sql, (str(query.path),))
         rows = cursor.fetchall()
         if len(rows) < 1:
@@ -286,7 +283,7 @@ def get_folder_by_path(path:str,query: FolderPathQuery) -> Folder:
 
 def create_folder(path:str,query: CreateFolderQuery) -> Folder:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder/insert.sql")
+        sql = get_sql("folder/insert")
         sql_args = query.dict(include={'path', 'description', 'name'})
         cursor.execute(sql, sql_args)
         id = cursor.lastrowid
@@ -309,7 +306,7 @@ def delete_folder(path:str,query: DeleteFolderQuery):
     with _connect(path) as (conn, cursor):
         if not __folder_exists(cursor, query.id):
             raise ApiError(status.HTTP_410_GONE, f"No folder found with the given id: '{query.id}'")
-        sql = read_sql_file("../static/sql/folder/delete_by_id.sql")
+        sql = get_sql("folder/delete_by_id")
         cursor.execute(sql, str(query.id))
         conn.commit()
 
@@ -320,13 +317,13 @@ def set_folder_tags(cursor: Cursor, folder_id: int, tags: List[int]):
     current_tags = get_folder_tags(q)
     current_ids = [tag.id for tag in current_tags]
     # ADD PASS
-    add_sql = read_sql_file("../static/sql/folder_tag/insert.sql")
+    add_sql = get_sql("folder_tag/insert")
     for tag in tags:
         if tag not in current_ids:
             args = (str(folder_id), str(tag))
             cursor.execute(add_sql, args)
     # DEL PASS
-    del_sql = read_sql_file("../static/sql/folder_tag/delete_pair.sql")
+    del_sql = get_sql("folder_tag/delete_pair")
     for tag in current_ids:
         if tag not in tags:
             args = {'folder_id': folder_id, 'tag_id': tag}
@@ -349,7 +346,7 @@ def modify_folder(path:str,query: FullModifyFolderQuery):
 
 
 def set_folder(path:str,query: FullSetFolderQuery) -> None:
-    sql = read_sql_file("../static/sql/folder/update.sql")
+    sql = get_sql("folder/update")
     args = query.dict(exclude={'tags'})
     # HACK while tags is not implimented
     if query.tags is not None:
@@ -368,7 +365,7 @@ def get_folder_tags(path:str,query: FolderTagQuery) -> List[Tag]:
     with _connect(path) as (conn, cursor):
         if not __folder_exists(cursor, query.id):
             raise ApiError(status.HTTP_410_GONE, f"No folder found with the given id: '{query.id}'")
-        sql = read_sql_file("../static/sql/tag/select_by_folder_id.sql")
+        sql = get_sql("tag/select_by_folder_id")
         cursor.execute(sql, (str(query.id),))
         results = [row_to_tag(row) for row in cursor.fetchall()]
         if query.fields is not None:
@@ -1,13 +1,15 @@
-select = """SELECT folder.id, folder.path, folder.name, folder.description, GROUP_CONCAT(DISTINCT folder_tag.tag_id) as tags, GROUP_CONCAT(DISTINCT folder_folder.child_id) as subfolders, GROUP_CONCAT(DISTINCT folder_file.file_id) as files FROM folder
-LEFT JOIN folder_tag on folder_tag.folder_id = folder.id
-LEFT JOIN folder_folder on folder_folder.parent_id = folder.id
-LEFT JOIN folder_file on folder_file.folder_id = folder.id
-GROUP BY folder.id"""
+from FileTagServer.DBI.query_builder import QueryBuilder
 
-select_by_ids = f"""SELECT * FROM ({select}) WHERE id in ({{tag_ids}})"""
-select_by_id = f"""SELECT * FROM ({select}) WHERE id =? """
+# Tags, subfolders and files are loaded separately (relations.folder_*); one row per folder, nothing to aggregate
+columns = ["folder.id", "folder.path", "folder.name", "folder.description"]
+joins = []
 
-select_root_folders = f"""SELECT * FROM ({select}) WHERE id not in (select DISTINCT child_id from folder_folder)"""
 
+def select() -> QueryBuilder:
+    return QueryBuilder("folder", columns, joins)
 
-select_by_path = f"""SELECT * FROM ({select}) WHERE path = ?"""
+
+# The directory's mtime (st_mtime_ns) when its entries were last written by a scan; NULL until then (see scan.walker)
+add_mtime = "ALTER TABLE folder ADD COLUMN mtime INTEGER"
+
+root = "NOT EXISTS (SELECT 1 FROM folder_folder WHERE folder_folder.child_id = folder.id)"
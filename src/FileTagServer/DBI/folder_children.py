@@ -3,41 +3,41 @@ from typing import List, Dict, Optional, Union, Tuple
 from pydantic import BaseModel, validator, Field
 from starlette import status
 
-from FileTagServer.DBI.common import _connect, SortQuery, Util, validate_fields, row_to_tag, row_to_folder, \
-    read_sql_file
+from FileTagServer.DBI.common import _connect, SortQuery, Util, validate_fields, row_to_tag, row_to_folder
 from FileTagServer.DBI.error import ApiError
+from FileTagServer.DBI.statements import get_sql
 from FileTagServer.DBI.old_models import Folder, File, Tag
 
 
-def __run_exists(cursor: Cursor, path: str, args: Tuple) -> bool:
-    sql = read_sql_file(path)
+def __run_exists(cursor: Cursor, name: str, args: Tuple) -> bool:
+    sql = get_sql(name)
     cursor.execute(sql, args)
     row = cursor.fetchone()
     return row[0] == 1
 
 
 def __folder_exists(cursor: Cursor, id: int) -> bool:
-    path = "../static/sql/folder/exists.sql"
+    name = "folder/exists"
     args = (str(id),)
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
 
 
 def __file_exists(cursor: Cursor, id: int) -> bool:
-    path = "../static/sql/file/exists.sql"
+    name = "file/exists"
     args = (str(id),)
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
 
 
 def __subfolder_exists(cursor: Cursor, id: int, child_id: int) -> bool:
-    path = "../static/sql/folder_folder/exists.sql"
+    name = "folder_folder/exists"
     args = (str(id), str(child_id))
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
 
 
 def __subfile_exists(cursor: Cursor, id: int, file_id: int) -> bool:
-    path = "../static/sql/folder_file/exists.sql"
+    name = "folder_file/exists"
     args = (str(id), str(file_id))
-    return __run_exists(cursor, path, args)
+    return __run_exists(cursor, name, args)
 
 
 class AddSubFolderQuery(BaseModel):
@@ -52,7 +52,7 @@ class AddSubFileQuery(BaseModel):
 
 def add_folder_to_folder(query: AddSubFolderQuery):
     with _connect() as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder_folder/insert.sql")
+        sql = get_sql("folder_folder/insert")
         args = str(query.parent_id), str(query.child_id)
         cursor.execute(sql, args)
         conn.commit()
@@ -60,7 +60,7 @@ def add_folder_to_folder(query: AddSubFolderQuery):
 
 def add_file_to_folder(query: AddSubFileQuery):
     with _connect() as (conn, cursor):
-        sql = read_sql_file("../static/sql/folder_file/insert.sql")
+        sql = get_sql("folder_file/insert")
         args = str(query.folder_id), str(query.file_id)
         cursor.execute(sql, args)
         conn.commit()
@@ -1,13 +1,20 @@
-from typing import Tuple, Optional, List
+import sys
+from functools import lru_cache
+from typing import Tuple, Optional, List, Union
+
+from pydantic import BaseModel
+from starlette import status
+
+from FileTagServer import config
+from FileTagServer.DBI.error import ApiError
+from FileTagServer.DBI.search import SearchQuery
 
 # FULL BOOLEAN SEARCH
 # Allows grouping and literals
-#
+#   e.g. 'cat AND (dog OR "big bird") NOT sad\ face'; NOT binds tightest, then AND (implied), then OR
 
 # Originally my plan was to support two types of string queries
 # A full boolean search language and a simple search language
-# BUT I think the REST api should rely on POST instead
-# This avoids the issue of parsing a string into a search query
 
 SEARCH_NOT = 'NOT'
 SEARCH_AND = 'AND'
@@ -19,37 +26,256 @@ SEARCH_LITERAL = '"'
 
 SEARCH_ESCAPE = "\\"
 
+# AST nodes are (hashable) tuples; (SEARCH_TAG, name), (SEARCH_NOT, node), (SEARCH_AND/SEARCH_OR, (node, ...))
+SEARCH_TAG = 'TAG'
+TRUE = ('TRUE',)
+FALSE = ('FALSE',)
+Node = Tuple
 
-def _parse_group(query:str) -> List[str]:
-    stack = []
-    escaping = False
-    for i, c in enumerate(query):
-        if c == SEARCH_ESCAPE:
-            escaping = True
-            continue
-        if escaping:
-            escaping = False
-            continue
-        if c == SEARCH_GROUP_START:
-            stack.append(i)
+# Token kinds; the operators and groups use their own text
+_TERM = 'TERM'
+_OPERATORS = {SEARCH_NOT, SEARCH_AND, SEARCH_OR}
+
+
+def _error(message: str, position: int) -> ApiError:
+    return ApiError(status.HTTP_400_BAD_REQUEST, f"Invalid search: {message} at position {position}")
+
+
+def _tokenize(query: str) -> List[Tuple[str, str, int]]:
+    # (kind, text, position)
+    tokens = []
+    i = 0
+    while i < len(query):
+        c = query[i]
+        if c.isspace():
+            i += 1
+        elif c in (SEARCH_GROUP_START, SEARCH_GROUP_END):
+            tokens.append((c, c, i))
+            i += 1
+        elif c == SEARCH_LITERAL:
+            start = i
+            i += 1
+            text = []
+            while True:
+                if i >= len(query):
+                    raise _error("unterminated literal", start)
+                c = query[i]
+                if c == SEARCH_ESCAPE and i + 1 < len(query):
+                    text.append(query[i + 1])
+                    i += 2
+                elif c == SEARCH_LITERAL:
+                    i += 1
+                    break
+                else:
+                    text.append(c)
+                    i += 1
+            tokens.append((_TERM, "".join(text), start))
+        else:
+            start = i
+            text = []
+            escaped = False
+            while i < len(query):
+                c = query[i]
+                if c == SEARCH_ESCAPE and i + 1 < len(query):
+                    text.append(query[i + 1])
+                    escaped = True
+                    i += 2
+                elif c.isspace() or c in (SEARCH_GROUP_START, SEARCH_GROUP_END, SEARCH_LITERAL):
+                    break
+                else:
+                    text.append(c)
+                    i += 1
+            word = "".join(text)
+            # An escaped operator is a tag
+            kind = word if word in _OPERATORS and not escaped else _TERM
+            tokens.append((kind, word, start))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, query: str):
+        self.query = query
+        self.tokens = _tokenize(query)
+        self.index = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.index][0] if self.index < len(self.tokens) else None
+
+    def position(self) -> int:
+        return self.tokens[self.index][2] if self.index < len(self.tokens) else len(self.query)
+
+    def take(self) -> Tuple[str, str, int]:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def parse(self) -> Node:
+        if self.peek() is None:
+            return TRUE
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise _error(f"unexpected '{self.tokens[self.index][1]}'", self.position())
+        return node
+
+    def parse_or(self) -> Node:
+        nodes = [self.parse_and()]
+        while self.peek() == SEARCH_OR:
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else (SEARCH_OR, tuple(nodes))
+
+    def parse_and(self) -> Node:
+        nodes = [self.parse_not()]
+        while self.peek() in (SEARCH_AND, SEARCH_NOT, SEARCH_GROUP_START, _TERM):
+            # AND is implied between terms
+            if self.peek() == SEARCH_AND:
+                self.take()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else (SEARCH_AND, tuple(nodes))
+
+    def parse_not(self) -> Node:
+        if self.peek() == SEARCH_NOT:
+            self.take()
+            return SEARCH_NOT, self.parse_not()
+        return self.parse_term()
+
+    def parse_term(self) -> Node:
+        kind = self.peek()
+        if kind == _TERM:
+            return SEARCH_TAG, self.take()[1]
+        if kind == SEARCH_GROUP_START:
+            start = self.take()[2]
+            if self.peek() == SEARCH_GROUP_END:
+                # An empty group matches everything
+                self.take()
+                return TRUE
+            node = self.parse_or()
+            if self.peek() != SEARCH_GROUP_END:
+                raise _error("unclosed group", start)
+            self.take()
+            return node
+        if kind is None:
+            raise _error("expected a tag", self.position())
+        raise _error(f"expected a tag, found '{self.tokens[self.index][1]}'", self.position())
+
+
+def parse(query: str) -> Node:
+    # Raises an ApiError (400) if invalid
+    return _Parser(query).parse()
+
+
+def normalize(node: Node) -> Node:
+    # Flattens, deduplicates, folds constants (e.g. 'x AND NOT x') and sorts; equivalent searches normalize the same
+    op = node[0]
+    if op == SEARCH_NOT:
+        child = normalize(node[1])
+        if child == TRUE:
+            return FALSE
+        if child == FALSE:
+            return TRUE
+        if child[0] == SEARCH_NOT:
+            return child[1]
+        return SEARCH_NOT, child
+    if op not in (SEARCH_AND, SEARCH_OR):
+        return node
+    # The identity (dropped) and the absorbing constant of the operator
+    identity, absorbing = (TRUE, FALSE) if op == SEARCH_AND else (FALSE, TRUE)
+    children = set()
+    for child in (normalize(child) for child in node[1]):
+        if child == absorbing:
+            return absorbing
+        if child == identity:
             continue
-        if c == SEARCH_GROUP_END:
-            start = stack.pop()
-            yield query[start:i+1]
-    if len(stack) > 0:
-        raise ValueError
+        if child[0] == op:
+            children.update(child[1])
+        else:
+            children.add(child)
+    for child in children:
+        if (SEARCH_NOT, child) in children:
+            return absorbing
+    if not children:
+        return identity
+    if len(children) == 1:
+        return children.pop()
+    return op, tuple(sorted(children, key=to_string))
 
 
-def parse(query: str) -> None:
-    pass
+def _quote(name: str) -> str:
+    return SEARCH_LITERAL + name.replace(SEARCH_ESCAPE, SEARCH_ESCAPE * 2) \
+        .replace(SEARCH_LITERAL, SEARCH_ESCAPE + SEARCH_LITERAL) + SEARCH_LITERAL
+
+
+def to_string(node: Node) -> str:
+    op = node[0]
+    if op == SEARCH_TAG:
+        return _quote(node[1])
+    if node == TRUE:
+        return SEARCH_GROUP_START + SEARCH_GROUP_END
+    if node == FALSE:
+        return f"{SEARCH_NOT} {SEARCH_GROUP_START}{SEARCH_GROUP_END}"
+
+    def group(child: Node) -> str:
+        text = to_string(child)
+        return f"{SEARCH_GROUP_START}{text}{SEARCH_GROUP_END}" if child[0] in (SEARCH_AND, SEARCH_OR) else text
+
+    if op == SEARCH_NOT:
+        return f"{SEARCH_NOT} {group(node[1])}"
+    return f" {op} ".join(group(child) for child in node[1])
+
+
+def _term(node: Node) -> Union[SearchQuery, str]:
+    return node[1] if node[0] == SEARCH_TAG else to_search_query(node)
 
-if __name__ == "__main__":
-    for g in _parse_group("()"):
-        print(g)
 
-    for g in _parse_group("(()"):
-        print(g)
+def to_search_query(node: Node) -> SearchQuery:
+    # Of a normalized node other than FALSE
+    op = node[0]
+    if node == TRUE:
+        return SearchQuery()
+    if op == SEARCH_TAG:
+        return SearchQuery(required=[node[1]])
+    if op == SEARCH_NOT:
+        return SearchQuery(exclude=[_term(node[1])])
+    if op == SEARCH_AND:
+        required = [_term(child) for child in node[1] if child[0] != SEARCH_NOT]
+        exclude = [_term(child[1]) for child in node[1] if child[0] == SEARCH_NOT]
+        return SearchQuery(required=required or None, exclude=exclude or None)
+    return SearchQuery(include=[_term(child) for child in node[1]])
 
 
+class SearchPlan(BaseModel):
+    normalized: str
+    # None if nothing can match
+    search: Optional[SearchQuery] = None
 
 
+@lru_cache(maxsize=config.search_plan_cache_size)
+def __plan(normalized: str) -> SearchPlan:
+    node = normalize(parse(normalized))
+    return SearchPlan(normalized=normalized, search=None if node == FALSE else to_search_query(node))
+
+
+@lru_cache(maxsize=config.search_plan_cache_size)
+def __normalized(query: str) -> str:
+    return to_string(normalize(parse(query)))
+
+
+def plan(query: str) -> SearchPlan:
+    # Cached; raises an ApiError (400) if invalid
+    return __plan(__normalized(query))
+
+
+def plan_cache_info():
+    # (hits, misses, maxsize, currsize) of the normalized and plan caches
+    return __normalized.cache_info(), __plan.cache_info()
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.DBI.full_search "cat AND (dog OR bird)"'
+    for arg in sys.argv[1:]:
+        try:
+            result = plan(arg)
+            print(f"{arg} => {result.normalized}")
+            print(f"\t{result.search.json(exclude_none=True) if result.search is not None else 'matches nothing'}")
+        except ApiError as e:
+            print(f"{arg} => {e.message}")
@@ -0,0 +1,233 @@
+import json
+import os
+import time
+from sqlite3 import Cursor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from FileTagServer import config
+from FileTagServer.DBI.common import _connect
+from FileTagServer.DBI.tag.index import find_tag_index
+
+# BULK INGEST
+# Adds scanned folders & files a batch at a time (one transaction each); a folder before anything in it
+#   Unchanged files (size, mtime & inode) are not written; a new file with the content of a missing one is that file
+#   moved, and keeps its row (and tags)
+
+insert_folder = "INSERT INTO folder (path, name) VALUES (?, ?) ON CONFLICT DO NOTHING"
+insert_file = "INSERT INTO file (path, mime, name, size, mtime, inode, hash) VALUES (?, ?, ?, ?, ?, ?, ?) " \
+              "ON CONFLICT DO NOTHING"
+# A changed file's hash is replaced (with NULL if not hashed); the stored one is of the old content
+update_fingerprint = "UPDATE file SET size = ?, mtime = ?, inode = ?, hash = ? WHERE id = ?"
+move_file = "UPDATE file SET path = ?, mime = ?, name = ?, size = ?, mtime = ?, inode = ?, hash = ? WHERE id = ?"
+unlink_file = "DELETE FROM folder_file WHERE file_id = ?"
+update_folder_mtime = "UPDATE folder SET mtime = ? WHERE path = ?"
+insert_subfolder = "INSERT INTO folder_folder (parent_id, child_id) VALUES (?, ?) ON CONFLICT DO NOTHING"
+insert_subfile = "INSERT INTO folder_file (folder_id, file_id) VALUES (?, ?) ON CONFLICT DO NOTHING"
+
+# (size, mtime, inode); see scan.walker.WalkEntry
+Fingerprint = Tuple[Optional[int], Optional[int], Optional[int]]
+# Paths -> their content hash (None if unreadable)
+HashFunction = Callable[[List[str]], Dict[str, Optional[str]]]
+
+
+class IngestStats(BaseModel):
+    folders: int = 0
+    files: int = 0
+    # Rows actually inserted; existing paths are skipped
+    new_folders: int = 0
+    new_files: int = 0
+    # Existing files with a new fingerprint (or hashed for the first time)
+    changed_files: int = 0
+    # Known files found at a new path
+    moved_files: int = 0
+    hashed_files: int = 0
+    # Listings skipped as unchanged; their entries are counted in folders & files
+    unchanged_folders: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.files} file(s) ({self.new_files} new, {self.changed_files} changed, {self.moved_files} moved, " \
+               f"{self.hashed_files} hashed) & " \
+               f"{self.folders} folder(s) ({self.new_folders} new, {self.unchanged_folders} unchanged) " \
+               f"in {self.batches} batch(es), {self.seconds:.2f}s; {self.files_per_second():.0f} files/s"
+
+
+def _resolve(cursor: Cursor, table: str, paths: Iterable[str], columns: str = None) -> Dict[str, Any]:
+    # The ids (or a row of the columns) of the paths (that exist) in one query
+    columns = columns or f"{table}.id"
+    cursor.execute(f"SELECT {table}.path, {columns} FROM {table} "
+                   f"WHERE {table}.path IN (SELECT value FROM json_each(?))", [json.dumps(list(paths))])
+    return {row[0]: row[1] if len(row) == 2 else tuple(row[1:]) for row in cursor.fetchall()}
+
+
+def folder_mtimes(path: str = None) -> Dict[str, int]:
+    # As of each folder's last scan; see scan.walker
+    with _connect(path) as (conn, cursor):
+        cursor.execute("SELECT folder.path, folder.mtime FROM folder WHERE folder.mtime IS NOT NULL")
+        return {folder: mtime for folder, mtime in cursor.fetchall()}
+
+
+class BulkIngest:
+    """
+    Buffers folders & files and writes them 'batch_size' entries at a time; the last batch on exit.
+    """
+
+    def __init__(self, path: str = None, batch_size: int = None, hash_files: HashFunction = None):
+        self.path = path
+        self.batch_size = batch_size or config.ingest_batch_size
+        # Without one no file is hashed, and moves are not detected
+        self.hash_files = hash_files
+        # (path, name, parent path)
+        self.folders: List[Tuple[str, str, Optional[str]]] = []
+        # (path, name, mime, folder path, (size, mtime, inode))
+        self.files: List[Tuple[str, str, Optional[str], Optional[str], Fingerprint]] = []
+        # (mtime, folder path) of every listed folder
+        self.listed: List[Tuple[Optional[int], str]] = []
+        # Folder path -> id, of every folder written so far (or looked up as a parent)
+        self.folder_ids: Dict[str, int] = {}
+        self.stats = IngestStats()
+        self.started = time.perf_counter()
+
+    def __enter__(self) -> 'BulkIngest':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # A failed scan keeps the batches already written; they are consistent on their own
+        if exc_type is None:
+            self.flush()
+
+    def add_folder(self, path: str, name: str, parent: Optional[str] = None):
+        self.folders.append((path, name, parent))
+        self.__check()
+
+    def add_file(self, path: str, name: str, mime: Optional[str], folder: Optional[str] = None,
+                 size: int = None, mtime: int = None, inode: int = None):
+        self.files.append((path, name, mime, folder, (size, mtime, inode)))
+        self.__check()
+
+    def add_listed(self, folder: str, mtime: Optional[int]):
+        # After its entries; mtime is None if it has to be listed again
+        self.listed.append((mtime, folder))
+        self.__check()
+
+    def add_unchanged(self, folders: int, files: int):
+        self.stats.folders += folders
+        self.stats.files += files
+        self.stats.unchanged_folders += 1
+
+    def __check(self):
+        if len(self.folders) + len(self.files) + len(self.listed) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        folders, files, listed = self.folders, self.files, self.listed
+        self.folders, self.files, self.listed = [], [], []
+        if folders or files or listed:
+            existing, hashes = self.__hash(files)
+            with _connect(self.path) as (conn, cursor):
+                file_ids = self.__write(cursor, folders, files, existing, hashes)
+                cursor.executemany(update_folder_mtime, listed)
+                conn.commit()
+            # New files match every 'NOT' search; the tag index has to know them
+            index = find_tag_index(self.path)
+            if index is not None:
+                for id in file_ids:
+                    index.add_file(id)
+            self.stats.folders += len(folders)
+            self.stats.files += len(files)
+            self.stats.batches += 1
+        self.stats.seconds = time.perf_counter() - self.started
+
+    def __folder_ids(self, cursor: Cursor, paths: Iterable[str]):
+        missing = {path for path in paths if path is not None and path not in self.folder_ids}
+        if missing:
+            self.folder_ids.update(_resolve(cursor, "folder", missing))
+
+    def __hash(self, files) -> Tuple[Dict[str, tuple], Dict[str, Optional[str]]]:
+        # The stored rows of the files, and the hashes of those new or changed
+        if not files:
+            return {}, {}
+        with _connect(self.path) as (conn, cursor):
+            existing = _resolve(cursor, "file", [file[0] for file in files],
+                                "file.id, file.size, file.mtime, file.inode, file.hash")
+        if self.hash_files is None:
+            return existing, {}
+        stale = [path for path, _, _, _, fingerprint in files
+                 if path not in existing or existing[path][1:4] != fingerprint or existing[path][4] is None]
+        self.stats.hashed_files += len(stale)
+        return existing, self.hash_files(stale) if stale else {}
+
+    def __moves(self, cursor: Cursor, new, hashes: Dict[str, Optional[str]]) -> List[Tuple[tuple, int]]:
+        # The new files that are known files moved, with their ids; empty files are never matched
+        by_hash: Dict[str, list] = {}
+        for file in new:
+            if hashes.get(file[0]) is not None and file[4][0]:
+                by_hash.setdefault(hashes[file[0]], []).append(file)
+        if not by_hash:
+            return []
+        cursor.execute("SELECT file.id, file.path, file.inode, file.hash FROM file "
+                       "WHERE file.hash IN (SELECT value FROM json_each(?))", [json.dumps(list(by_hash))])
+        known: Dict[str, list] = {}
+        for id, path, inode, hash in cursor.fetchall():
+            known.setdefault(hash, []).append((id, path, inode))
+
+        moves = []
+        for hash, files in by_hash.items():
+            # A known file still at its path was copied, not moved
+            gone = [row for row in known.get(hash, []) if not os.path.lexists(row[1])]
+            for file in files:
+                if not gone:
+                    break
+                # The same inode first; e.g. renamed within a filesystem
+                row = next((row for row in gone if row[2] == file[4][2]), gone[0])
+                gone.remove(row)
+                moves.append((file, row[0]))
+        return moves
+
+    def __write(self, cursor: Cursor, folders, files, existing: Dict[str, tuple],
+                hashes: Dict[str, Optional[str]]) -> List[int]:
+        # Returns the new files' ids
+        # Known folders are not inserted; a conflicting insert still takes an AUTOINCREMENT id
+        paths = [path for path, _, _ in folders] + [parent for _, _, parent in folders] + [file[3] for file in files]
+        self.__folder_ids(cursor, paths)
+        cursor.executemany(insert_folder, [(path, name) for path, name, _ in folders if path not in self.folder_ids])
+        self.stats.new_folders += max(cursor.rowcount, 0)
+        self.__folder_ids(cursor, paths)
+        cursor.executemany(insert_subfolder, [(self.folder_ids[parent], self.folder_ids[path])
+                                              for path, _, parent in folders
+                                              if parent in self.folder_ids and path in self.folder_ids])
+
+        new, changed = [], []
+        for file in files:
+            row = existing.get(file[0])
+            if row is None:
+                new.append(file)
+            elif row[1:4] != file[4] or file[0] in hashes:
+                changed.append((file, row[0]))
+        cursor.executemany(update_fingerprint, [(*file[4], hashes.get(file[0]), id) for file, id in changed])
+        self.stats.changed_files += len(changed)
+
+        moved = self.__moves(cursor, new, hashes)
+        cursor.executemany(move_file, [(path, mime, name, *fingerprint, hashes[path], id)
+                                       for (path, name, mime, _, fingerprint), id in moved])
+        cursor.executemany(unlink_file, [(id,) for _, id in moved])
+        self.stats.moved_files += len(moved)
+        moved_paths = {file[0] for file, _ in moved}
+        new = [file for file in new if file[0] not in moved_paths]
+
+        cursor.executemany(insert_file, [(path, mime, name, *fingerprint, hashes.get(path))
+                                         for path, name, mime, _, fingerprint in new])
+        self.stats.new_files += max(cursor.rowcount, 0)
+        new_ids = _resolve(cursor, "file", [file[0] for file in new])
+        # Changed files are re-linked too; e.g. rows added before they were scanned
+        file_ids = {**{file[0]: id for file, id in changed + moved}, **new_ids}
+        cursor.executemany(insert_subfile, [(self.folder_ids[folder], file_ids[path])
+                                            for path, _, _, folder, _ in files
+                                            if folder in self.folder_ids and path in file_ids])
+        return list(new_ids.values())
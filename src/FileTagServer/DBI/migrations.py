@@ -0,0 +1,228 @@
+import sys
+from sqlite3 import Cursor
+from typing import List, Optional, Union, Callable
+
+from FileTagServer.DBI import changes
+from FileTagServer.DBI.pool import get_pool
+from FileTagServer.DBI.file import queries as file_queries
+from FileTagServer.DBI.folder import queries as folder_queries
+from FileTagServer.DBI.statements import get_sql
+from FileTagServer.DBI.tag import queries as tag_queries
+
+
+class Migration:
+    """
+    A single step of the schema; applied at most once per database.
+
+    'version' is stored in 'PRAGMA user_version' once the migration's statements have run.
+    """
+
+    def __init__(self, version: int, description: str, statements: List[Union[str, Callable[[Cursor], None]]]):
+        self.version = version
+        self.description = description
+        self.statements = statements
+
+    def apply(self, cursor: Cursor):
+        for statement in self.statements:
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+
+
+# Tables are created with 'IF NOT EXISTS' so databases created before versioning (user_version = 0) upgrade in place
+create_tables = Migration(1, "Create tables", [
+    get_sql(f"{table}/create") for table in
+    ['file', 'tag', 'file_tag', 'folder', 'folder_tag', 'folder_file', 'folder_folder']
+])
+
+
+def _ensure_file_tag_pair_index(cursor: Cursor):
+    # Databases from before pair_unique was added to file_tag (e.g. examples/example.db) have no index on file_id
+    cursor.execute("SELECT COUNT(*) FROM pragma_index_list('file_tag') WHERE origin = 'u'")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("CREATE INDEX IF NOT EXISTS file_tag_file_id ON file_tag (file_id, tag_id)")
+
+
+# The pair_unique constraints only index the (parent, child) direction; these cover lookups by the second column
+#   'file_tag.tag_id' : tag counts & files by tag
+#   'folder_tag.tag_id' : tag counts & folders by tag
+#   'folder_file.file_id' : orphaned files & a file's parent folder
+#   'folder_folder.child_id' : root folders & a folder's parent folder
+reverse_indexes = Migration(2, "Add reverse-direction indexes to join tables", [
+    "CREATE INDEX IF NOT EXISTS file_tag_tag_id ON file_tag (tag_id, file_id)",
+    "CREATE INDEX IF NOT EXISTS folder_tag_tag_id ON folder_tag (tag_id, folder_id)",
+    "CREATE INDEX IF NOT EXISTS folder_file_file_id ON folder_file (file_id, folder_id)",
+    "CREATE INDEX IF NOT EXISTS folder_folder_child_id ON folder_folder (child_id, parent_id)",
+    _ensure_file_tag_pair_index,
+])
+
+# Per-tag usage counts, kept exact by triggers so reading a tag's count never scans file_tag / folder_tag
+#   A tag id change recounts from the join tables; the ON UPDATE CASCADE to file_tag/folder_tag may run before or after
+tag_counts = Migration(3, "Add trigger-maintained tag usage counts", [
+    """CREATE TABLE IF NOT EXISTS tag_count(
+    tag_id INTEGER PRIMARY KEY,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    folder_count INTEGER NOT NULL DEFAULT 0
+)""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_tag_insert AFTER INSERT ON tag BEGIN
+    INSERT INTO tag_count (tag_id) VALUES (NEW.id);
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_tag_delete AFTER DELETE ON tag BEGIN
+    DELETE FROM tag_count WHERE tag_id = OLD.id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_tag_update AFTER UPDATE OF id ON tag WHEN OLD.id != NEW.id BEGIN
+    UPDATE tag_count SET tag_id = NEW.id,
+        file_count = (SELECT COUNT(*) FROM file_tag WHERE file_tag.tag_id = NEW.id),
+        folder_count = (SELECT COUNT(*) FROM folder_tag WHERE folder_tag.tag_id = NEW.id)
+    WHERE tag_id = OLD.id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_file_tag_insert AFTER INSERT ON file_tag BEGIN
+    UPDATE tag_count SET file_count = file_count + 1 WHERE tag_id = NEW.tag_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_file_tag_delete AFTER DELETE ON file_tag BEGIN
+    UPDATE tag_count SET file_count = file_count - 1 WHERE tag_id = OLD.tag_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_file_tag_update AFTER UPDATE OF tag_id ON file_tag
+WHEN OLD.tag_id IS NOT NEW.tag_id BEGIN
+    UPDATE tag_count SET file_count = file_count - 1 WHERE tag_id = OLD.tag_id;
+    UPDATE tag_count SET file_count = file_count + 1 WHERE tag_id = NEW.tag_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_folder_tag_insert AFTER INSERT ON folder_tag BEGIN
+    UPDATE tag_count SET folder_count = folder_count + 1 WHERE tag_id = NEW.tag_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_folder_tag_delete AFTER DELETE ON folder_tag BEGIN
+    UPDATE tag_count SET folder_count = folder_count - 1 WHERE tag_id = OLD.tag_id;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_count_folder_tag_update AFTER UPDATE OF tag_id ON folder_tag
+WHEN OLD.tag_id IS NOT NEW.tag_id BEGIN
+    UPDATE tag_count SET folder_count = folder_count - 1 WHERE tag_id = OLD.tag_id;
+    UPDATE tag_count SET folder_count = folder_count + 1 WHERE tag_id = NEW.tag_id;
+END""",
+    # Backfill
+    tag_queries.delete_counts,
+    tag_queries.rebuild_counts,
+])
+
+# Keyset pagination seeks on an index starting with the first sort column; the id is the tiebreaker
+#   'file.path' is already indexed by path_unique and 'file.id' is the rowid
+file_sort_indexes = Migration(4, "Add indexes for sorting files", [
+    "CREATE INDEX IF NOT EXISTS file_name ON file (name, id)",
+    "CREATE INDEX IF NOT EXISTS file_mime ON file (mime, id)",
+])
+
+# Text search of names, descriptions & paths; kept in sync by triggers, backfilled from the existing files
+file_text = Migration(5, "Add full text index of files", [
+    file_queries.create_text,
+    *file_queries.create_text_triggers,
+    file_queries.rebuild_text,
+])
+
+
+def _add_file_tag_count(cursor: Cursor):
+    # ALTER TABLE has no 'IF NOT EXISTS'
+    cursor.execute("SELECT COUNT(*) FROM pragma_table_info('file') WHERE name = 'tag_count'")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(file_queries.add_tag_count)
+
+
+# Sorting files by their number of tags (e.g. untagged files first) walks file_tag_count; see file_queries.sort_indexes
+#   'file.tag_count' is kept by triggers like tag_count; not by the text index's, which only watch the text columns
+file_tag_counts = Migration(6, "Add trigger-maintained file tag counts and multi-column sort indexes", [
+    _add_file_tag_count,
+    *file_queries.create_tag_count_triggers,
+    file_queries.rebuild_tag_counts,
+    "CREATE INDEX IF NOT EXISTS file_tag_count ON file (tag_count, id)",
+    "CREATE INDEX IF NOT EXISTS file_mime_name ON file (mime, name, id)",
+])
+
+
+def _add_column(table: str, column: str, statement: str) -> Callable[[Cursor], None]:
+    # As _add_file_tag_count
+    def add(cursor: Cursor):
+        cursor.execute(f"SELECT COUNT(*) FROM pragma_table_info('{table}') WHERE name = ?", [column])
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(statement)
+    return add
+
+
+# Rescans compare these to what is on disk (see DBI.ingest); a folder's mtime lets its listing be skipped
+scan_fingerprints = Migration(7, "Add scan fingerprints of files & folders", [
+    *(_add_column("file", column, statement) for column, statement in file_queries.add_fingerprint.items()),
+    _add_column("folder", "mtime", folder_queries.add_mtime),
+])
+
+# Looked up by the hashes of new files, to find moved ones (see DBI.ingest); files never hashed are not indexed
+file_hashes = Migration(8, "Add content hashes of files", [
+    _add_column("file", "hash", file_queries.add_hash),
+    "CREATE INDEX IF NOT EXISTS file_hash ON file (hash) WHERE hash IS NOT NULL",
+])
+
+# Tells this process's writes from those of others; see DBI.changes
+change_counts = Migration(9, "Add trigger-maintained change counts", [
+    *changes.create_tables,
+    *changes.create_triggers,
+])
+
+migrations: List[Migration] = [
+    create_tables,
+    reverse_indexes,
+    tag_counts,
+    file_sort_indexes,
+    file_text,
+    file_tag_counts,
+    scan_fingerprints,
+    file_hashes,
+    change_counts,
+]
+
+
+def latest_version() -> int:
+    return migrations[-1].version
+
+
+def get_schema_version(cursor: Cursor) -> int:
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(path: str = None, target: Optional[int] = None, verbose: bool = False) -> int:
+    """
+    Applies every migration newer than the database's user_version, up to (and including) target.
+
+    Each migration runs in its own transaction along with its user_version bump; an interrupted upgrade resumes from
+    the last completed migration. Returns the resulting schema version.
+    """
+    target = latest_version() if target is None else target
+    with get_pool(path).connection() as conn:
+        cursor = conn.cursor()
+        current = get_schema_version(cursor)
+        if current > latest_version():
+            raise ValueError(f"Database schema version '{current}' is newer than this server ('{latest_version()}')")
+        for migration in migrations:
+            if migration.version <= current or migration.version > target:
+                continue
+            if verbose:
+                print(f"Migrating to version {migration.version}: {migration.description}")
+            # DDL does not implicitly open a transaction; open one so the migration and its version are atomic
+            cursor.execute("BEGIN")
+            try:
+                migration.apply(cursor)
+                # PRAGMA arguments cannot be bound; version is always an int
+                cursor.execute(f"PRAGMA user_version = {int(migration.version)}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            current = migration.version
+        # Let sqlite gather statistics for any new indexes; cheap when nothing changed
+        cursor.execute("PRAGMA optimize")
+        cursor.close()
+    return current
+
+
+if __name__ == "__main__":
+    # Upgrades a database in place; e.g. 'python -m FileTagServer.DBI.migrations ../local.db'
+    db_path = sys.argv[1] if len(sys.argv) > 1 else None
+    version = migrate(db_path, verbose=True)
+    print(f"Database is at schema version {version}")
@@ -1,9 +1,69 @@
-from typing import Optional, List
+from typing import Optional, List, Type, TypeVar, Mapping, Any, Dict, Tuple, Callable, AbstractSet
 
 from pydantic import BaseModel
 
+ModelType = TypeVar('ModelType', bound=BaseModel)
 
-class Tag(BaseModel):
+
+# (model, row columns) -> (field defaults, default factories, row columns which are fields)
+__row_layouts: Dict[Tuple[type, Tuple[str, ...]], Tuple[Dict[str, Any], List[Tuple[str, Callable]], List[str]]] = {}
+
+
+def __row_layout(model: Type[BaseModel], keys: Tuple[str, ...]):
+    layout = __row_layouts.get((model, keys))
+    if layout is None:
+        fields = model.__fields__
+        # Every field, in order; default factories are filled in per model
+        defaults = {name: field.default for name, field in fields.items()}
+        factories = [(name, field.default_factory) for name, field in fields.items() if field.default_factory]
+        columns = [key for key in keys if key in fields]
+        layout = __row_layouts[(model, keys)] = (defaults, factories, columns)
+    return layout
+
+
+def construct_from_row(model: Type[ModelType], row: Mapping[str, Any], include: Optional[AbstractSet[str]] = None,
+                       **values: Any) -> ModelType:
+    """
+    Builds the model from a trusted database row WITHOUT validation; 'values' override the row's columns.
+
+    Columns the model has no field for are dropped, as validation would.
+    Only fields in 'include' (if given) are marked as set; serialize with 'exclude_unset' to output just those.
+    """
+    # What BaseModel.construct does, minus the per-field work; the row's layout is only worked out once
+    defaults, factories, columns = __row_layout(model, tuple(row.keys()))
+    fields_values = dict(defaults)
+    for name, factory in factories:
+        fields_values[name] = factory()
+    for key in columns:
+        fields_values[key] = row[key]
+    fields_values.update(values)
+    fields_set = set(columns)
+    fields_set.update(values)
+    if include is not None:
+        fields_set.intersection_update(include)
+
+    m = model.__new__(model)
+    object.__setattr__(m, '__dict__', fields_values)
+    object.__setattr__(m, '__fields_set__', fields_set)
+    m._init_private_attributes()
+    return m
+
+
+class DBModel(BaseModel):
+    """
+    A model read from the database.
+
+    Rows are trusted (the schema already constrains them), so 'from_row' skips validation;
+    inbound API payloads are still created normally ('Model(**values)') and validated.
+    """
+
+    @classmethod
+    def from_row(cls: Type[ModelType], row: Mapping[str, Any], include: Optional[AbstractSet[str]] = None,
+                 **values: Any) -> ModelType:
+        return construct_from_row(cls, row, include, **values)
+
+
+class Tag(DBModel):
     id: int
     name: Optional[str] = None
     description: Optional[str] = None
@@ -11,7 +71,7 @@ class Tag(BaseModel):
     count: Optional[int] = 0
 
 
-class File(BaseModel):
+class File(DBModel):
     id: int
     path: Optional[str] = None
     name: Optional[str] = None
@@ -23,7 +83,7 @@ class File(BaseModel):
     tags: Optional[List[int]] = None
 
 
-class Folder(BaseModel):
+class Folder(DBModel):
     id: int
     path: Optional[str] = None
     name: Optional[str] = None
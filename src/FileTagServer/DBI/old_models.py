@@ -31,7 +31,8 @@ class File(BaseModel):
 
     def as_response(self, fields=None, tag_fields=None) -> 'RestFile':
         fields = set(fields) if fields else None
-        d = self.dict(include=fields)
+        # Unset fields (e.g. those outside 'fields' when read from the database) are left out, nested tags included
+        d = self.dict(include=fields, exclude_unset=True)
         r = RestFile.construct(fields, **d)
         r_fixed = r.copy(include=fields)
         return r_fixed
@@ -62,4 +63,5 @@ class Folder(BaseModel):
 
 
 File.update_forward_refs()
-WebFile.update_forward_refs()
\ No newline at end of file
+WebFile.update_forward_refs()
+RestFile.update_forward_refs()
\ No newline at end of file
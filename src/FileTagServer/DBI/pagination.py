@@ -0,0 +1,137 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import List, Any, Tuple, Optional, Dict
+
+from starlette import status
+
+from FileTagServer.DBI.common import SortQuery
+from FileTagServer.DBI.error import ApiError
+
+
+# Keyset (cursor) pagination
+#   A cursor holds the sort values of the last row on a page (plus its id, the tiebreaker)
+#   The next page is every row ordered after those values; no OFFSET, so page 10,000 costs the same as page 1
+
+
+def keyset_sort(sort: Optional[List[SortQuery]], id_field: str = "id") -> List[SortQuery]:
+    """
+    The sort used for paging; the given sort with the id appended as a tiebreaker (unless already sorted by id).
+
+    The id takes the direction of the last column, so an index ending in the id is walked in a single direction.
+    """
+    sort = list(sort) if sort else []
+    if not any(part.field == id_field for part in sort):
+        sort.append(SortQuery(field=id_field, ascending=sort[-1].ascending if sort else True))
+    return sort
+
+
+def sort_index(sort: Optional[List[SortQuery]], indexes: Dict[str, List[str]], id_field: str = "id") -> Optional[str]:
+    """
+    The index (of 'indexes'; name -> columns before the id) that serves the sort; None if no index does.
+
+    The sort (with its tiebreaker) has to be a prefix of the index's columns and the id, all in one direction.
+    """
+    sort = keyset_sort(sort, id_field)
+    fields = [part.field for part in sort]
+    if any(part.ascending != sort[0].ascending for part in sort):
+        return None
+    for name, columns in indexes.items():
+        if fields == (columns + [id_field])[:len(fields)]:
+            return name
+    return None
+
+
+def validate_sort(sort: Optional[List[SortQuery]], indexes: Dict[str, List[str]], id_field: str = "id"):
+    # Raises a ValueError (for validators) describing the supported sorts
+    if sort_index(sort, indexes, id_field) is None:
+        supported = sorted(",".join(columns + [id_field]) for columns in indexes.values())
+        raise ValueError(f"Unsupported sort '{SortQuery.list_to_str(sort)}'; a sort is a prefix of one of "
+                         f"{supported}, in one direction")
+
+
+def encode_cursor(sort: List[SortQuery], values: List[Any]) -> str:
+    payload = {'s': SortQuery.list_to_str(sort), 'v': values}
+    return urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(sort: List[SortQuery], cursor: str) -> List[Any]:
+    try:
+        payload = json.loads(urlsafe_b64decode(cursor.encode()))
+        cursor_sort, values = payload['s'], payload['v']
+    except (ValueError, KeyError, TypeError):
+        raise ApiError(status.HTTP_400_BAD_REQUEST, f"Invalid cursor: '{cursor}'")
+    if cursor_sort != SortQuery.list_to_str(sort) or len(values) != len(sort):
+        raise ApiError(status.HTTP_400_BAD_REQUEST, "Cursor does not match the requested sort")
+    return values
+
+
+def _after(column: str, ascending: bool, value: Any) -> Tuple[str, List[Any]]:
+    # sqlite orders NULL before every other value
+    if ascending:
+        if value is None:
+            return f"{column} IS NOT NULL", []
+        return f"{column} > ?", [value]
+    else:
+        if value is None:
+            return "0", []
+        return f"({column} < ? OR {column} IS NULL)", [value]
+
+
+def _keyset_or(sort: List[SortQuery], values: List[Any], table: str) -> Tuple[str, List[Any]]:
+    # '(a > ?) OR (a IS ? AND b > ?) OR ...'
+    terms = []
+    args = []
+    for i, part in enumerate(sort):
+        term_parts = []
+        for prev, prev_value in zip(sort[:i], values[:i]):
+            term_parts.append(f"{table}.{prev.field} IS ?")
+            args.append(prev_value)
+        clause, clause_args = _after(f"{table}.{part.field}", part.ascending, values[i])
+        term_parts.append(clause)
+        args.extend(clause_args)
+        terms.append("(" + " AND ".join(term_parts) + ")")
+    return " OR ".join(terms), args
+
+
+def keyset_where(sort: List[SortQuery], values: List[Any], table: str) -> List[Tuple[str, List[Any]]]:
+    """
+    Disjoint WHERE clauses which together match every row ordered after 'values' by 'sort'.
+
+    Each clause bounds the first sort column with a range, so it is a seek on an index starting with that column
+    rather than a scan from the first row. NULLs sort first; a descending sort needs a second clause for them.
+    """
+    first, value = sort[0], values[0]
+    column = f"{table}.{first.field}"
+    same = None
+    if len(sort) > 1:
+        rest, rest_args = _keyset_or(sort[1:], values[1:], table)
+        same = (f"{column} IS ? AND ({rest})", [value] + rest_args)
+
+    branches = []
+    if first.ascending:
+        if value is None:
+            if same:
+                branches.append(same)
+            branches.append((f"{column} IS NOT NULL", []))
+        elif same:
+            branches.append((f"{column} >= ? AND ({column} > ? OR ({same[0]}))", [value, value] + same[1]))
+        else:
+            branches.append((f"{column} > ?", [value]))
+    else:
+        if value is None:
+            if same:
+                branches.append(same)
+        else:
+            if same:
+                branches.append((f"{column} <= ? AND ({column} < ? OR ({same[0]}))", [value, value] + same[1]))
+            else:
+                branches.append((f"{column} < ?", [value]))
+            branches.append((f"{column} IS NULL", []))
+    if not branches:
+        # The cursor was the last row
+        branches.append(("0", []))
+    return branches
+
+
+def order_by(sort: List[SortQuery], table: str) -> List[str]:
+    return [f"{table}.{part.sql()}" for part in sort]
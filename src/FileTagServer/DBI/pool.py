@@ -0,0 +1,191 @@
+import os
+from contextlib import contextmanager
+from queue import Queue, Empty, Full
+from sqlite3 import Connection, connect
+from threading import Lock, local
+from typing import Callable, Dict, List, Optional, Any, Set
+
+from FileTagServer import config
+from FileTagServer.DBI.cache import bump_write_generation
+from FileTagServer.DBI.changes import install, outside_changes, uninstall
+from FileTagServer.DBI.error import ApiError
+
+
+class ConnectionPool:
+    """
+    A checkout based pool of long-lived sqlite connections for a single database file.
+
+    Pragmas are applied once, when a connection is opened, instead of on every request.
+    A size of 0 disables pooling; every checkout then opens (and closes) its own connection.
+    A checkout nested in another on the same thread (e.g. get_file -> get_file_tags) shares its connection; only the
+    outermost commits (or rolls back) and releases it.
+    The outermost checkout also notices writes by other processes (e.g. a scan); the write generation is bumped and
+    the 'data_listeners' are called before the connection is used. Commits of the pool's own connections are not
+    such writes (see DBI.changes).
+    """
+
+    def __init__(self, path: str, size: int = None, timeout: float = None, pragmas: Dict[str, Any] = None,
+                 cached_statements: int = None):
+        self.path = path
+        self.size = config.db_pool_size if size is None else size
+        self.timeout = config.db_pool_timeout if timeout is None else timeout
+        self.pragmas = config.db_pragmas if pragmas is None else pragmas
+        self.cached_statements = config.db_cached_statements if cached_statements is None else cached_statements
+        self.__idle: Queue = Queue(maxsize=max(self.size, 1))
+        self.__lock = Lock()
+        self.__opened = 0
+        # The connection checked out by each thread, if any
+        self.__held = local()
+        # PRAGMA data_version of each connection at its last checkout
+        self.__versions: Dict[Connection, int] = {}
+        # Connections whose writes are counted as this process's own (see DBI.changes)
+        self.__counted: Set[Connection] = set()
+        # The outside change counts last seen by any connection
+        self.__outside: Dict[str, int] = {}
+
+    @property
+    def opened(self) -> int:
+        return self.__opened
+
+    def _open(self) -> Connection:
+        # Connections are handed between threads (fastapi runs sync endpoints in a threadpool);
+        #   the pool guarantees only one thread uses a connection at a time.
+        busy_timeout = self.pragmas.get('busy_timeout', 5000) / 1000
+        conn = connect(self.path, timeout=busy_timeout, check_same_thread=False,
+                       cached_statements=self.cached_statements)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def acquire(self) -> Connection:
+        if self.size <= 0:
+            return self._open()
+        try:
+            return self.__idle.get_nowait()
+        except Empty:
+            pass
+
+        with self.__lock:
+            can_open = self.__opened < self.size
+            if can_open:
+                self.__opened += 1
+        if can_open:
+            try:
+                return self._open()
+            except BaseException:
+                with self.__lock:
+                    self.__opened -= 1
+                raise
+
+        try:
+            return self.__idle.get(timeout=self.timeout)
+        except Empty:
+            raise ApiError(503, f"Timed out waiting for a database connection to '{self.path}'")
+
+    def release(self, conn: Connection):
+        if self.size <= 0:
+            self.__forget(conn)
+            conn.close()
+            return
+        # Never hand out a connection mid-transaction
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.__idle.put_nowait(conn)
+        except Full:
+            self.__forget(conn)
+            conn.close()
+            with self.__lock:
+                self.__opened -= 1
+
+    @contextmanager
+    def connection(self, shared: bool = True) -> Connection:
+        """
+        'shared' is False for a checkout held across yields (e.g. a streamed result); its generator may be resumed on
+        another thread, so it neither shares the thread's connection nor lends its own.
+        """
+        held = getattr(self.__held, "conn", None)
+        if shared and held is not None:
+            yield held
+            return
+        conn = self.acquire()
+        changes = conn.total_changes
+        if shared:
+            self.__held.conn = conn
+        try:
+            self.__check_version(conn)
+            # Same semantics as 'with sqlite3.connect(...)'; commit on success, rollback on error
+            with conn:
+                yield conn
+        finally:
+            if shared:
+                self.__held.conn = None
+            # Every write through the pool invalidates cached results; after the commit, so none are cached stale
+            if conn.total_changes != changes:
+                bump_write_generation()
+            self.release(conn)
+
+    def __check_version(self, conn: Connection):
+        # data_version changes once another connection (of this process or another) commits; only then are the
+        #   change counts read. Installed on first use; a database is only counted once migrated
+        if conn not in self.__counted and install(conn):
+            self.__counted.add(conn)
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self.__versions.get(conn) == version:
+            return
+        self.__versions[conn] = version
+        outside = outside_changes(conn) if conn in self.__counted else {}
+        with self.__lock:
+            if outside == self.__outside:
+                return
+            self.__outside = outside
+        for listener in data_listeners:
+            listener(self.path, conn, outside)
+        # After the listeners; e.g. a stale tag index is dropped before anything is cached at the new generation
+        bump_write_generation()
+
+    def __forget(self, conn: Connection):
+        self.__versions.pop(conn, None)
+        self.__counted.discard(conn)
+
+    def close(self):
+        uninstalled = False
+        while True:
+            try:
+                conn = self.__idle.get_nowait()
+            except Empty:
+                break
+            if not uninstalled and conn in self.__counted:
+                uninstall(conn)
+                uninstalled = True
+            self.__forget(conn)
+            conn.close()
+            with self.__lock:
+                self.__opened -= 1
+
+
+# Called with (the pool's path, the checked out connection, the outside change counts) once another process wrote;
+#   e.g. tag.index rebuilds its index if files or file tags changed since it was built
+data_listeners: List[Callable[[str, Connection, Dict[str, int]], None]] = []
+
+__pools: Dict[str, ConnectionPool] = {}
+__pools_lock = Lock()
+
+
+def get_pool(path: Optional[str] = None) -> ConnectionPool:
+    path = path or config.db_path
+    key = path if path == ":memory:" else os.path.abspath(path)
+    pool = __pools.get(key)
+    if pool is None:
+        with __pools_lock:
+            pool = __pools.get(key)
+            if pool is None:
+                pool = __pools[key] = ConnectionPool(path)
+    return pool
+
+
+def close_pools():
+    with __pools_lock:
+        for pool in __pools.values():
+            pool.close()
+        __pools.clear()
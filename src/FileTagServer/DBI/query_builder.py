@@ -0,0 +1,131 @@
+from typing import List, Any, Optional, Tuple, Iterable
+
+
+class QueryBuilder:
+    """
+    Builds a SELECT of a table's own columns; related rows are loaded separately (see DBI.relations).
+
+    The DBI's selects join at most one row per base row (e.g. tag_count); joins that multiply the rows, aggregated by
+    group_by, are only left for the benchmarks of the old GROUP_CONCAT selects (see benchmarks.relation_loader).
+    Filters, sorting and limits only reference the base table, so with a limit they are applied to the base table
+    BEFORE it is joined.
+    """
+
+    def __init__(self, table: str, columns: List[str], joins: List[str] = None, group_by: Optional[str] = None):
+        self.table = table
+        self.columns = columns
+        self.joins = joins or []
+        self.group_by = group_by
+        self.__where: List[str] = []
+        self.__args: List[Any] = []
+        self.__branches: List[Tuple[str, List[Any]]] = []
+        self.__order_by: List[str] = []
+        self.__limit: Optional[int] = None
+        self.__offset: Optional[int] = None
+
+    def copy(self) -> 'QueryBuilder':
+        builder = QueryBuilder(self.table, list(self.columns), list(self.joins), self.group_by)
+        builder.__where = list(self.__where)
+        builder.__args = list(self.__args)
+        builder.__branches = list(self.__branches)
+        builder.__order_by = list(self.__order_by)
+        builder.__limit = self.__limit
+        builder.__offset = self.__offset
+        return builder
+
+    def where(self, clause: str, *args: Any) -> 'QueryBuilder':
+        # Clauses are AND-ed together; reference columns as '{table}.{column}'
+        self.__where.append(f"({clause})")
+        self.__args.extend(args)
+        return self
+
+    def where_any(self, branches: List[Tuple[str, List[Any]]]) -> 'QueryBuilder':
+        """
+        OR-s the (disjoint) branch clauses; AND-ed with the other clauses.
+
+        With a LIMIT, each branch is limited separately and the results merged, so every branch can use its own index
+        seek (a plain OR would scan).
+        """
+        self.__branches = list(branches)
+        return self
+
+    def where_in(self, column: str, values: Iterable[Any]) -> 'QueryBuilder':
+        values = list(values)
+        placeholder = ", ".join(["?" for _ in range(len(values))])
+        return self.where(f"{column} IN ({placeholder})", *values)
+
+    def order_by(self, *parts: str) -> 'QueryBuilder':
+        self.__order_by.extend(parts)
+        return self
+
+    def limit(self, limit: Optional[int], offset: Optional[int] = None) -> 'QueryBuilder':
+        self.__limit = limit
+        self.__offset = offset
+        return self
+
+    @property
+    def args(self) -> List[Any]:
+        args = list(self.__args)
+        for _, branch_args in self.__branches:
+            args.extend(branch_args)
+        return args
+
+    def _filter_sql(self, branch: Optional[str] = None) -> str:
+        where = list(self.__where)
+        if branch is not None:
+            where.append(f"({branch})")
+        elif self.__branches:
+            where.append("(" + " OR ".join(f"({clause})" for clause, _ in self.__branches) + ")")
+        if where:
+            return "WHERE " + " AND ".join(where)
+        return ""
+
+    def _order_sql(self) -> str:
+        if self.__order_by:
+            return "ORDER BY " + ", ".join(self.__order_by)
+        return ""
+
+    def _limit_sql(self) -> str:
+        if self.__limit is None:
+            return ""
+        if self.__offset:
+            return f"LIMIT {int(self.__limit)} OFFSET {int(self.__offset)}"
+        return f"LIMIT {int(self.__limit)}"
+
+    def build(self) -> Tuple[str, List[Any]]:
+        source = self.table
+        filter_sql = self._filter_sql()
+        order_sql = self._order_sql()
+        args = self.args
+        if self.__limit is not None:
+            # A LIMIT has to be applied before the joins multiply the rows; select the page of base rows first
+            limit_sql = self._limit_sql()
+            if len(self.__branches) > 1:
+                # Every branch returns at most a page; merge them, then take the page
+                if self.__offset:
+                    raise ValueError("OFFSET is not supported with multiple branches")
+                selects = []
+                args = []
+                for clause, branch_args in self.__branches:
+                    branch_sql = f"SELECT * FROM {self.table} {self._filter_sql(clause)} {order_sql} {limit_sql}"
+                    selects.append(f"SELECT * FROM ({branch_sql})")
+                    args.extend(self.__args)
+                    args.extend(branch_args)
+                merged = " UNION ALL ".join(selects)
+                source = f"(SELECT * FROM ({merged}) AS {self.table} {order_sql} {limit_sql}) AS {self.table}"
+            else:
+                source = f"(SELECT * FROM {self.table} {filter_sql} {order_sql} {limit_sql}) AS {self.table}"
+            filter_sql = ""
+
+        parts = [f"SELECT {', '.join(self.columns)} FROM {source}"]
+        parts.extend(self.joins)
+        if filter_sql:
+            parts.append(filter_sql)
+        if self.group_by:
+            parts.append(f"GROUP BY {self.group_by}")
+        if order_sql:
+            parts.append(order_sql)
+        return "\n".join(parts), args
+
+    def sql(self) -> str:
+        return self.build()[0]
@@ -0,0 +1,162 @@
+import json
+import os
+import time
+from sqlite3 import Cursor
+from typing import Dict, Iterable, List, Set, Tuple
+
+from pydantic import BaseModel
+
+from FileTagServer import config
+from FileTagServer.DBI.common import _connect, fetch_batches
+from FileTagServer.DBI.tag.index import find_tag_index
+
+# STALE ENTRY REAPING
+# Removes the folders & files a scan no longer finds on disk; after the scan's writes, a moved file has been re-pointed
+#   at its new path (see DBI.ingest) by the time its old folder's listing would reap it
+#   Each complete listing is compared with the entries stored under its folder (folder_file & folder_folder); the stored
+#   entries are read for 'batch_size' listed entries at a time, only the missing ones are kept until the end
+#   A directory that could not be listed (completely) is never compared; e.g. an unmounted share keeps its rows
+#   A missing folder takes every folder & file under its path with it (a range of the path_unique index)
+#   Rows are deleted a batch at a time (one transaction each), their edges first; the foreign keys of file_tag,
+#   folder_file, etc. restrict deleting a row that is still pointed at
+#   An unchanged listing (see scan.walker) is not compared; its entries are the last scan's, reaped then
+
+file_edges = [
+    "DELETE FROM file_tag WHERE file_tag.file_id IN (SELECT value FROM json_each(?))",
+    "DELETE FROM folder_file WHERE folder_file.file_id IN (SELECT value FROM json_each(?))",
+]
+delete_files = "DELETE FROM file WHERE file.id IN (SELECT value FROM json_each(?))"
+folder_edges = [
+    "DELETE FROM folder_tag WHERE folder_tag.folder_id IN (SELECT value FROM json_each(?))",
+    "DELETE FROM folder_file WHERE folder_file.folder_id IN (SELECT value FROM json_each(?))",
+    "DELETE FROM folder_folder WHERE folder_folder.parent_id IN (SELECT value FROM json_each(?))",
+    "DELETE FROM folder_folder WHERE folder_folder.child_id IN (SELECT value FROM json_each(?))",
+]
+delete_folders = "DELETE FROM folder WHERE folder.id IN (SELECT value FROM json_each(?))"
+
+
+class ReapStats(BaseModel):
+    # Listed entries compared with the stored ones
+    compared: int = 0
+    files: int = 0
+    folders: int = 0
+    # Of removing; listings are compared while scanning
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return f"Reaped {self.files} file(s) & {self.folders} folder(s) of {self.compared} compared " \
+               f"in {self.seconds:.2f}s"
+
+
+def _subtree(path: str) -> Tuple[str, str]:
+    # The range of paths under a folder; 'path/' (inclusive) to 'path0' (exclusive), '0' being the character after '/'
+    lower = os.path.join(path, "")
+    return lower, lower[:-1] + chr(ord(lower[-1]) + 1)
+
+
+def _batches(ids: List[int], size: int) -> Iterable[str]:
+    for start in range(0, len(ids), size):
+        yield json.dumps(ids[start:start + size])
+
+
+class Reaper:
+    """
+    Compares complete directory listings with the stored entries, and removes the missing ones on 'reap'.
+    """
+
+    def __init__(self, path: str = None, batch_size: int = None):
+        self.path = path
+        self.batch_size = batch_size or config.ingest_batch_size
+        # Directory -> the paths of its listed entries
+        self.listings: Dict[str, Set[str]] = {}
+        self.listed = 0
+        # (id, path) of the stored entries that were not listed
+        self.files: List[Tuple[int, str]] = []
+        self.folders: List[Tuple[int, str]] = []
+        self.stats = ReapStats()
+
+    def add_listing(self, directory: str, paths: Iterable[str]):
+        """
+        A complete listing of the directory; the paths of every subfolder & file in it.
+        """
+        self.listings[directory] = set(paths)
+        self.listed += len(self.listings[directory])
+        if self.listed >= self.batch_size:
+            self.__compare()
+
+    def __compare(self):
+        listings = self.listings
+        self.listings, self.listed = {}, 0
+        if not listings:
+            return
+        directories = [json.dumps(list(listings))]
+        with _connect(self.path) as (conn, cursor):
+            cursor.execute("SELECT folder.path, file.id, file.path FROM folder "
+                           "JOIN folder_file ON folder_file.folder_id = folder.id "
+                           "JOIN file ON file.id = folder_file.file_id "
+                           "WHERE folder.path IN (SELECT value FROM json_each(?))", directories)
+            for rows in fetch_batches(cursor):
+                self.files.extend((id, path) for directory, id, path in rows if path not in listings[directory])
+            cursor.execute("SELECT parent.path, child.id, child.path FROM folder AS parent "
+                           "JOIN folder_folder ON folder_folder.parent_id = parent.id "
+                           "JOIN folder AS child ON child.id = folder_folder.child_id "
+                           "WHERE parent.path IN (SELECT value FROM json_each(?))", directories)
+            for rows in fetch_batches(cursor):
+                self.folders.extend((id, path) for directory, id, path in rows if path not in listings[directory])
+        self.stats.compared += sum(len(paths) for paths in listings.values())
+
+    def __stale(self, cursor: Cursor) -> Tuple[List[int], List[int]]:
+        # The ids of the files & folders to remove; checked against the disk again, e.g. re-created since listed
+        folders = [(id, path) for id, path in self.folders if not os.path.lexists(path)]
+        folder_ids = {id for id, _ in folders}
+        file_ids = set()
+        for _, path in folders:
+            lower, upper = _subtree(path)
+            cursor.execute("SELECT folder.id FROM folder WHERE folder.path >= ? AND folder.path < ?", [lower, upper])
+            for rows in fetch_batches(cursor):
+                folder_ids.update(row[0] for row in rows)
+            cursor.execute("SELECT file.id FROM file WHERE file.path >= ? AND file.path < ?", [lower, upper])
+            for rows in fetch_batches(cursor):
+                file_ids.update(row[0] for row in rows)
+
+        # A file moved since it was compared has a new path; it is not reaped
+        files = {id: path for id, path in self.files if not os.path.lexists(path)}
+        for batch in _batches(list(files), self.batch_size):
+            cursor.execute("SELECT file.id, file.path FROM file WHERE file.id IN (SELECT value FROM json_each(?))",
+                           [batch])
+            file_ids.update(id for id, path in cursor.fetchall() if files[id] == path)
+        return sorted(file_ids), sorted(folder_ids)
+
+    def reap(self) -> ReapStats:
+        """
+        Removes every stored entry that was not listed (and is still gone); the stats are returned.
+        """
+        started = time.perf_counter()
+        self.__compare()
+        with _connect(self.path) as (conn, cursor):
+            file_ids, folder_ids = self.__stale(cursor)
+            for batch in _batches(file_ids, self.batch_size):
+                # Read before the files are gone; for the index
+                cursor.execute("SELECT file_tag.file_id, file_tag.tag_id FROM file_tag "
+                               "WHERE file_tag.file_id IN (SELECT value FROM json_each(?))", [batch])
+                tags: Dict[int, List[int]] = {}
+                for file_id, tag_id in cursor.fetchall():
+                    tags.setdefault(file_id, []).append(tag_id)
+                for statement in file_edges:
+                    cursor.execute(statement, [batch])
+                cursor.execute(delete_files, [batch])
+                self.stats.files += max(cursor.rowcount, 0)
+                conn.commit()
+                index = find_tag_index(self.path)
+                if index is not None:
+                    for file_id in json.loads(batch):
+                        index.remove_file(file_id, tags.get(file_id, []))
+            for batch in _batches(folder_ids, self.batch_size):
+                for statement in folder_edges:
+                    cursor.execute(statement, [batch])
+                cursor.execute(delete_folders, [batch])
+                self.stats.folders += max(cursor.rowcount, 0)
+                conn.commit()
+        self.files, self.folders = [], []
+        self.stats.seconds = time.perf_counter() - started
+        return self.stats
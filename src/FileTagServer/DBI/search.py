@@ -0,0 +1,313 @@
+from sqlite3 import Cursor
+from typing import List, Tuple, Any, Optional, Dict, Set, Union
+
+from pydantic import BaseModel
+
+from FileTagServer.DBI.bitmap import Bitmap
+from FileTagServer.DBI.relations import Relation
+from FileTagServer.DBI.tag import queries as tag_queries
+from FileTagServer.DBI.tag.index import TagIndex
+
+
+# TAG SEARCH
+# Compiles a (nested) SearchQuery of tag names into WHERE clauses over an id column
+#   A tag is a lookup on the join table's (id, tag_id) index; the rarest required tag drives the query
+#   (a seek on the (tag_id, id) index), so the cost follows the smallest candidate set, not the library size
+#   With a TagIndex (files only), the search can be evaluated on its bitmaps instead (see search_index)
+
+
+class SearchQuery(BaseModel):
+    # AND
+    required: Optional[List[Union['SearchQuery', str]]] = None
+    # OR
+    include: Optional[List[Union['SearchQuery', str]]] = None
+    # NOT
+    exclude: Optional[List[Union['SearchQuery', str]]] = None
+
+
+SearchQuery.update_forward_refs()
+
+Clause = Tuple[str, List[Any]]
+
+# A resolved search is TRUE, FALSE, a tag (id, number of uses) or a node (required, include, exclude)
+TRUE = "TRUE"
+FALSE = "FALSE"
+
+
+class TagStats:
+    # A tag's id & number of uses; see tag_stats
+    def __init__(self, id: int, count: int):
+        self.id = id
+        self.count = count
+
+
+class _Node:
+    def __init__(self, required: List[Any], include: List[Any], exclude: List[Any]):
+        self.required = required
+        self.include = include
+        self.exclude = exclude
+
+
+def _collect_names(search: Union[SearchQuery, str], names: Set[str]):
+    if isinstance(search, str):
+        names.add(search)
+        return
+    for terms in [search.required, search.include, search.exclude]:
+        for term in terms or []:
+            _collect_names(term, names)
+
+
+def tag_stats(cursor: Cursor, names: Set[str], count: str) -> Dict[str, TagStats]:
+    """
+    The known tags of the names, read in one query; the (trigger maintained) count estimates how selective a tag is.
+    """
+    if not names:
+        return {}
+    placeholder = ", ".join(["?" for _ in range(len(names))])
+    cursor.execute(f"SELECT tag.id, tag.name, {count} FROM tag {' '.join(tag_queries.joins)} "
+                   f"WHERE tag.name IN ({placeholder})", list(names))
+    return {name: TagStats(id, count or 0) for id, name, count in cursor.fetchall()}
+
+
+def _resolve(search: Union[SearchQuery, str], tags: Dict[str, TagStats]):
+    # Replaces names with tags and folds away anything decided without the database (e.g. unknown tags)
+    if isinstance(search, str):
+        return tags.get(search, FALSE)
+
+    required = [_resolve(term, tags) for term in search.required or []]
+    if FALSE in required:
+        return FALSE
+    required = [term for term in required if term is not TRUE]
+
+    include = [_resolve(term, tags) for term in search.include or []]
+    if TRUE in include:
+        include = []
+    elif include:
+        include = [term for term in include if term is not FALSE]
+        if not include:
+            return FALSE
+
+    exclude = [_resolve(term, tags) for term in search.exclude or []]
+    if TRUE in exclude:
+        return FALSE
+    exclude = [term for term in exclude if term is not FALSE]
+
+    if not required and not include and not exclude:
+        return TRUE
+    if len(required) == 1 and not include and not exclude:
+        return required[0]
+    return _Node(required, include, exclude)
+
+
+def tag_exists(relation: Relation, column: str, tag_ids: List[int]) -> Clause:
+    """
+    A clause true for the ids in 'column' with any of the tags; a seek on the relation's (id, tag_id) index.
+    """
+    t = relation.table
+    if len(tag_ids) == 1:
+        return f"EXISTS (SELECT 1 FROM {t} WHERE {t}.{relation.key} = {column} AND {t}.{relation.value} = ?)", tag_ids
+    placeholder = ", ".join(["?" for _ in range(len(tag_ids))])
+    return f"EXISTS (SELECT 1 FROM {t} WHERE {t}.{relation.key} = {column} " \
+           f"AND {t}.{relation.value} IN ({placeholder}))", tag_ids
+
+
+def _predicate(node, relation: Relation, column: str) -> Clause:
+    # True for the ids matching node
+    if isinstance(node, TagStats):
+        return tag_exists(relation, column, [node.id])
+    parts = []
+    args = []
+
+    def add(clause: Clause, template: str = "{}"):
+        parts.append(template.format(clause[0]))
+        args.extend(clause[1])
+
+    for term in node.required:
+        add(_predicate(term, relation, column))
+    if node.include:
+        any_parts = []
+        any_args = []
+        # Every included tag in one lookup
+        tag_ids = [term.id for term in node.include if isinstance(term, TagStats)]
+        if tag_ids:
+            clause, clause_args = tag_exists(relation, column, tag_ids)
+            any_parts.append(clause)
+            any_args.extend(clause_args)
+        for term in node.include:
+            if not isinstance(term, TagStats):
+                clause, clause_args = _predicate(term, relation, column)
+                any_parts.append(f"({clause})")
+                any_args.extend(clause_args)
+        add((" OR ".join(any_parts), any_args), "({})")
+    tag_ids = [term.id for term in node.exclude if isinstance(term, TagStats)]
+    if tag_ids:
+        add(tag_exists(relation, column, tag_ids), "NOT {}")
+    for term in node.exclude:
+        if not isinstance(term, TagStats):
+            add(_predicate(term, relation, column), "NOT ({})")
+    return " AND ".join(parts), args
+
+
+def _source(node, relation: Relation) -> Optional[Tuple[str, List[Any], int, Any]]:
+    # A (small) superset of the matching ids, its estimated size and the term it is drawn from; None if only a scan
+    #   will do
+    t = relation.table
+    if isinstance(node, TagStats):
+        return f"SELECT {t}.{relation.key} FROM {t} WHERE {t}.{relation.value} = ?", [node.id], node.count, node
+    if node.required:
+        # Every required term bounds the result; use the smallest
+        sources = [source for source in (_source(term, relation) for term in node.required) if source is not None]
+        return min(sources, key=lambda source: source[2]) if sources else None
+    if node.include:
+        # Any included term may match; every one of them has to be bounded
+        tag_ids = [term.id for term in node.include if isinstance(term, TagStats)]
+        selects = []
+        args = []
+        estimate = sum(term.count for term in node.include if isinstance(term, TagStats))
+        if tag_ids:
+            placeholder = ", ".join(["?" for _ in range(len(tag_ids))])
+            selects.append(f"SELECT {t}.{relation.key} FROM {t} WHERE {t}.{relation.value} IN ({placeholder})")
+            args.extend(tag_ids)
+        for term in node.include:
+            if isinstance(term, TagStats):
+                continue
+            source = _source(term, relation)
+            if source is None:
+                return None
+            selects.append(source[0])
+            args.extend(source[1])
+            estimate += source[2]
+        return " UNION ".join(selects), args, estimate, node
+    return None
+
+
+def _evaluate(node, index: TagIndex) -> Bitmap:
+    # The matching ids; the caller holds the index lock
+    if isinstance(node, TagStats):
+        return index.tag(node.id)
+    result = None
+    # Rarest first; the running intersection only shrinks
+    for term in sorted(node.required, key=lambda term: term.count if isinstance(term, TagStats) else float('inf')):
+        matches = _evaluate(term, index)
+        result = matches if result is None else result & matches
+        if not result:
+            return result
+    if node.include:
+        any_matches = None
+        for term in node.include:
+            matches = _evaluate(term, index)
+            any_matches = matches if any_matches is None else any_matches | matches
+        result = any_matches if result is None else result & any_matches
+    if result is None:
+        result = index.files
+    for term in node.exclude:
+        result = result - _evaluate(term, index)
+    return result
+
+
+def compile_search(cursor: Cursor, search: Optional[SearchQuery], relation: Relation, column: str,
+                   count: str = tag_queries.file_count) -> Optional[List[Clause]]:
+    """
+    Compiles the search into WHERE clauses (to AND together) matching 'column' against the ids in 'relation'.
+    'count' is the tag_count column of the relation (for picking the rarest tag).
+
+    Returns None if nothing can match, and an empty list if everything does.
+    """
+    if search is None:
+        return []
+    names = set()
+    _collect_names(search, names)
+    node = _resolve(search, tag_stats(cursor, names, count))
+    if node is FALSE:
+        return None
+    if node is TRUE:
+        return []
+
+    source = _source(node, relation)
+    if source is None:
+        return [_predicate(node, relation, column)]
+    sql, args, _, driver = source
+    # The source only bounds the result, unless it is the result; a required tag it is drawn from is implied
+    if isinstance(node, TagStats):
+        return [(f"{column} IN ({sql})", args)]
+    if driver is node and not node.exclude and all(isinstance(term, TagStats) for term in node.include):
+        return [(f"{column} IN ({sql})", args)]
+    if isinstance(driver, TagStats):
+        node = _Node([term for term in node.required if term is not driver], node.include, node.exclude)
+        if not node.required and not node.include and not node.exclude:
+            return [(f"{column} IN ({sql})", args)]
+    # Filtered on the join table's indexes alone; only matching rows of 'column's table are read
+    key = f"source.{relation.key}"
+    predicate, predicate_args = _predicate(node, relation, key)
+    return [(f"{column} IN (SELECT {key} FROM ({sql}) AS source WHERE {predicate})", args + predicate_args)]
+
+
+def _estimate(node, total: int) -> Tuple[float, int]:
+    # The fraction of the ids matching (tags taken as independent), and an upper bound on the number of matches
+    if isinstance(node, TagStats):
+        return min(1.0, node.count / total) if total else 0.0, node.count
+    fraction, bound = 1.0, total
+    for term in node.required:
+        term_fraction, term_bound = _estimate(term, total)
+        fraction, bound = fraction * term_fraction, min(bound, term_bound)
+    if node.include:
+        missed, include_bound = 1.0, 0
+        for term in node.include:
+            term_fraction, term_bound = _estimate(term, total)
+            missed, include_bound = missed * (1.0 - term_fraction), include_bound + term_bound
+        fraction, bound = fraction * (1.0 - missed), min(bound, include_bound)
+    for term in node.exclude:
+        fraction *= 1.0 - _estimate(term, total)[0]
+    return fraction, bound
+
+
+def estimate_search(cursor: Cursor, search: Optional[SearchQuery], total: int,
+                    count: str = tag_queries.file_count) -> Tuple[int, int]:
+    """
+    Estimates the matches of the search among 'total' ids from the tag counts alone; returns the estimate and an
+    upper bound (an exact count is cheap while the bound is small).
+    """
+    if search is None:
+        return total, total
+    names = set()
+    _collect_names(search, names)
+    node = _resolve(search, tag_stats(cursor, names, count))
+    if node is FALSE:
+        return 0, 0
+    if node is TRUE:
+        return total, total
+    fraction, bound = _estimate(node, total)
+    return min(round(fraction * total), bound), bound
+
+
+def search_index(cursor: Cursor, search: Optional[SearchQuery], index: TagIndex,
+                 count: str = tag_queries.file_count) -> Bitmap:
+    """
+    The ids matching the search, evaluated on the index's bitmaps; nothing is read but the tag counts.
+    """
+    names = set()
+    if search is not None:
+        _collect_names(search, names)
+    node = _resolve(search, tag_stats(cursor, names, count)) if search is not None else TRUE
+    with index.lock:
+        if node is FALSE:
+            return Bitmap()
+        # A copy; the result may be one of the index's own bitmaps
+        return (index.files if node is TRUE else _evaluate(node, index)).copy()
+
+
+def count_search(cursor: Cursor, search: Optional[SearchQuery], index: TagIndex,
+                 count: str = tag_queries.file_count) -> int:
+    """
+    Counts the matches of the search on the index's bitmaps; nothing is read but the tag counts.
+    """
+    names = set()
+    if search is not None:
+        _collect_names(search, names)
+    node = _resolve(search, tag_stats(cursor, names, count)) if search is not None else TRUE
+    with index.lock:
+        if node is FALSE:
+            return 0
+        if node is TRUE:
+            return len(index.files)
+        return len(_evaluate(node, index))
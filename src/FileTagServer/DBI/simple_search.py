@@ -1,16 +1,38 @@
-from typing import Tuple, Optional, List
+import json
+import time
+from sqlite3 import Cursor
+from typing import Optional, List, Set
 
 # SIMPLE BOOLEAN SEARCH
 # Allows and/or/not operations
 # assumes tags are do not have spaces
+#   e.g. 'cat +dog ~bird ~fish -sad'; a tag without an operator is required (AND)
+# Planned from the tag counts: the required tags (and the group of included tags) from the smallest posting list up,
+#   then the excluded tags; stops as soon as nothing is left
 
 from pydantic import BaseModel
+from starlette import status
+
+from FileTagServer.DBI.bitmap import Bitmap
+from FileTagServer.DBI.error import ApiError
+from FileTagServer.DBI.relations import Relation
+from FileTagServer.DBI.search import Clause, tag_stats, tag_exists
+from FileTagServer.DBI.tag import queries as tag_queries
+from FileTagServer.DBI.tag.index import TagIndex
 
 SEARCH_NOT = '-'
 SEARCH_AND = '+'
 SEARCH_OR = '~'
 SEARCH_DELIMITER = " "
 
+# How a step reads its tags; the posting lists (on the (tag_id, id) index), the candidates (on the (id, tag_id) index),
+#   or the bitmaps of a TagIndex
+STEP_SCAN = "scan"
+STEP_PROBE = "probe"
+STEP_INDEX = "index"
+# Left to the query (a NOT EXISTS per row) rather than collected; the excluded ids may be most of them
+STEP_FILTER = "filter"
+
 
 class SimpleSearchQuery(BaseModel):
     required: Optional[List[str]]
@@ -18,4 +40,168 @@ class SimpleSearchQuery(BaseModel):
     exclude: Optional[List[str]]
 
 
+class SimpleSearchStep(BaseModel):
+    # SEARCH_AND, SEARCH_OR (every included tag at once) or SEARCH_NOT
+    operation: str
+    tags: List[str]
+    # Unknown tags are left out
+    tag_ids: List[int]
+    # The (counted) uses of the tags
+    estimate: int
+    method: Optional[str] = None
+    # The ids left after the step; None if skipped (an earlier step left nothing)
+    matches: Optional[int] = None
+
+
+class SimpleSearchPlan(BaseModel):
+    steps: List[SimpleSearchStep]
+    # Nothing is required or included; the excluded tags are left to the query (as a filter)
+    negated: bool = False
+    plan_time: float = 0.0
+    execute_time: float = 0.0
+
+
+def parse(query: str) -> SimpleSearchQuery:
+    """
+    Parses a simple search string; raises an ApiError (400) if an operator has no tag.
+    """
+    required, include, exclude = [], [], []
+    for word in query.split(SEARCH_DELIMITER):
+        if not word:
+            continue
+        terms = {SEARCH_AND: required, SEARCH_OR: include, SEARCH_NOT: exclude}.get(word[0])
+        if terms is None:
+            required.append(word)
+            continue
+        if len(word) == 1:
+            raise ApiError(status.HTTP_400_BAD_REQUEST, f"Invalid search: '{word}' without a tag")
+        terms.append(word[1:])
+    return SimpleSearchQuery(required=required or None, include=include or None, exclude=exclude or None)
+
+
+def plan(cursor: Cursor, query: SimpleSearchQuery, count: str = tag_queries.file_count) -> SimpleSearchPlan:
+    """
+    Orders the steps of the search by the tag counts ('count' is the tag_count column of the searched relation).
+    """
+    start = time.perf_counter()
+    names = set(query.required or []).union(query.include or [], query.exclude or [])
+    tags = tag_stats(cursor, names, count)
+
+    def step(operation: str, names: List[str]) -> SimpleSearchStep:
+        known = [tags[name] for name in dict.fromkeys(names) if name in tags]
+        return SimpleSearchStep(operation=operation, tags=list(dict.fromkeys(names)),
+                                tag_ids=[tag.id for tag in known], estimate=sum(tag.count for tag in known))
+
+    # Smallest first; an unknown required tag (or only unknown included tags) counts 0 and ends the search at once
+    steps = [step(SEARCH_AND, [name]) for name in dict.fromkeys(query.required or [])]
+    if query.include:
+        steps.append(step(SEARCH_OR, query.include))
+    steps.sort(key=lambda s: s.estimate)
+    # Largest first; removes the most candidates before probing for the rest
+    exclude = [step(SEARCH_NOT, [name]) for name in dict.fromkeys(query.exclude or [])]
+    exclude = [s for s in exclude if s.tag_ids]
+    exclude.sort(key=lambda s: -s.estimate)
+    return SimpleSearchPlan(steps=steps + exclude, negated=not steps and bool(exclude),
+                            plan_time=time.perf_counter() - start)
+
+
+def __select(cursor: Cursor, relation: Relation, tag_ids: List[int], candidates: Optional[Set[int]] = None) -> Set[int]:
+    # The ids with any of the tags (among the candidates)
+    t = relation.table
+    placeholder = ", ".join(["?" for _ in range(len(tag_ids))])
+    sql = f"SELECT {t}.{relation.key} FROM {t} WHERE {t}.{relation.value} IN ({placeholder})"
+    args = list(tag_ids)
+    if candidates is not None:
+        sql += f" AND {t}.{relation.key} IN (SELECT value FROM json_each(?))"
+        args.append(json.dumps(list(candidates)))
+    cursor.execute(sql, args)
+    return {row[0] for row in cursor.fetchall()}
+
+
+def __execute_sql(cursor: Cursor, plan: SimpleSearchPlan, relation: Relation) -> Set[int]:
+    result = None
+    for step in plan.steps:
+        if result is not None and not result:
+            break
+        if not step.tag_ids:
+            step.method, step.matches = STEP_SCAN, 0
+            result = set()
+            continue
+        if result is None:
+            step.method = STEP_SCAN
+            result = __select(cursor, relation, step.tag_ids)
+        else:
+            # Whichever reads fewer rows; the posting lists, or the candidates' tags
+            step.method = STEP_PROBE if len(result) < step.estimate else STEP_SCAN
+            matches = __select(cursor, relation, step.tag_ids, result if step.method == STEP_PROBE else None)
+            result = result - matches if step.operation == SEARCH_NOT else result & matches
+        step.matches = len(result)
+    return result if result is not None else set()
+
+
+def execute_index(plan: SimpleSearchPlan, index: TagIndex) -> Bitmap:
+    """
+    Runs the plan on the index's bitmaps (recording what each step did); the matching ids.
+    """
+    start = time.perf_counter()
+    with index.lock:
+        # Only exclusions; every file but theirs
+        result = index.files if plan.negated else None
+        for step in plan.steps:
+            if result is not None and not result:
+                break
+            step.method = STEP_INDEX
+            matches = Bitmap()
+            for tag_id in step.tag_ids:
+                matches = matches | index.tag(tag_id)
+            if result is None:
+                result = matches
+            elif step.operation == SEARCH_NOT:
+                result = result - matches
+            else:
+                result = result & matches
+            step.matches = len(result)
+        # A copy; the result may be one of the index's own bitmaps
+        result = (index.files if result is None else result).copy()
+    plan.execute_time = time.perf_counter() - start
+    return result
+
+
+def execute(cursor: Cursor, plan: SimpleSearchPlan, relation: Relation, column: str) -> Optional[List[Clause]]:
+    """
+    Runs the plan (recording what each step did) into WHERE clauses matching 'column' against the ids in 'relation'.
+
+    Returns None if nothing can match, and an empty list if everything does.
+    """
+    if not plan.steps:
+        return []
+    start = time.perf_counter()
+    if plan.negated:
+        for step in plan.steps:
+            step.method = STEP_FILTER
+        clause, args = tag_exists(relation, column, [tag_id for step in plan.steps for tag_id in step.tag_ids])
+        plan.execute_time = time.perf_counter() - start
+        return [(f"NOT {clause}", args)]
+    ids = sorted(__execute_sql(cursor, plan, relation))
+    plan.execute_time = time.perf_counter() - start
+    if not ids:
+        return None
+    return [(f"{column} IN (SELECT value FROM json_each(?))", [json.dumps(ids)])]
+
+
+def describe(plan: SimpleSearchPlan) -> str:
+    """
+    A one line summary of the plan; e.g. '+a(3,scan)=3 -b(10,probe)=2 plan=0.10ms execute=0.20ms'.
 
+    Non-ascii names are escaped (so it may be sent as a header).
+    """
+    steps = []
+    for step in plan.steps:
+        names = SEARCH_OR.join(step.tags) if step.operation == SEARCH_OR else step.tags[0]
+        ran = step.method if step.method is not None else "skipped"
+        matches = f"={step.matches}" if step.matches is not None else ""
+        steps.append(f"{step.operation}{names}({step.estimate},{ran}){matches}")
+    if plan.negated:
+        steps.append("(negated)")
+    steps.append(f"plan={plan.plan_time * 1000:.2f}ms execute={plan.execute_time * 1000:.2f}ms")
+    return " ".join(steps).encode("ascii", "backslashreplace").decode("ascii")
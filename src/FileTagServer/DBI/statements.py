@@ -0,0 +1,107 @@
+import os
+import re
+import sys
+from os.path import join
+from sqlite3 import DatabaseError
+from typing import Dict, List, Tuple, Union
+
+from FileTagServer.DBI.pool import get_pool
+
+
+def find_sql_root():
+    # Lazy implimentation
+    # This is at src\FileTagServer\DBI\statements.py
+    # Therefore....
+    root = os.path.abspath(join(os.path.dirname(__file__), "..", "..", "..", "static", "sql"))
+    # Should be static\sql
+    return root
+
+
+sql_root = find_sql_root()
+
+
+class StatementRegistry:
+    """
+    Every '.sql' file under static/sql, read once and interned.
+
+    Statements are named by their path relative to the root, without the extension; e.g. 'file/exists'.
+    Because the same (interned) string is passed to sqlite every time, the connection's statement cache can hit.
+    """
+
+    # Statements with these markers are templates; they are completed (e.g. with replace) before being executed
+    template_markers = ["<", "{"]
+
+    def __init__(self, root: str):
+        self.root = root
+        self.__statements: Dict[str, str] = {}
+        self.__stripped: Dict[str, str] = {}
+
+    def load(self) -> 'StatementRegistry':
+        statements = {}
+        for dir_path, _, files in os.walk(self.root):
+            for file in files:
+                name, ext = os.path.splitext(file)
+                if ext != ".sql":
+                    continue
+                full_path = join(dir_path, file)
+                key = os.path.relpath(join(dir_path, name), self.root).replace(os.sep, "/")
+                with open(full_path, "r") as f:
+                    statements[key] = sys.intern(f.read().strip())
+        self.__statements = statements
+        self.__stripped = {k: sys.intern(v[:-1]) if v.endswith(";") else v for k, v in statements.items()}
+        return self
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.__statements.keys())
+
+    def get(self, name: str, strip_terminal: bool = False) -> str:
+        lookup = self.__stripped if strip_terminal else self.__statements
+        try:
+            return lookup[name]
+        except KeyError:
+            raise KeyError(f"No sql statement named '{name}' in '{self.root}'") from None
+
+    def is_template(self, name: str) -> bool:
+        sql = self.__statements[name]
+        return any(marker in sql for marker in self.template_markers)
+
+    @staticmethod
+    def placeholder_args(sql: str) -> Union[Dict[str, None], Tuple[None, ...]]:
+        # EXPLAIN still requires every parameter to be bound; NULLs are enough to prepare the statement
+        named = re.findall(r":(\w+)", sql)
+        if named:
+            return {name: None for name in named}
+        return (None,) * sql.count("?")
+
+    def validate(self, path: str = None) -> List[Tuple[str, str]]:
+        """
+        Prepares every (non-template) statement against the database with EXPLAIN.
+
+        Returns a list of (name, error) pairs; an empty list means every statement is valid.
+        """
+        errors = []
+        with get_pool(path).connection() as conn:
+            for name in sorted(self.__statements):
+                if self.is_template(name):
+                    continue
+                try:
+                    sql = self.__stripped[name]
+                    conn.execute(f"EXPLAIN {sql}", self.placeholder_args(sql)).fetchall()
+                except DatabaseError as e:
+                    errors.append((name, str(e)))
+        return errors
+
+
+statements = StatementRegistry(sql_root).load()
+
+
+def get_sql(name: str, strip_terminal: bool = False) -> str:
+    return statements.get(name, strip_terminal)
+
+
+def validate_statements(path: str = None):
+    errors = statements.validate(path)
+    if errors:
+        details = "\n".join(f"\t{name}: {error}" for name, error in errors)
+        raise ValueError(f"Invalid sql statement(s) in '{statements.root}':\n{details}")
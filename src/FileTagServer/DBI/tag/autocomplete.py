@@ -0,0 +1,216 @@
+import heapq
+import os
+import sys
+import time
+from sqlite3 import Connection, Cursor
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+
+from FileTagServer import config
+from FileTagServer.DBI.changes import outside_changes
+from FileTagServer.DBI.common import _connect
+from FileTagServer.DBI.pool import data_listeners
+from FileTagServer.DBI.tag import queries
+
+# TAG AUTOCOMPLETE
+# Matches tag names containing the typed text (case-insensitive), most used first
+#   Every 1-3 character substring of a name is indexed; a text of up to 3 characters is a single lookup,
+#   a longer text intersects the sets of its trigrams and checks the (few) names left
+
+GRAM = 3
+
+
+def _fold(name: str) -> str:
+    return name.casefold()
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[start:start + size] for size in range(1, GRAM + 1) for start in range(len(text) - size + 1)}
+
+
+class TagAutocomplete:
+    """
+    The names & usage counts of every tag, indexed by substring.
+
+    Names are kept in sync by the DBI functions that create, rename or delete tags, and it is dropped (to be rebuilt on
+    next use) once another process changes a tag (see DBI.changes). Counts, which change with every file or folder
+    tagged, are reloaded once config.tag_autocomplete_refresh seconds old.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.names: Dict[int, str] = {}
+        self.counts: Dict[int, int] = {}
+        self.grams: Dict[str, Set[int]] = {}
+        # Every id, most used first
+        self.ranked: List[int] = []
+        self.loaded = 0.0
+        # The outside change count of tags it was built at
+        self.changes: Optional[int] = None
+
+    @classmethod
+    def build(cls, conn: Connection, cursor: Cursor) -> 'TagAutocomplete':
+        autocomplete = cls()
+        # A single read transaction; the names and the change count are of the same commit
+        if not conn.in_transaction:
+            cursor.execute("BEGIN")
+        cursor.execute(f"SELECT tag.id, tag.name, {queries.total_count} FROM tag {' '.join(queries.joins)}")
+        for id, name, count in cursor.fetchall():
+            autocomplete.__add(id, name)
+            autocomplete.counts[id] = count or 0
+        autocomplete.changes = outside_changes(conn).get('tag')
+        autocomplete.__rank()
+        autocomplete.loaded = time.monotonic()
+        return autocomplete
+
+    def refresh_counts(self, cursor: Cursor):
+        cursor.execute(f"SELECT tag_count.tag_id, {queries.total_count} FROM tag_count")
+        counts = {id: count or 0 for id, count in cursor.fetchall()}
+        with self.lock:
+            self.counts = {id: counts.get(id, 0) for id in self.names}
+            self.__rank()
+            self.loaded = time.monotonic()
+
+    def __add(self, id: int, name: Optional[str]):
+        if name is None:
+            return
+        self.names[id] = name
+        folded = _fold(name)
+        for gram in _grams(folded):
+            self.grams.setdefault(gram, set()).add(id)
+
+    def __remove(self, id: int):
+        name = self.names.pop(id, None)
+        if name is None:
+            return
+        folded = _fold(name)
+        for gram in _grams(folded):
+            ids = self.grams.get(gram)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.grams[gram]
+
+    def __rank(self):
+        self.ranked = sorted(self.names, key=lambda id: (-self.counts.get(id, 0), self.names[id]))
+
+    def add_tag(self, id: int, name: Optional[str]):
+        # Also renames the tag; a new tag is unused, so it is ranked last (exactly, once the counts are reloaded)
+        with self.lock:
+            known = id in self.names
+            self.__remove(id)
+            self.__add(id, name)
+            if name is None:
+                if known:
+                    self.ranked.remove(id)
+            elif not known:
+                self.counts.setdefault(id, 0)
+                self.ranked.append(id)
+
+    def remove_tag(self, id: int):
+        with self.lock:
+            if id in self.names:
+                self.ranked.remove(id)
+            self.__remove(id)
+            self.counts.pop(id, None)
+
+    def stale(self) -> bool:
+        return time.monotonic() - self.loaded > config.tag_autocomplete_refresh
+
+    def __matches(self, text: str) -> Set[int]:
+        if len(text) <= GRAM:
+            return self.grams.get(text, set())
+        grams = sorted((self.grams.get(gram, set()) for gram in _grams(text) if len(gram) == GRAM), key=len)
+        ids = set(grams[0]).intersection(*grams[1:]) if grams[0] else set()
+        # Having every trigram does not make it a substring; e.g. 'abcdbc' has those of 'abcbc'
+        return {id for id in ids if text in _fold(self.names[id])}
+
+    def complete(self, text: str, limit: int) -> List[Tuple[int, str]]:
+        """
+        The (id, name) of the most used tags containing text, up to limit.
+        """
+        text = _fold(text)
+        with self.lock:
+            if not text:
+                ids = self.ranked[:limit]
+            else:
+                matches = self.__matches(text)
+                if len(matches) * 4 > len(self.ranked):
+                    # Most tags match; the first matching ones in rank order
+                    ids = []
+                    for id in self.ranked:
+                        if id in matches:
+                            ids.append(id)
+                            if len(ids) == limit:
+                                break
+                else:
+                    ids = heapq.nsmallest(limit, matches, key=lambda id: (-self.counts.get(id, 0), self.names[id]))
+            return [(id, self.names[id]) for id in ids]
+
+
+__autocompletes: Dict[str, TagAutocomplete] = {}
+__autocompletes_lock = Lock()
+
+
+def __key(path: Optional[str]) -> str:
+    path = path or config.db_path
+    return path if path == ":memory:" else os.path.abspath(path)
+
+
+def find_tag_autocomplete(path: str = None) -> Optional[TagAutocomplete]:
+    """
+    The autocomplete of the database if it has been built; for keeping it in sync.
+    """
+    return __autocompletes.get(__key(path))
+
+
+def rebuild_tag_autocomplete(path: str = None) -> TagAutocomplete:
+    """
+    (Re)builds the autocomplete of the database from tag & tag_count; replaces the previous one once built.
+    """
+    with _connect(path) as (conn, cursor):
+        autocomplete = TagAutocomplete.build(conn, cursor)
+    with __autocompletes_lock:
+        __autocompletes[__key(path)] = autocomplete
+    return autocomplete
+
+
+def get_tag_autocomplete(path: str = None) -> TagAutocomplete:
+    """
+    The autocomplete of the database; built on first use (or once dropped), its counts reloaded once stale.
+    """
+    autocomplete = find_tag_autocomplete(path)
+    if autocomplete is None:
+        return rebuild_tag_autocomplete(path)
+    if autocomplete.stale():
+        with _connect(path) as (conn, cursor):
+            # The checkout may have dropped it (see __check_autocomplete)
+            if find_tag_autocomplete(path) is not autocomplete:
+                return rebuild_tag_autocomplete(path)
+            autocomplete.refresh_counts(cursor)
+    return autocomplete
+
+
+def __check_autocomplete(path: str, conn: Connection, outside: Dict[str, int]):
+    # A data listener (see pool); only another process's tag changes drop it, not its file & folder tags
+    key = __key(path)
+    with __autocompletes_lock:
+        autocomplete = __autocompletes.get(key)
+        if autocomplete is not None and autocomplete.changes != outside.get('tag'):
+            del __autocompletes[key]
+
+
+data_listeners.append(__check_autocomplete)
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.DBI.tag.autocomplete ../local.db cat'
+    db_path = sys.argv[1] if len(sys.argv) > 1 else None
+    start = time.perf_counter()
+    autocomplete = get_tag_autocomplete(db_path)
+    print(f"Indexed {len(autocomplete.names)} tag(s) in {time.perf_counter() - start:.3f}s")
+    for arg in sys.argv[2:]:
+        start = time.perf_counter()
+        results = autocomplete.complete(arg, config.tag_autocomplete_limit)
+        elapsed = time.perf_counter() - start
+        print(f"{arg} => {', '.join(name for _, name in results)} ({elapsed * 1000:.3f}ms)")
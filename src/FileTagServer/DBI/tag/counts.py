@@ -0,0 +1,51 @@
+import sys
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from FileTagServer.DBI.common import _connect
+from FileTagServer.DBI.tag import queries
+
+
+class TagCountError(BaseModel):
+    tag_id: int
+    # Stored in tag_count (None if missing)
+    file_count: Optional[int] = None
+    folder_count: Optional[int] = None
+    # Counted from file_tag/folder_tag (None if the tag no longer exists)
+    actual_file_count: Optional[int] = None
+    actual_folder_count: Optional[int] = None
+
+
+def check_tag_counts(path: str = None) -> List[TagCountError]:
+    """
+    Compares tag_count against the join tables; an empty list means every count is exact.
+    """
+    with _connect(path) as (conn, cursor):
+        cursor.execute(queries.select_count_errors)
+        return [TagCountError(**dict(row)) for row in cursor.fetchall()]
+
+
+def rebuild_tag_counts(path: str = None) -> int:
+    """
+    Recounts every tag from the join tables. Returns the number of tags counted.
+    """
+    with _connect(path) as (conn, cursor):
+        cursor.execute(queries.delete_counts)
+        cursor.execute(queries.rebuild_counts)
+        count = cursor.rowcount
+        conn.commit()
+        return count
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.DBI.tag.counts ../local.db [--rebuild]'
+    args = [arg for arg in sys.argv[1:] if arg != "--rebuild"]
+    db_path = args[0] if len(args) > 0 else None
+    errors = check_tag_counts(db_path)
+    for error in errors:
+        print(f"Tag '{error.tag_id}': stored ({error.file_count}, {error.folder_count})"
+              f" != actual ({error.actual_file_count}, {error.actual_folder_count})")
+    print(f"Found {len(errors)} incorrect tag count(s)")
+    if "--rebuild" in sys.argv[1:]:
+        print(f"Rebuilt {rebuild_tag_counts(db_path)} tag count(s)")
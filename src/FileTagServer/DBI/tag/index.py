@@ -0,0 +1,261 @@
+import json
+import os
+import sys
+import time
+from sqlite3 import Connection, Cursor
+from threading import Lock, Thread
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from pydantic import BaseModel
+
+from FileTagServer import config
+from FileTagServer.DBI.bitmap import Bitmap
+from FileTagServer.DBI.cache import bump_write_generation
+from FileTagServer.DBI.changes import outside_changes
+from FileTagServer.DBI.common import _connect, fetch_batches
+from FileTagServer.DBI.pool import data_listeners
+
+# The outside change counts (see DBI.changes) of what the index holds; files added or removed, and file tags
+Changes = Tuple[Optional[int], Optional[int]]
+
+
+def _changes(outside: Dict[str, int]) -> Changes:
+    return outside.get('file'), outside.get('file_tag')
+
+
+class TagIndexUsage(BaseModel):
+    files: int
+    tags: int
+    # file_tag rows
+    edges: int
+    # Bytes of stored ids (bitmaps and arrays)
+    bytes: int
+    # Seconds spent by the last (re)build
+    build_time: float
+
+
+class TagIndex:
+    """
+    A bitmap of file ids per tag; kept in sync by the DBI functions, rebuilt when another process writes.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.files = Bitmap()
+        self.tags: Dict[int, Bitmap] = {}
+        self.build_time = 0.0
+        # As of the build; writes by this process do not change them
+        self.changes: Changes = (None, None)
+
+    @classmethod
+    def build(cls, cursor: Cursor) -> 'TagIndex':
+        index = cls()
+        start = time.perf_counter()
+        cursor.execute("SELECT id FROM file")
+        file_ids = []
+        for rows in fetch_batches(cursor):
+            file_ids.extend(row[0] for row in rows)
+        index.files = Bitmap(file_ids)
+        # One JSON array of file ids per tag
+        cursor.execute("SELECT tag_id, json_group_array(file_id) FROM file_tag GROUP BY tag_id")
+        for rows in fetch_batches(cursor):
+            for tag_id, file_ids in rows:
+                index.tags[tag_id] = Bitmap(json.loads(file_ids))
+        index.build_time = time.perf_counter() - start
+        return index
+
+    def add_file(self, file_id: int):
+        with self.lock:
+            self.files.add(file_id)
+
+    def remove_file(self, file_id: int, tag_ids: Iterable[int]):
+        # tag_ids are the tags the file had
+        with self.lock:
+            self.files.discard(file_id)
+            for tag_id in tag_ids:
+                self.__discard(tag_id, file_id)
+
+    def add_file_tags(self, file_id: int, tag_ids: Iterable[int]):
+        with self.lock:
+            for tag_id in tag_ids:
+                bitmap = self.tags.get(tag_id)
+                if bitmap is None:
+                    bitmap = self.tags[tag_id] = Bitmap()
+                bitmap.add(file_id)
+
+    def remove_file_tags(self, file_id: int, tag_ids: Iterable[int]):
+        with self.lock:
+            for tag_id in tag_ids:
+                self.__discard(tag_id, file_id)
+
+    def remove_tag(self, tag_id: int):
+        with self.lock:
+            self.tags.pop(tag_id, None)
+
+    def __discard(self, tag_id: int, file_id: int):
+        bitmap = self.tags.get(tag_id)
+        if bitmap is not None:
+            bitmap.discard(file_id)
+            if not bitmap.chunks:
+                del self.tags[tag_id]
+
+    def tag(self, tag_id: int) -> Bitmap:
+        # Shared with the index; only read it while holding the lock
+        return self.tags.get(tag_id) or Bitmap()
+
+    def usage(self) -> TagIndexUsage:
+        with self.lock:
+            return TagIndexUsage(files=len(self.files), tags=len(self.tags),
+                                 edges=sum(len(bitmap) for bitmap in self.tags.values()),
+                                 bytes=self.files.nbytes() + sum(bitmap.nbytes() for bitmap in self.tags.values()),
+                                 build_time=self.build_time)
+
+
+class TagIndexJournal:
+    """
+    Stands in for an index while it is built; writes go to the previous index (if any), and are replayed on the new
+    one, which may have read the database before they were committed. Once replayed, writes go to the new index.
+    """
+
+    def __init__(self, previous: Optional[TagIndex]):
+        self.lock = Lock()
+        self.previous = previous
+        self.index: Optional[TagIndex] = None
+        self.writes: List[Tuple[str, tuple]] = []
+
+    def __write(self, method: str, *args):
+        with self.lock:
+            if self.index is not None:
+                getattr(self.index, method)(*args)
+                return
+            self.writes.append((method, args))
+            if self.previous is not None:
+                getattr(self.previous, method)(*args)
+
+    def add_file(self, file_id: int):
+        self.__write('add_file', file_id)
+
+    def remove_file(self, file_id: int, tag_ids: Iterable[int]):
+        self.__write('remove_file', file_id, list(tag_ids))
+
+    def add_file_tags(self, file_id: int, tag_ids: Iterable[int]):
+        self.__write('add_file_tags', file_id, list(tag_ids))
+
+    def remove_file_tags(self, file_id: int, tag_ids: Iterable[int]):
+        self.__write('remove_file_tags', file_id, list(tag_ids))
+
+    def remove_tag(self, tag_id: int):
+        self.__write('remove_tag', tag_id)
+
+    def replay(self, index: TagIndex):
+        # Every write is idempotent; those the build already read are applied again
+        with self.lock:
+            for method, args in self.writes:
+                getattr(index, method)(*args)
+            self.writes = []
+            self.index = index
+
+
+__indexes: Dict[str, TagIndex] = {}
+__indexes_lock = Lock()
+# Of the indexes being built
+__journals: Dict[str, TagIndexJournal] = {}
+# One build at a time
+__build_lock = Lock()
+# Keys of the indexes being rebuilt in the background
+__rebuilding: Set[str] = set()
+
+
+def __key(path: Optional[str]) -> str:
+    path = path or config.db_path
+    return path if path == ":memory:" else os.path.abspath(path)
+
+
+def get_tag_index(path: str = None) -> Optional[TagIndex]:
+    # None until built; searches then use SQL
+    return __indexes.get(__key(path))
+
+
+def find_tag_index(path: str = None) -> Optional[Union[TagIndex, TagIndexJournal]]:
+    """
+    The index of the database (or, while one is built, its journal); for keeping it in sync after a commit.
+    """
+    key = __key(path)
+    return __journals.get(key) or __indexes.get(key)
+
+
+def rebuild_tag_index(path: str = None) -> TagIndex:
+    key = __key(path)
+    with __build_lock:
+        journal = TagIndexJournal(__indexes.get(key))
+        with __indexes_lock:
+            __journals[key] = journal
+        try:
+            with _connect(path) as (conn, cursor):
+                # A single read transaction; the ids and the change counts are of the same commit
+                if not conn.in_transaction:
+                    cursor.execute("BEGIN")
+                index = TagIndex.build(cursor)
+                index.changes = _changes(outside_changes(conn))
+            with __indexes_lock:
+                journal.replay(index)
+                __indexes[key] = index
+        finally:
+            with __indexes_lock:
+                __journals.pop(key, None)
+    bump_write_generation()
+    return index
+
+
+def __in_sync(conn: Connection, index: TagIndex) -> bool:
+    return index.changes == _changes(outside_changes(conn))
+
+
+def __rebuild_in_background(path: str):
+    key = __key(path)
+
+    def rebuild():
+        try:
+            while True:
+                time.sleep(config.tag_index_rebuild_delay)
+                index = rebuild_tag_index(path)
+                # Other processes may have written during the build
+                with _connect(path) as (conn, cursor):
+                    if __in_sync(conn, index):
+                        break
+                with __indexes_lock:
+                    if __indexes.get(key) is index:
+                        del __indexes[key]
+        finally:
+            with __indexes_lock:
+                __rebuilding.discard(key)
+
+    with __indexes_lock:
+        if key in __rebuilding:
+            return
+        __rebuilding.add(key)
+        __indexes.pop(key, None)
+    Thread(target=rebuild, name="tag-index-rebuild", daemon=True).start()
+
+
+def __check_index(path: str, conn: Connection, outside: Dict[str, int]):
+    # A data listener (see pool); searches use SQL until the index is rebuilt
+    index = __indexes.get(__key(path))
+    if index is not None and index.changes != _changes(outside):
+        __rebuild_in_background(path)
+
+
+data_listeners.append(__check_index)
+
+
+def drop_tag_indexes():
+    with __indexes_lock:
+        __indexes.clear()
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.DBI.tag.index ../local.db'; the servers build their own index on startup
+    db_path = sys.argv[1] if len(sys.argv) > 1 else None
+    usage = rebuild_tag_index(db_path).usage()
+    print(f"Indexed {usage.files} file(s) and {usage.edges} file tag(s) in {usage.tags} bitmap(s)")
+    print(f"Built in {usage.build_time:.3f}s; {usage.bytes / 1024 / 1024:.2f}MB of ids")
@@ -1,19 +1,25 @@
 from http import HTTPStatus
-from sqlite3 import Cursor, DatabaseError, IntegrityError
-from typing import Optional, List
+from sqlite3 import Cursor, IntegrityError
+from typing import Optional, List, Iterator
 
 # from litespeed.error import ResponseError
 from pydantic import BaseModel, validator
 
+from FileTagServer import config
+from FileTagServer.DBI.counts import Count, count_table
 from FileTagServer.DBI.error import ApiError
-from src.FileTagServer.DBI.common import SortQuery, validate_fields, _connect, row_to_tag, Util, AutoComplete, \
-    read_sql_file
-from src.FileTagServer.DBI.old_models import Tag
+from FileTagServer.DBI.statements import get_sql
+from FileTagServer.DBI.common import SortQuery, validate_fields, _connect, row_to_tag, Util, AutoComplete, \
+    fetch_batches
+from FileTagServer.DBI.old_models import Tag
+from FileTagServer.DBI.tag import queries as tag_queries
+from FileTagServer.DBI.tag.autocomplete import find_tag_autocomplete, get_tag_autocomplete
+from FileTagServer.DBI.tag.index import find_tag_index
 
 
 def __exists(cursor: Cursor, id: int) -> bool:
-    sql = read_sql_file("../static/sql/tag/exists.sql")
-    cursor.execute(sql, str(id))
+    sql = get_sql("tag/exists")
+    cursor.execute(sql, (id,))
     row = cursor.fetchone()
     return row[0] == 1
 
@@ -81,28 +87,37 @@ class FullModifyTagQuery(ModifyTagQuery):
     id: int
 
 
+def iter_tags(path: str, query: TagsQuery) -> Iterator[Tag]:
+    """
+    Streams the tags (a batch of rows at a time); the connection is held until exhausted or closed.
+    """
+    include = set(query.fields) if query.fields is not None else None
+    # Only the requested fields (and the sort's) are selected
+    selected = include.union(part.field for part in query.sort or []) if include is not None else None
+    builder = tag_queries.select_builder(selected)
+    if query.sort is not None:
+        builder.order_by(*[part.sql() for part in query.sort])
+
+    with _connect(path, shared=False) as (conn, cursor):
+        sql, args = builder.build()
+        cursor.execute(sql, args)
+        for rows in fetch_batches(cursor):
+            for row in rows:
+                yield row_to_tag(row, include)
+
+
 def get_tags(path:str,query: TagsQuery) -> List[Tag]:
-    with _connect(path) as (conn, cursor):
-        get_files_sql = read_sql_file("../static/sql/tag/select.sql", True)
-        # SORT
-        if query.sort is not None:
-            sort_query = "ORDER BY " + SortQuery.list_sql(query.sort)
-        else:
-            sort_query = ''
-
-        sql = f"{get_files_sql} {sort_query}"
-        cursor.execute(sql)
-        rows = cursor.fetchall()
-        results = [row_to_tag(row) for row in rows]
-        if query.fields is not None:
-            results = Util.copy(results, include=set(query.fields))
-        return results
+    return list(iter_tags(path, query))
+
+
+def count_tags(path: str) -> Count:
+    return count_table(path, "tag")
 
 
 def get_tag_from_id(path:str,query: TagIdQuery) -> Tag:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/tag/select_by_id.sql")
-        cursor.execute(sql, str(query.id))
+        sql = get_sql("tag/select_by_id")
+        cursor.execute(sql, (query.id,))
         rows = cursor.fetchall()
         if len(rows) < 1:
             raise ApiError(HTTPStatus.NOT_FOUND, f"No tag found with the given id: '{query.id}'")
@@ -117,7 +132,7 @@ def get_tag_from_id(path:str,query: TagIdQuery) -> Tag:
 
 def get_tag_from_name(path:str,query: TagNameQuery) -> Tag:
     with _connect(path) as (conn, cursor):
-        sql = read_sql_file("../static/sql/tag/select_by_name.sql")
+        sql = get_sql("tag/select_by_name")
         cursor.execute(sql, (str(query.name),))
         rows = cursor.fetchall()
         if len(rows) < 1:
@@ -133,11 +148,14 @@ def get_tag_from_name(path:str,query: TagNameQuery) -> Tag:
 def create_tag(path:str,query: CreateTagQuery) -> Tag:
     try:
         with _connect(path) as (conn, cursor):
-            sql = read_sql_file("../static/sql/tag/insert.sql")
+            sql = get_sql("tag/insert")
             cursor.execute(sql, query.dict(include={'name', 'description'}))
             id = cursor.lastrowid
             conn.commit()
-            return Tag(id=id, name=query.name, description=query.description)
+        autocomplete = find_tag_autocomplete(path)
+        if autocomplete is not None:
+            autocomplete.add_tag(id, query.name)
+        return Tag(id=id, name=query.name, description=query.description)
     except IntegrityError as e:
         raise ApiError(409, str(e))
 
@@ -155,16 +173,22 @@ def delete_tag(path:str,query: DeleteTagQuery) -> bool:
     with _connect(path) as (conn, cursor):
         if not __exists(cursor, query.id):
             raise ApiError(HTTPStatus.NOT_FOUND, f"No tag found with the given id: '{query.id}'")
-        sql = read_sql_file("../static/sql/tag/delete_by_id.sql")
-        cursor.execute(sql, str(query.id))
+        sql = get_sql("tag/delete_by_id")
+        cursor.execute(sql, (query.id,))
         conn.commit()
+    index = find_tag_index(path)
+    if index is not None:
+        index.remove_tag(query.id)
+    autocomplete = find_tag_autocomplete(path)
+    if autocomplete is not None:
+        autocomplete.remove_tag(query.id)
     return True
 
 
 def set_tag(path:str,query: FullSetTagQuery) -> bool:
     try:
         # Read sql
-        sql = read_sql_file("../static/sql/tag/update.sql")
+        sql = get_sql("tag/update")
         # connect to database
         with _connect(path) as (conn, cursor):
             # If id doesnt exist raise an error (Not Found)
@@ -172,7 +196,10 @@ def set_tag(path:str,query: FullSetTagQuery) -> bool:
                 raise ApiError(HTTPStatus.NOT_FOUND)
             cursor.execute(sql, query.dict())
             conn.commit()
-            return True
+        autocomplete = find_tag_autocomplete(path)
+        if autocomplete is not None:
+            autocomplete.add_tag(query.id, query.name)
+        return True
     # On database error (Integrity error specifically) raise Conflict Response
     except IntegrityError as e:
         raise ApiError(HTTPStatus.CONFLICT, str(e))
@@ -184,7 +211,7 @@ def modify_tag(path:str,query: FullModifyTagQuery) -> bool:
     # Create sql parts from the args
     parts: List[str] = [f"{key} = :{key}" for key in json]
     # Form full query
-    sql = f"UPDATE file SET {', '.join(parts)} WHERE id = :id"
+    sql = f"UPDATE tag SET {', '.join(parts)} WHERE id = :id"
     # Add id back to sql args
     json['id'] = query.id
     # Connect to db
@@ -193,33 +220,22 @@ def modify_tag(path:str,query: FullModifyTagQuery) -> bool:
         if not __exists(cursor, query.id):
             raise ApiError(HTTPStatus.NOT_FOUND)
         # Execute query & save
-        cursor.execute(query, sql)
+        cursor.execute(sql, json)
         conn.commit()
-        return True
+    autocomplete = find_tag_autocomplete(path)
+    if autocomplete is not None and 'name' in json:
+        autocomplete.add_tag(query.id, json['name'])
+    return True
 
 
-def autocomplete_tag(path:str,name: str) -> List[AutoComplete]:
+def autocomplete_tag(path: str, name: str, limit: Optional[int] = None) -> List[AutoComplete]:
     """
-    Fetches a list of Autocomplete pairs for the tags.
+    Fetches a list of Autocomplete pairs for the tags containing name; the most used first.
     """
     # if name is none;
     if name is None:
         return []
-    # escape character for sql
-    escape_char = "/"
-    try:
-        with _connect(path) as (conn, cursor):
-            sql = read_sql_file(
-                "../static/sql/tag/autocomplete.sql")  # I do this to fix sql-mistakes on the fly, and for reusability
-            # First, escape the escape character (we have to do this first)
-            # Then escape the '%' wildcard
-            # Lastly escape the '_' wildcard
-            escaped = name.replace(escape_char, escape_char * 2).replace("%", f"{escape_char}%").replace("_",
-                                                                                                         f"{escape_char}_")
-            # our query expects the escaped name and the escape character used (in case a different one is required)
-            cursor.execute(sql, [f"%{escaped}%", escape_char])
-            # I arbitrarily replace spaces with '_' for autocomplete
-            return [AutoComplete(value=row['name'].replace(" ", "_"), label=row['name']) for row in cursor.fetchall()]
-    except DatabaseError as e:
-        print(e)
-        raise  # TODO figure out how to handle an err for autocomplete
+    limit = limit if limit is not None else config.tag_autocomplete_limit
+    # I arbitrarily replace spaces with '_' for autocomplete
+    return [AutoComplete(value=tag_name.replace(" ", "_"), label=tag_name)
+            for _, tag_name in get_tag_autocomplete(path).complete(name, limit)]
@@ -1,6 +1,29 @@
-select = """SELECT tag.id, tag.name, tag.description, file_count + folder_count as count FROM tag
-LEFT JOIN (SELECT COUNT(tag.id) as file_count from tag left join file_tag on tag.id = file_tag.tag_id GROUP by tag.id) ON tag.id = tag.id
-LEFT JOIN (SELECT COUNT(tag.id) as folder_count from tag left join folder_tag on tag.id = folder_tag.tag_id GROUP by tag.id) ON tag.id = tag.id"""
+from typing import Optional, Iterable
+
+from FileTagServer.DBI.query_builder import QueryBuilder
+
+# The 'count' of a tag; used by everything, or only by files
+total_count = "tag_count.file_count + tag_count.folder_count"
+file_count = "tag_count.file_count"
+
+columns = ["tag.id", "tag.name", "tag.description", f"{total_count} as count"]
+joins = ["LEFT JOIN tag_count ON tag_count.tag_id = tag.id"]
+
+
+def select_builder(fields: Optional[Iterable[str]] = None, count: str = total_count) -> QueryBuilder:
+    """
+    Selects only the columns of the given fields (every column if None); the id is always selected.
+
+    tag_count is only joined when the count is selected.
+    """
+    fields = {'id', 'name', 'description', 'count'} if fields is None else set(fields)
+    selected = [f"tag.{field}" for field in ['id', 'name', 'description'] if field == 'id' or field in fields]
+    if 'count' not in fields:
+        return QueryBuilder("tag", selected, [])
+    return QueryBuilder("tag", selected + [f"{count} as count"], joins)
+
+
+select = select_builder().sql()
 
 create = """CREATE TABLE IF NOT EXISTS tag(
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -9,4 +32,19 @@ create = """CREATE TABLE IF NOT EXISTS tag(
     CONSTRAINT name_unique UNIQUE (name)
 )"""
 
-select_by_ids = f"""{select} WHERE tag.id in ({{tag_ids}})"""
+
+# tag_count is maintained by triggers (see migrations); these recount it from the join tables
+count_actual = """SELECT tag.id as tag_id,
+(SELECT COUNT(*) FROM file_tag WHERE file_tag.tag_id = tag.id) as file_count,
+(SELECT COUNT(*) FROM folder_tag WHERE folder_tag.tag_id = tag.id) as folder_count FROM tag"""
+
+delete_counts = """DELETE FROM tag_count"""
+rebuild_counts = f"""INSERT INTO tag_count (tag_id, file_count, folder_count) {count_actual}"""
+
+# Tags whose stored counts are missing or wrong, and counts left behind by deleted tags
+select_count_errors = f"""SELECT actual.tag_id, tag_count.file_count, tag_count.folder_count, actual.file_count as actual_file_count, actual.folder_count as actual_folder_count FROM ({count_actual}) as actual
+LEFT JOIN tag_count ON tag_count.tag_id = actual.tag_id
+WHERE tag_count.file_count IS NOT actual.file_count OR tag_count.folder_count IS NOT actual.folder_count
+UNION ALL
+SELECT tag_count.tag_id, tag_count.file_count, tag_count.folder_count, NULL, NULL FROM tag_count
+WHERE tag_count.tag_id NOT IN (SELECT id FROM tag)"""
@@ -1,6 +1,6 @@
 from typing import List
 
-from FileTagServer.DBI.common import replace_kwargs, AbstractDBI
+from FileTagServer.DBI.common import AbstractDBI
 from FileTagServer.DBI.models import Tag
 from FileTagServer.DBI.tag import queries
 
@@ -13,8 +13,7 @@ class TagDBI(AbstractDBI):
             tag_ids = list(tag_ids)
 
         with self.connect() as (conn, cursor):
-            sql_placeholder = ", ".join(["?" for _ in range(len(tag_ids))])
-            sql = replace_kwargs(queries.select_by_ids, tag_ids=sql_placeholder)
-            cursor.execute(sql, tag_ids)
+            sql, args = queries.select_builder().where_in("tag.id", tag_ids).build()
+            cursor.execute(sql, args)
             rows = cursor.fetchall()
-            return [Tag(**dict(row)) for row in rows]
+            return [Tag.from_row(row) for row in rows]
@@ -67,13 +67,14 @@ class WebConverter:
             tags.sort()
         kwargs = folder.dict(exclude={"files", "folders", "tags"})
 
-        return WebFolder(
+        # Built from models which came from the database; nothing to validate
+        return WebFolder.from_row(
+            kwargs,
             page=reformat(self.folder_route, folder_id=folder.id),
             icon=self.folder_icon(),
             files=None,  # [self.file(file, tag_lookup) for file in folder.f]
             folders=None,
             tags=tags,
-            **kwargs
         )
 
     def file(self, file: File, tag_lookup: Dict[int, 'WebTag'] = None) -> 'WebFile':
@@ -82,16 +83,16 @@ class WebConverter:
             tags.sort(key=lambda tag: tag.name)
 
         kwargs = file.dict(exclude={"tags"})
-        return WebFile(
+        return WebFile.from_row(
+            kwargs,
             page=reformat(self.file_route, file_id=file.id),
             icon=self.file_icon(file.mime),
             tags=tags,
-            **kwargs
         )
 
     def tag(self, tag: Tag) -> 'WebTag':
         kwargs = tag.dict()
-        return WebTag(
+        return WebTag.from_row(
+            kwargs,
             page=reformat(self.tag_route, tag_id=tag.id),
-            **kwargs,
         )
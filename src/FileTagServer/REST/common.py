@@ -1,13 +1,67 @@
+from itertools import chain
 from os.path import join
+from typing import Iterable, Iterator, Optional
 
 from fastapi import FastAPI
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_oauth2_redirect_html, get_swagger_ui_html
-from starlette.responses import HTMLResponse
+from pydantic import BaseModel
+from starlette import status
+from starlette.responses import HTMLResponse, StreamingResponse, JSONResponse
 from starlette.staticfiles import StaticFiles
 from pystache import renderer
 
 rest_api = FastAPI(docs_url=None, redoc_url=None)
 
+# Streamed responses; '?stream=ndjson' writes one json object per line, '?stream=json' writes a json array
+stream_media_types = {
+    'ndjson': "application/x-ndjson",
+    'json': "application/json",
+}
+stream_chunk_size = 64 * 1024
+
+
+def __encode_stream(models: Iterable[BaseModel], ndjson: bool, **json_kwargs) -> Iterator[bytes]:
+    # Buffers encoded models into chunks; a chunk per model would mean a socket write per model
+    chunk = [] if ndjson else ["["]
+    chunk_len = 0
+    separator = "\n" if ndjson else ","
+    first = True
+    for model in models:
+        encoded = model.json(**json_kwargs)
+        if ndjson:
+            encoded += separator
+        elif not first:
+            encoded = separator + encoded
+        first = False
+        chunk.append(encoded)
+        chunk_len += len(encoded)
+        if chunk_len >= stream_chunk_size:
+            yield "".join(chunk).encode()
+            chunk = []
+            chunk_len = 0
+    if not ndjson:
+        chunk.append("]")
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def stream_models(models: Iterable[BaseModel], stream: str, **json_kwargs) -> Optional[StreamingResponse]:
+    """
+    Streams models (typically a DBI iter_* generator) without building the full result in memory.
+    """
+    if stream not in stream_media_types:
+        allowed = ", ".join(f"'{k}'" for k in stream_media_types)
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content={'message': f"Stream '{stream}' not allowed! Allowed streams: {allowed}"})
+    # Start the query now, so errors (e.g. a bad cursor) are raised before the response has started
+    models = iter(models)
+    try:
+        first = [next(models)]
+    except StopIteration:
+        first = []
+    body = __encode_stream(chain(first, models), stream == 'ndjson', **json_kwargs)
+    return StreamingResponse(body, media_type=stream_media_types[stream])
+
 # Docs url is handled here
 renderer = renderer.Renderer(search_dirs="../static/html/doc")
 
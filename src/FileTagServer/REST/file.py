@@ -4,39 +4,69 @@ from typing import Optional, List
 from fastapi import Header
 from pydantic import ValidationError
 from starlette import status
-from starlette.responses import JSONResponse, FileResponse
+from starlette.responses import JSONResponse, FileResponse, Response
 
+from FileTagServer import config
 from FileTagServer.DBI.file import old_file as file_api
+from FileTagServer.DBI import simple_search
 from FileTagServer.DBI.common import parse_fields, SortQuery
+from FileTagServer.DBI.counts import Count
 # Files ===============================================================================================================
 from FileTagServer.DBI.error import ApiError
 from FileTagServer.DBI.file.old_file import FileQuery, FilesQuery, CreateFileQuery, DeleteFileQuery, ModifyFileQuery, \
-    FullModifyFileQuery, SetFileQuery, FullSetFileQuery, FileTagQuery
-from FileTagServer.DBI.old_models import File, Tag, RestFile
-from FileTagServer.REST.routing import files_route, files_tags_route, file_route, file_tags_route, file_bytes_route
-from FileTagServer.REST.common import rest_api
+    FullModifyFileQuery, SetFileQuery, FullSetFileQuery, FileTagQuery, FileSearchQuery, FileTextQuery
+from FileTagServer.DBI.old_models import File, Tag, RestFile, RestTag
+from FileTagServer.REST.routing import files_route, files_tags_route, file_route, file_tags_route, file_bytes_route, \
+    files_search_route, files_text_route, files_count_route
+from FileTagServer.REST.common import rest_api, stream_models
 
 tags_metadata = [
     {"name": "Files", "description": ""},
     {"name": "File", "description": ""},
 ]
 
+next_cursor_header = "X-Next-Cursor"
+# The steps of a simple search (in order, with their estimates and matches) and its timing; see config
+search_plan_header = "X-Search-Plan"
+# The facets of every matching file (JSON, see DBI.file.facets); only if 'facets' (the number of each) was given
+facets_header = "X-Facets"
+
+
+def __page_headers(response: Response, page: file_api.FilesPage):
+    # Paged; the next page is requested with the same arguments and 'cursor' set to this header
+    if page.next_cursor is not None:
+        response.headers[next_cursor_header] = page.next_cursor
+    if config.search_plan_header and page.search_plan is not None:
+        response.headers[search_plan_header] = simple_search.describe(page.search_plan)
+    if page.facets is not None:
+        response.headers[facets_header] = page.facets.json()
+
 
 # FILES (GET) ======================================
-@rest_api.get(files_route, response_model=List[File], tags=["Files"], response_model_exclude_unset=True)
-def get_files(sort: Optional[str] = None, fields: Optional[str] = None, tag_fields: Optional[str] = None) -> List[File]:
+# Rest models; 'fields' may leave out fields required by the DBI models
+@rest_api.get(files_route, response_model=List[RestFile], tags=["Files"], response_model_exclude_unset=True)
+def get_files(response: Response, sort: Optional[str] = None, fields: Optional[str] = None,
+              tag_fields: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None,
+              stream: Optional[str] = None, facets: Optional[int] = None) -> List[File]:
     # Parse individual api arguments; data is validated at the api level
     sort = SortQuery.parse_str(sort)
     fields = parse_fields(fields)
     tag_fields = parse_fields(tag_fields)
     try:
-        query = FilesQuery(sort=sort, fields=fields, tag_fields=tag_fields)
+        query = FilesQuery(sort=sort, fields=fields, tag_fields=tag_fields, limit=limit, cursor=cursor, facets=facets)
     except ValidationError as e:
-        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST)
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'message': str(e)})
 
     # Try api call; if invalid, fetch errors from validation error and return Bad Request
-    api_results = file_api.get_files(query)
-    return api_results
+    try:
+        if stream is not None:
+            # Not paged (unless limited); the whole result is written as it is read
+            return stream_models(file_api.iter_files(config.db_path, query), stream, exclude_unset=True)
+        api_results = file_api.get_files_page(config.db_path, query)
+    except ApiError as e:
+        return JSONResponse(status_code=int(e.status_code), content={'message': e.message})
+    __page_headers(response, api_results)
+    return api_results.files
 
 
 # FILES (POST) ======================================
@@ -44,35 +74,113 @@ def get_files(sort: Optional[str] = None, fields: Optional[str] = None, tag_fiel
                status_code=status.HTTP_201_CREATED,
                tags=["Files"])
 def post_files(query: CreateFileQuery) -> File:
-    api_result = file_api.create_file(query)
+    api_result = file_api.create_file(config.db_path, query)
     return api_result.as_response()
     # return serve_json(api_result.json(), HTTPStatus.Created, {'location': config.resolve_url(file.path(api_result.id))})
 
 
 # FILES TAGS (GET) ==========================================================================================================
-@rest_api.get(files_tags_route, response_model=List[Tag], tags=["Files", "Tag"])
-def get_files_tags(sort: Optional[str] = None, fields: Optional[str] = None, tag_fields: Optional[str] = None) -> List[
-    Tag]:
+@rest_api.get(files_tags_route, response_model=List[RestTag], tags=["Files", "Tag"], response_model_exclude_unset=True)
+def get_files_tags(sort: Optional[str] = None, fields: Optional[str] = None, tag_fields: Optional[str] = None,
+                   stream: Optional[str] = None) -> List[Tag]:
     sort = SortQuery.parse_str(sort)
     fields = parse_fields(fields)
     tag_fields = parse_fields(tag_fields)
-    query = FilesQuery(sort=sort, fields=fields, tag_fields=tag_fields)
-    api_results = file_api.get_files_tags(query)
+    try:
+        query = FilesQuery(sort=sort, fields=fields, tag_fields=tag_fields)
+    except ValidationError as e:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'message': str(e)})
+    try:
+        if stream is not None:
+            return stream_models(file_api.iter_files_tags(config.db_path, query), stream, exclude_unset=True)
+        api_results = file_api.get_files_tags(config.db_path, query)
+    except ApiError as e:
+        return JSONResponse(status_code=int(e.status_code), content={'message': e.message})
     return api_results
 
 
-# # FILES SEARCH (GET) ========================================================================================================
-# @rest_api.get(files_search_route)
-# def get_files_search() -> RedirectResponse:
-#     def apply_get(path: str):
-#         args: Dict = request['GET']
-#         parts = [f"{k}={v}" for k, v in args.items()]
-#         if len(parts) > 0:
-#             return path + "?" + "&".join(parts)
-#         return path
-#
-#     return RedirectResponse(url=config.resolve_url(apply_get(files_route)),
-#                             status_code=status.HTTP_301_MOVED_PERMANENTLY)
+# FILES SEARCH (GET) ======================================================================================================
+# A search string (e.g. 'cat AND (dog OR "big bird")'; see DBI.full_search) and/or a simple search string
+#   (e.g. 'cat ~dog ~bird -sad'; see DBI.simple_search); otherwise the same as get_files
+@rest_api.get(files_search_route, response_model=List[RestFile], tags=["Files"], response_model_exclude_unset=True)
+def get_files_search(response: Response, query: Optional[str] = None, simple: Optional[str] = None,
+                     sort: Optional[str] = None, fields: Optional[str] = None, tag_fields: Optional[str] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None,
+                     facets: Optional[int] = None) -> List[File]:
+    sort = SortQuery.parse_str(sort)
+    fields = parse_fields(fields)
+    tag_fields = parse_fields(tag_fields)
+    try:
+        search_query = FileSearchQuery(sort=sort, fields=fields, tag_fields=tag_fields, limit=limit, cursor=cursor,
+                                       query=query, simple=simple, facets=facets)
+    except ValidationError as e:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'message': str(e)})
+    return post_files_search(response, search_query)
+
+
+# FILES SEARCH (POST) ======================================================================================================
+# The search (nested required/include/exclude tag names) does not fit a query string; sent as the body instead
+#   'query' (a search string) and 'simple' (a simple search string) may be given instead of (or with) 'search'
+@rest_api.post(files_search_route, response_model=List[RestFile], tags=["Files"], response_model_exclude_unset=True)
+def post_files_search(response: Response, query: FileSearchQuery) -> List[File]:
+    try:
+        api_results = file_api.search_files(config.db_path, query)
+    except ApiError as e:
+        return JSONResponse(status_code=int(e.status_code), content={'message': e.message})
+    # Paged like get_files; post the same body with 'cursor' set to the next cursor header
+    __page_headers(response, api_results)
+    return api_results.files
+
+
+# FILES TEXT SEARCH (GET) =================================================================================================
+# The files whose name, description or path contain every word of 'text' (see DBI.file.text), best match first
+#   Filtered by 'query' and 'simple' (as in get_files_search); paged by rank, so there is no 'sort'
+@rest_api.get(files_text_route, response_model=List[RestFile], tags=["Files"], response_model_exclude_unset=True)
+def get_files_text(response: Response, text: str, query: Optional[str] = None, simple: Optional[str] = None,
+                   fields: Optional[str] = None, tag_fields: Optional[str] = None, limit: Optional[int] = None,
+                   cursor: Optional[str] = None, facets: Optional[int] = None) -> List[File]:
+    fields = parse_fields(fields)
+    tag_fields = parse_fields(tag_fields)
+    try:
+        text_query = FileTextQuery(fields=fields, tag_fields=tag_fields, limit=limit, cursor=cursor, text=text,
+                                   query=query, simple=simple, facets=facets)
+    except ValidationError as e:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'message': str(e)})
+    return post_files_text(response, text_query)
+
+
+# FILES TEXT SEARCH (POST) ================================================================================================
+# As get_files_text; 'search' (nested tag names) may also filter the results
+@rest_api.post(files_text_route, response_model=List[RestFile], tags=["Files"], response_model_exclude_unset=True)
+def post_files_text(response: Response, query: FileTextQuery) -> List[File]:
+    try:
+        api_results = file_api.text_search_files(config.db_path, query)
+    except ApiError as e:
+        return JSONResponse(status_code=int(e.status_code), content={'message': e.message})
+    __page_headers(response, api_results)
+    return api_results.files
+
+
+# FILES COUNT (GET) =======================================================================================================
+# The number of files matching 'query' and 'simple' (as in get_files_search; every file if neither), for paging
+#   Large searches may be estimated; 'exact' is false then
+@rest_api.get(files_count_route, response_model=Count, tags=["Files"])
+def get_files_count(query: Optional[str] = None, simple: Optional[str] = None) -> Count:
+    try:
+        search_query = FileSearchQuery(query=query, simple=simple)
+    except ValidationError as e:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={'message': str(e)})
+    return post_files_count(search_query)
+
+
+# FILES COUNT (POST) ======================================================================================================
+# As get_files_count; 'search' (nested tag names) may also be given
+@rest_api.post(files_count_route, response_model=Count, tags=["Files"])
+def post_files_count(query: FileSearchQuery) -> Count:
+    try:
+        return file_api.count_files(config.db_path, query)
+    except ApiError as e:
+        return JSONResponse(status_code=int(e.status_code), content={'message': e.message})
 
 
 # FILE (GET) ================================================================================================================
@@ -84,7 +192,7 @@ def get_file(file_id: int, fields: Optional[str] = None, tag_fields: Optional[st
         fields = parse_fields(fields)
         tag_fields = parse_fields(tag_fields)
         query = FileQuery(id=file_id, fields=fields, tag_fields=tag_fields)
-        api_result = file_api.get_file(query)
+        api_result = file_api.get_file(config.db_path, query)
         response = api_result.as_response(fields, tag_fields)
         return response
     except ApiError as e:
@@ -105,7 +213,7 @@ def delete_file(file_id: int):
     except ValidationError as e:
         return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST)
     try:
-        file_api.delete_file(query)
+        file_api.delete_file(config.db_path, query)
         return None
     except ApiError as e:
         # if e.code == 404:
@@ -119,7 +227,7 @@ def patch_file(file_id: int, body: ModifyFileQuery):
     except ValidationError as e:
         return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST)
     try:
-        file_api.modify_file(query)
+        file_api.modify_file(config.db_path, query)
         return
     except ApiError as e:
         if e.status_code == HTTPStatus.NOT_FOUND:
@@ -139,7 +247,7 @@ def put_file(file_id: int, body: SetFileQuery):
         # return serve_json(e.json(), HTTPStatus.BAD_REQUEST)
     try:
         # success = \
-        file_api.set_file(query)
+        file_api.set_file(config.db_path, query)
         return
         # return b'', HTTPStatus.NO_CONTENT if success else HTTPStatus.INTERNAL_SERVER_ERROR, {}
     except ApiError as e:
@@ -157,7 +265,7 @@ def put_file(file_id: int, body: SetFileQuery):
 def get_file_tags(file_id: int) -> List[Tag]:
     q = FileTagQuery(id=file_id)
     try:
-        api_result = file_api.get_file_tags(q)
+        api_result = file_api.get_file_tags(config.db_path, q)
         return api_result
         # return serve_json(Util.json(api_result))
     except ApiError as e:
@@ -260,7 +368,7 @@ def get_file_data(file_id: int, range: Optional[str] = Header(None)):
     # range = request['HEADERS'].get('Range')
     # query = FileDataQuery(id=file_id, range=range)
     try:
-        local_path = file_api.get_file_path(file_id)
+        local_path = file_api.get_file_path(config.db_path, file_id)
         return FileResponse(path=local_path, headers={'range': range})
     except ApiError as e:
         return JSONResponse(status_code=e.status_code, content={'message': e.message})
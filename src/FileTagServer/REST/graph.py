@@ -1,8 +1,11 @@
+from typing import Optional, List
+
 import graphene
 from graphene import ObjectType, Schema
 from starlette.graphql import GraphQLApp
 
-from FileTagServer.DBI import tag as tag_api
+from FileTagServer import config
+from FileTagServer.DBI.tag import old_tag as tag_api
 from FileTagServer.DBI.file import old_file as file_api
 from FileTagServer.DBI.common import Util
 from FileTagServer.DBI.file.old_file import FilesQuery
@@ -15,6 +18,32 @@ def dummy():
     pass
 
 
+def _selected_fields(nodes) -> Optional[List[str]]:
+    # The fields selected on a list of objects; None (every field) if a fragment is used
+    names = []
+    for node in nodes:
+        if node.selection_set is None:
+            continue
+        for selection in node.selection_set.selections:
+            if type(selection).__name__ not in ('Field', 'FieldNode'):
+                return None
+            # Introspection (e.g. '__typename') is not a model field
+            if not selection.name.value.startswith("__"):
+                names.append(selection.name.value)
+    return names
+
+
+def _field_nodes(info):
+    # graphql-core 3 renamed 'field_asts'
+    return getattr(info, 'field_nodes', None) or info.field_asts
+
+
+def _sub_field_nodes(nodes, name: str):
+    return [selection for node in nodes if node.selection_set is not None
+            for selection in node.selection_set.selections
+            if type(selection).__name__ in ('Field', 'FieldNode') and selection.name.value == name]
+
+
 class TagGraph(ObjectType):
     id = graphene.Int()
     name = graphene.String()
@@ -35,16 +64,20 @@ class Query(ObjectType):
     files = graphene.List(FileGraph)
     tags = graphene.List(TagGraph)
 
+    # Only the queried fields are selected from the database
     def resolve_files(root, info):
-        q = FilesQuery()
-        r = file_api.get_files(q)
-        d = Util.dict(r)
+        nodes = _field_nodes(info)
+        fields = _selected_fields(nodes)
+        tag_fields = _selected_fields(_sub_field_nodes(nodes, 'tags')) if fields and 'tags' in fields else None
+        q = FilesQuery(fields=fields, tag_fields=tag_fields)
+        r = file_api.get_files(config.db_path, q)
+        d = Util.dict(r, exclude_unset=True)
         return d
 
     def resolve_tags(root, info):
-        q = TagsQuery()
-        r = tag_api.get_tags(q)
-        d = Util.dict(r)
+        q = TagsQuery(fields=_selected_fields(_field_nodes(info)))
+        r = tag_api.get_tags(config.db_path, q)
+        d = Util.dict(r, exclude_unset=True)
         return d
 
 
@@ -1,5 +1,8 @@
 from FileTagServer.REST.common import rest_api, initialize_routes
 import uvicorn
+from FileTagServer import config
+from FileTagServer.DBI.common import initialize_database
+from FileTagServer.DBI.tag.index import rebuild_tag_index
 from FileTagServer.REST.file import tags_metadata as file_tagmetadata
 from FileTagServer.REST.tag import tags_metadata as tags_tagmetadata
 from FileTagServer.REST.graph import dummy
@@ -20,6 +23,9 @@ def init():
 
 
 def run(**kwargs):
+    initialize_database()
+    if config.tag_index:
+        rebuild_tag_index()
     init()
     initialize_routes()
     uvicorn.run(rest_api, **kwargs)
@@ -1,15 +1,19 @@
 rest_route = "/rest"
 files_route = f"{rest_route}/files"
 files_tags_route = f"{files_route}/tags"
-files_search_route = f"f{rest_route}/search"
+files_search_route = f"{files_route}/search"
+files_text_route = f"{files_route}/text"
+files_count_route = f"{files_route}/count"
 file_route = f"{files_route}/{{file_id}}"
 file_tags_route = f"{file_route}/tags"
 file_bytes_route = f"{file_route}/bytes"
 tags_route = f"{rest_route}/tags"
-tags_search_route = f"f{rest_route}/search"
+tags_search_route = f"{tags_route}/search"
 tag_route = f"{tags_route}/{{tag_id}}"
 tag_files_route = f"{tag_route}/files"
 tags_autocomplete = f"{tags_route}/autocomplete"
+tags_index_route = f"{tags_route}/index"
+tags_count_route = f"{tags_route}/count"
 
 graph_route = "/graphql"
 
@@ -1,14 +1,21 @@
 from typing import Optional, List
 
+from fastapi import Query
 from starlette import status
+from starlette.responses import JSONResponse
 
-from FileTagServer.DBI.tag import tag as tag_api
+from FileTagServer import config
+from FileTagServer.DBI.tag import old_tag as tag_api
+from FileTagServer.DBI.tag.autocomplete import rebuild_tag_autocomplete
+from FileTagServer.DBI.tag.index import TagIndexUsage, get_tag_index, rebuild_tag_index
 from FileTagServer.DBI.common import parse_fields, SortQuery, AutoComplete
-from FileTagServer.DBI.old_models import Tag
+from FileTagServer.DBI.counts import Count
+from FileTagServer.DBI.old_models import Tag, RestTag
 from FileTagServer.DBI.tag.old_tag import TagsQuery, CreateTagQuery, TagIdQuery, DeleteTagQuery, ModifyTagQuery, \
     FullModifyTagQuery, SetTagQuery, FullSetTagQuery
-from FileTagServer.REST.routing import tags_route, tag_route, tags_autocomplete
-from FileTagServer.REST.common import rest_api
+from FileTagServer.REST.routing import tags_route, tag_route, tags_autocomplete, tags_index_route, \
+    tags_count_route
+from FileTagServer.REST.common import rest_api, stream_models
 
 
 tags_metadata = [
@@ -19,33 +26,69 @@ tags_metadata = [
 
 
 # Tags ===============================================================================================================
-@rest_api.get(tags_route)
-def get_tags(sort: Optional[str] = None, fields: Optional[str] = None) -> List[Tag]:
+@rest_api.get(tags_route, response_model=List[RestTag], response_model_exclude_unset=True)
+def get_tags(sort: Optional[str] = None, fields: Optional[str] = None, stream: Optional[str] = None) -> List[Tag]:
     sort_args = SortQuery.parse_str(sort)
     fields = parse_fields(fields)
     query = TagsQuery(sort=sort_args, fields=fields)
-    api_results = tag_api.get_tags(query)
+    if stream is not None:
+        return stream_models(tag_api.iter_tags(config.db_path, query), stream, exclude_unset=True)
+    api_results = tag_api.get_tags(config.db_path, query)
     return api_results
 
 
 @rest_api.post(tags_route)
 def post_tags(query: CreateTagQuery) -> Tag:
-    api_result = tag_api.create_tag(query)
+    api_result = tag_api.create_tag(config.db_path, query)
     return api_result
 
 
+# Tags Index =========================================================================================================
+# Registered before the tag routes; 'index' is not a tag id
+@rest_api.get(tags_index_route, response_model=TagIndexUsage, tags=["Tags"])
+def get_tags_index() -> TagIndexUsage:
+    index = get_tag_index(config.db_path)
+    if index is None:
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={'message': "The tag index is not built"})
+    return index.usage()
+
+
+# Rebuilds the index (and the autocomplete); after the database was changed by something other than this server
+#   (e.g. a scan)
+@rest_api.post(tags_index_route, response_model=TagIndexUsage, tags=["Tags"])
+def post_tags_index() -> TagIndexUsage:
+    rebuild_tag_autocomplete(config.db_path)
+    return rebuild_tag_index(config.db_path).usage()
+
+
+# Tags Count ========================================================================================================
+# Registered before the tag routes; 'count' is not a tag id
+@rest_api.get(tags_count_route, response_model=Count, tags=["Tags"])
+def get_tags_count() -> Count:
+    return tag_api.count_tags(config.db_path)
+
+
+# Tags Autocomplete ==================================================================================================
+# Registered before the tag routes; 'autocomplete' is not a tag id
+#   The tags containing 'name' (ignoring case), most used first; at most 'limit' (config.tag_autocomplete_limit)
+@rest_api.get(tags_autocomplete, response_model=List[AutoComplete], tags=["Tags"])
+@rest_api.post(tags_autocomplete, response_model=List[AutoComplete], tags=["Tags"])
+def autocomplete_tags(name: str, limit: Optional[int] = Query(None, ge=1)) -> List[AutoComplete]:
+    return tag_api.autocomplete_tag(config.db_path, name, limit)
+
+
 # Tag ================================================================================================================
 @rest_api.get(tag_route)
 def get_tag(tag_id: int, fields: Optional[str] = None) -> Tag:
     query = TagIdQuery(id=tag_id, fields=fields)
-    api_result = tag_api.get_tag_from_id(query)
+    api_result = tag_api.get_tag_from_id(config.db_path, query)
     return api_result
 
 
 @rest_api.delete(tag_route, status_code=status.HTTP_204_NO_CONTENT)
 def delete_tag(tag_id: int):
     query = DeleteTagQuery(id=tag_id)
-    tag_api.delete_tag(query)
+    tag_api.delete_tag(config.db_path, query)
     # if tag_api.delete_tag(query):
     #     return b'', HTTPStatus.Ok, {}
     # else:
@@ -55,7 +98,7 @@ def delete_tag(tag_id: int):
 @rest_api.patch(tag_route)
 def patch_tag(tag_id: int, request: ModifyTagQuery):
     query = FullModifyTagQuery(id=tag_id, **request.dict())
-    tag_api.modify_tag(query)
+    tag_api.modify_tag(config.db_path, query)
     # if tag_api.modify_tag(query):
     #     return b'', HTTPStatus.NO_CONTENT, {}
     # else:
@@ -65,7 +108,7 @@ def patch_tag(tag_id: int, request: ModifyTagQuery):
 @rest_api.put(tag_route)
 def put_tag(tag_id: int, request: SetTagQuery):
     query = FullSetTagQuery(id=tag_id, **request.dict())
-    tag_api.set_tag(query)
+    tag_api.set_tag(config.db_path, query)
     # if tag_api.set_tag(query):
     #     return b'', HTTPStatus.NO_CONTENT, {}
     # else:
@@ -81,10 +124,6 @@ def put_tag(tag_id: int, request: SetTagQuery):
 #     # return r
 
 
-@rest_api.get(tags_autocomplete)
-@rest_api.post(tags_autocomplete)
-def autocomplete_tags(name: str) -> List[AutoComplete]:
-    return tag_api.autocomplete_tag(name)
     # try:
     #     body = request['BODY']
     #     payload = json.loads(body)
@@ -5,6 +5,7 @@ from fastapi import FastAPI, Header
 from pystache import Renderer
 from starlette.responses import HTMLResponse
 
+from FileTagServer import config
 from FileTagServer.DBI.common import Util
 from FileTagServer.DBI.database import Database
 from FileTagServer.DBI.error import ApiError
@@ -16,7 +17,8 @@ from FileTagServer.DBI.models import Folder, File, Tag
 from FileTagServer.DBI.webconverter import WebConverter
 from FileTagServer.REST.routing import reformat
 from FileTagServer.WEB.common import serve_streamable
-from FileTagServer.WEB.routing import root_route, orphaned_files_route, folder_route, file_route, tag_route
+from FileTagServer.WEB.routing import root_route, orphaned_files_route, folder_route, file_route, tag_route, \
+    files_search_route
 
 
 def get_icon(name: str) -> str:
@@ -87,7 +89,8 @@ def build_context(conv: WebConverter, name: str, description: str, ancestry: Lis
         'desc': description,
         'files': Util.dict(files),
         'folders': Util.dict(folders),
-        'tags': Util.dict(tags)
+        'tags': Util.dict(tags),
+        'search_action': files_search_route,
     }
 
 
@@ -149,6 +152,28 @@ def add_routes(app: FastAPI, renderer: Renderer, database: Database, webconv: We
         html = renderer.render_path("../static/html/folder/table.html", **context)
         return HTMLResponse(html)
 
+    # Before file_route; 'search' is not a file id
+    @app.get(files_search_route)
+    def file_search(search: str = ""):
+        ancestry = build_ancestry(database, "Search", files_search_route)
+        try:
+            files = database.file.search_files(search, limit=config.web_search_limit)
+            message = f"Files matching '{search}'" if len(files) < config.web_search_limit else \
+                f"The first {len(files)} files matching '{search}'"
+            status_code = 200
+        except ApiError as e:
+            files = None
+            message = e.message
+            status_code = e.status_code
+
+        all_tags = webconv.collect_nested_tags(None, None, files)
+        tag_lookup = database.tag.get_tags(all_tags)
+        context = build_context(webconv, "Search", None, ancestry, None, files, None, tag_lookup)
+        context['search'] = search
+        context['search_message'] = message
+        html = renderer.render_path("../static/html/folder/table.html", **context)
+        return HTMLResponse(html, status_code=status_code)
+
     @app.get(file_route)
     def file(file_id: int, content_range: Optional[str] = Header(None)):
         file = database.file.get_file(file_id)
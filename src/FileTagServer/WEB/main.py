@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from pystache import Renderer
 
 from FileTagServer.DBI.database import Database
+from FileTagServer import config
+from FileTagServer.DBI.common import initialize_database
+from FileTagServer.DBI.tag.index import rebuild_tag_index
 from FileTagServer.DBI.webconverter import WebConverter
 from FileTagServer.WEB.common import create_renderer, create_app_instance
 from FileTagServer.WEB import error, static, app as application
@@ -20,6 +23,9 @@ def init(app: FastAPI, renderer: Renderer, database: Database, conv: WebConverte
 
 
 def run(db_path: str, **kwargs):
+    initialize_database(db_path)
+    if config.tag_index:
+        rebuild_tag_index(db_path)
     db = Database(db_path)
     app = create_app_instance()
     renderer = create_renderer()
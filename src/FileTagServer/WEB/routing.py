@@ -3,6 +3,7 @@ file_route = f"{files_route}/{{file_id}}"
 file_edit_route = f"{files_route}/{{file_id}}/edit"
 file_edit_submit_route = file_edit_route
 file_data_route = f"{files_route}/{{file_id}}/data"
+files_search_route = f"{files_route}/search"
 
 tags_route = f"/tags"
 tag_route = f"{tags_route}/{{tag_id}}"
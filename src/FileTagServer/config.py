@@ -6,13 +6,69 @@ def find_src_root():
     # Lazy implimentation
     # This is at src\config.py
     # Therefore....
-    root = os.path.abspath(fr"{__file__}\..\..")
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
     # Should be src
     return root
 
 
 db_path = os.path.abspath(os.path.join(find_src_root(), "../local.db"))  # pathing.Static.get_database(r"local.db")
 # template_path = static.html.resolve_path(r"templates")
+# Connection pooling; a pool size of 0 opens a new connection for every request
+db_pool_size = 8
+db_pool_timeout = 30.0  # seconds to wait for a free connection
+db_cached_statements = 256
+# Rows fetched per round trip when streaming results
+db_fetch_size = 512
+# ids per keyed relation query; below sqlite's bound parameter limit (999 on older builds)
+db_relation_batch_size = 900
+# Applied once per pooled connection
+db_pragmas = {
+    'foreign_keys': 1,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'cache_size': -16000,  # negative is KiB; ~16MB
+    'mmap_size': 268435456,  # 256MB
+    'temp_store': 'MEMORY',
+}
+# Parsed (and planned) search strings kept, per cache
+search_plan_cache_size = 256
+# Cached tag search results (the ordered ids of every match); bounded by both, 0 entries disables the cache
+search_cache_entries = 128
+search_cache_bytes = 32 * 1024 * 1024
+# Cached counts (e.g. for paging), dropped on the next write; 0 disables the cache
+count_cache_entries = 256
+# A search that may match more files than this (and no tag index is built) is estimated from the tag counts instead
+#   of counted; None always counts
+count_exact_limit = 10000
+# Report the executed plan (and timing) of simple searches in the X-Search-Plan header of REST searches
+search_plan_header = True
+# The most tags (& mime types) a search may ask to facet; the facets are sent in the X-Facets header, which servers
+#   & proxies limit to a few KB
+max_facets = 100
+# bm25 weight of each column of the file text index; a match in the name outranks one in the description
+file_text_weights = {'name': 10.0, 'description': 1.0, 'path': 2.0}
+# Files shown by the web search page
+web_search_limit = 500
+# Tags suggested by autocomplete (unless a limit is given), and how often (seconds) their usage counts are reloaded
+tag_autocomplete_limit = 10
+tag_autocomplete_refresh = 5.0
+# Folders & files written (or removed) per transaction by a bulk ingest (e.g. a scan; see DBI.ingest & DBI.reap)
+ingest_batch_size = 5000
+# Scanning (see scan.walker); directories listed (and their files stat-ed) in parallel, written by a single thread
+#   Directories waiting to be listed (a worker lists one itself when full) and listings waiting to be written
+scan_workers = 8
+scan_queue_size = 1024
+scan_result_queue_size = 64
+# Content hashes of new & changed files (see scan.hashing); read in chunks on a pool of processes
+#   0 workers hashes in the scanning process
+hash_workers = 4
+hash_chunk_size = 1 << 20
+# Build the in-memory tag index (bitmaps of files per tag) on startup; searches use SQL without it
+tag_index = True
+# Seconds to wait before rebuilding an index found out of sync (e.g. written by a scan in another process);
+#   writes in the meantime are taken in by the same rebuild
+tag_index_rebuild_delay = 1.0
 host = "localhost"
 port = "80"
 protocol = "http"
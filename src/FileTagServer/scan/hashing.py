@@ -0,0 +1,81 @@
+import hashlib
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, Optional
+
+from FileTagServer import config
+
+# CONTENT HASHING
+# Files are hashed (blake2b) a chunk at a time into a reused buffer; memory does not grow with the size of a file
+#   A batch of files is spread over a pool of processes (config.hash_workers); each file is read by a single process
+#   The pool's processes are spawned, not forked; the scanning process has threads (see scan.walker) when it starts
+#   A file that cannot be read has no hash (None); e.g. removed since it was listed
+
+HASH_BYTES = 20
+
+
+def hash_file(path: str, chunk_size: int = None) -> Optional[str]:
+    """
+    The hex digest of the file's content; None if it cannot be read.
+    """
+    digest = hashlib.blake2b(digest_size=HASH_BYTES)
+    buffer = bytearray(chunk_size or config.hash_chunk_size)
+    view = memoryview(buffer)
+    try:
+        with open(path, "rb", buffering=0) as file:
+            while True:
+                read = file.readinto(buffer)
+                if not read:
+                    break
+                digest.update(view[:read])
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class Hasher:
+    """
+    Hashes files on 'workers' processes (in this process if 0).
+
+    Used as a context manager; the pool is shut down on exit.
+    """
+
+    def __init__(self, workers: int = None, chunk_size: int = None):
+        self.workers = config.hash_workers if workers is None else workers
+        self.chunk_size = chunk_size or config.hash_chunk_size
+        # Started on first use; a rescan that hashes nothing starts no processes
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> 'Hasher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def hash(self, paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        paths = list(paths)
+        job = partial(hash_file, chunk_size=self.chunk_size)
+        if self.workers <= 0 or len(paths) < 2:
+            return dict(zip(paths, map(job, paths)))
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # Small chunks of paths; the files of a batch can differ in size by orders of magnitude
+        chunks = max(1, min(64, len(paths) // (self.workers * 4)))
+        return dict(zip(paths, self.pool.map(job, paths, chunksize=chunks)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.scan.hashing big.iso other.iso [...]'
+    start = time.perf_counter()
+    with Hasher() as hasher:
+        for path, digest in hasher.hash(sys.argv[1:]).items():
+            print(f"{digest}  {path}")
+    print(f"{len(sys.argv) - 1} file(s) in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,209 @@
+import os
+import queue
+import sys
+import time
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from FileTagServer import config
+
+# DIRECTORY WALKER
+# Lists directories with os.scandir on a pool of threads (one task per directory); stat-ing the files of a slow share
+#   (e.g. over the network) is waited on by many threads at once instead of one
+#   Each listing (a directory's subfolders and files) is queued for the single consumer, the writer, BEFORE its
+#   subdirectories are queued; a folder always reaches the writer before anything inside it (see DBI.ingest)
+#   Both queues are bounded: a worker lists a subdirectory itself once config.scan_queue_size are waiting, and waits
+#   while config.scan_result_queue_size listings are unwritten; memory does not grow with the size of the share
+#   Symlinked directories are not followed (no cycles); symlinked files are listed as files
+#   Given the directories' mtimes as of the last scan, a directory whose mtime is unchanged (no entry added, removed or
+#   renamed) is listed without stat-ing its files ('unchanged'); a rescan of an unchanged tree costs a bare walk
+#   A directory's mtime does not change with its subdirectories', so every subdirectory is still listed; nor does it
+#   with its files' contents, a file changed in place is only noticed by a full walk (no mtimes given)
+
+# A directory changed within this many nanoseconds of being listed may change again without its mtime changing
+#   (coarse timestamps, e.g. 2s on FAT); its mtime is not reported so the next scan lists it in full
+RACY_NS = 2_000_000_000
+
+
+class WalkEntry(NamedTuple):
+    path: str
+    name: str
+    # The path of the containing folder; None for a root
+    parent: Optional[str]
+    # Of the file (following symlinks); None for folders, and for the files of an unchanged directory
+    size: Optional[int] = None
+    # st_mtime_ns
+    mtime: Optional[int] = None
+    inode: Optional[int] = None
+
+
+class WalkListing(NamedTuple):
+    folders: List[WalkEntry]
+    files: List[WalkEntry]
+    # The directories (or entries) that could not be read; e.g. permission denied
+    errors: List[str]
+    # The listed directory (None for the roots) and its mtime; None if it could not be read (or changed too recently)
+    directory: Optional[str] = None
+    mtime: Optional[int] = None
+    # The directory's mtime is the last scan's; its entries are too, and its files were not stat-ed
+    unchanged: bool = False
+
+
+def list_directory(directory: str, known_mtime: Optional[int] = None) -> Tuple[WalkListing, List[str]]:
+    """
+    The listing of a single directory, and its subdirectories to walk.
+
+    'known_mtime' is the directory's mtime as of the last scan, if any.
+    """
+    folders, files, errors = [], [], []
+    try:
+        # Before listing; a change while listing leaves a newer mtime for the next scan
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError as e:
+        return WalkListing(folders, files, [f"{directory}: {e}"], directory), []
+    unchanged = mtime == known_mtime
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(WalkEntry(entry.path, entry.name, directory))
+                    elif entry.is_file():
+                        if unchanged:
+                            files.append(WalkEntry(entry.path, entry.name, directory))
+                        else:
+                            stat = entry.stat()
+                            files.append(WalkEntry(entry.path, entry.name, directory,
+                                                   stat.st_size, stat.st_mtime_ns, stat.st_ino))
+                except OSError as e:
+                    errors.append(f"{entry.path}: {e}")
+    except OSError as e:
+        errors.append(f"{directory}: {e}")
+    if errors or time.time_ns() - mtime < RACY_NS:
+        mtime = None
+    return WalkListing(folders, files, errors, directory, mtime, unchanged), [folder.path for folder in folders]
+
+
+class _Walk:
+    # The state of one walk; shared by its worker threads
+    DONE = None
+    POLL = 0.1
+
+    def __init__(self, queue_size: int, result_queue_size: int, mtimes: Dict[str, int]):
+        self.queue_size = queue_size
+        self.mtimes = mtimes
+        self.tasks: 'queue.Queue[str]' = queue.Queue()
+        self.results: 'queue.Queue[Optional[WalkListing]]' = queue.Queue(result_queue_size)
+        # Directories queued or being listed; the walk is done when none are left
+        self.pending = 0
+        self.lock = Lock()
+        self.stopped = Event()
+        self.failure: Optional[BaseException] = None
+
+    def add(self, directory: str):
+        with self.lock:
+            self.pending += 1
+        self.tasks.put(directory)
+
+    def work(self):
+        while not self.stopped.is_set():
+            try:
+                directory = self.tasks.get(timeout=self.POLL)
+            except queue.Empty:
+                continue
+            try:
+                self.__walk(directory)
+            except BaseException as e:
+                self.failure = e
+                self.stopped.set()
+                return
+            with self.lock:
+                self.pending -= 1
+                done = self.pending == 0
+            if done:
+                self.put(self.DONE)
+                self.stopped.set()
+
+    def __walk(self, directory: str):
+        # Depth first through whatever is not handed to another worker
+        stack = [directory]
+        while stack and not self.stopped.is_set():
+            directory = stack.pop()
+            listing, subdirectories = list_directory(directory, self.mtimes.get(directory))
+            self.put(listing)
+            for subdirectory in subdirectories:
+                # qsize is approximate; the bound only has to hold roughly
+                if self.tasks.qsize() < self.queue_size:
+                    self.add(subdirectory)
+                else:
+                    stack.append(subdirectory)
+
+    def put(self, result: Optional[WalkListing]):
+        # Waits for the writer; gives up once the walk is stopped (e.g. the consumer went away)
+        while not self.stopped.is_set():
+            try:
+                self.results.put(result, timeout=self.POLL)
+                return
+            except queue.Full:
+                continue
+
+    def get(self) -> Optional[WalkListing]:
+        while True:
+            try:
+                return self.results.get(timeout=self.POLL)
+            except queue.Empty:
+                if self.failure is not None:
+                    raise self.failure
+
+
+class ParallelWalker:
+    """
+    Walks directory trees on 'workers' threads; the listings are consumed (e.g. written) by the iterating thread.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None, result_queue_size: int = None):
+        self.workers = workers or config.scan_workers
+        self.queue_size = queue_size or config.scan_queue_size
+        self.result_queue_size = result_queue_size or config.scan_result_queue_size
+
+    def walk(self, roots: Iterable[str], mtimes: Dict[str, int] = None) -> Iterator[WalkListing]:
+        """
+        Every folder & file under the roots (and the roots themselves, first), a directory listing at a time.
+
+        'mtimes' are the directories' mtimes as of the last scan (e.g. DBI.ingest.folder_mtimes); none for a full walk.
+        """
+        roots = list(roots)
+        if not roots:
+            return
+        yield WalkListing([WalkEntry(root, root, None) for root in roots], [], [])
+
+        walk = _Walk(self.queue_size, self.result_queue_size, mtimes or {})
+        for root in roots:
+            walk.add(root)
+        threads = [Thread(target=walk.work, name=f"walker-{i}", daemon=True) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                listing = walk.get()
+                if listing is _Walk.DONE:
+                    return
+                yield listing
+        finally:
+            walk.stopped.set()
+            for thread in threads:
+                thread.join()
+
+
+if __name__ == "__main__":
+    # e.g. 'python -m FileTagServer.scan.walker /mnt/share [workers]'; lists without writing anything
+    walker = ParallelWalker(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    start = time.perf_counter()
+    folders = files = errors = 0
+    for listing in walker.walk([sys.argv[1]]):
+        folders += len(listing.folders)
+        files += len(listing.files)
+        errors += len(listing.errors)
+    elapsed = time.perf_counter() - start
+    print(f"Walked {files} file(s) & {folders} folder(s) ({errors} error(s)) on {walker.workers} thread(s) "
+          f"in {elapsed:.2f}s; {files / elapsed if elapsed > 0 else 0.0:.0f} files/s")
@@ -0,0 +1,60 @@
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from shutil import copyfile
+from typing import Iterator
+
+from FileTagServer.DBI.common import initialize_database
+from FileTagServer.DBI.pool import close_pools
+
+# Benchmarks are run from 'src' (like the servers); e.g. 'python -m benchmarks.connection_pool'
+example_db = "../examples/example.db"
+scaled_db = "../examples/benchmark.db"
+
+
+def build_scaled_database(path: str = scaled_db, files: int = 100_000, folders: int = 2_000, tags: int = 1_000,
+                          tags_per_file: int = 4, seed: int = 0) -> str:
+    """
+    Copies the example database and scales it up with synthetic folders, files and tags.
+    """
+    # Including a WAL left behind by an earlier run
+    for leftover in [path, path + "-wal", path + "-shm"]:
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    copyfile(example_db, path)
+    initialize_database(path)
+    close_pools()
+
+    rng = random.Random(seed)
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT INTO tag (name) VALUES (?)", ((f"tag {i}",) for i in range(tags)))
+        tag_ids = [r[0] for r in conn.execute("SELECT id FROM tag")]
+
+        conn.executemany("INSERT INTO folder (path, name) VALUES (?, ?)",
+                         ((f"/bench/{i}", f"{i}") for i in range(folders)))
+        folder_ids = [r[0] for r in conn.execute("SELECT id FROM folder WHERE path LIKE '/bench/%' ORDER BY id")]
+        # A shallow tree; every folder (but the first) is the child of an earlier folder
+        conn.executemany("INSERT INTO folder_folder (parent_id, child_id) VALUES (?, ?)",
+                         ((folder_ids[rng.randrange(i)], folder_ids[i]) for i in range(1, len(folder_ids))))
+
+        conn.executemany("INSERT INTO file (path, mime, name) VALUES (?, ?, ?)",
+                         ((f"/bench/file_{i}.txt", "text/plain", f"file {i}") for i in range(files)))
+        file_ids = [r[0] for r in conn.execute("SELECT id FROM file WHERE path LIKE '/bench/%' ORDER BY id")]
+        conn.executemany("INSERT INTO folder_file (folder_id, file_id) VALUES (?, ?)",
+                         ((rng.choice(folder_ids), file_id) for file_id in file_ids))
+        conn.executemany("INSERT OR IGNORE INTO file_tag (file_id, tag_id) VALUES (?, ?)",
+                         ((file_id, tag_id) for file_id in file_ids for tag_id in rng.sample(tag_ids, tags_per_file)))
+    return path
+
+
+@contextmanager
+def timed() -> Iterator[list]:
+    """
+    Yields a list; the elapsed seconds are appended to it when the block exits.
+    """
+    result = []
+    start = time.perf_counter()
+    yield result
+    result.append(time.perf_counter() - start)
@@ -0,0 +1,55 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from FileTagServer import config
+from FileTagServer.DBI.database import Database
+from FileTagServer.DBI.pool import close_pools
+from FileTagServer.WEB.app import create_webconv
+from benchmarks.common import build_scaled_database, timed
+
+REQUESTS = 2_000
+THREADS = 8
+
+
+def folder_page(database: Database, folder_id: int):
+    # Mirrors the DBI calls made by WEB.app's sub_folder
+    webconv = create_webconv()
+    folder = database.folder.get_folder(folder_id)
+    subfolders = database.folder.get_folders(folder.folders)
+    files = database.file.get_files(folder.files)
+    database.tag.get_tags(webconv.collect_nested_tags(folder, subfolders, files))
+
+
+def run(path: str, pool_size: int, threads: int, folder_ids):
+    close_pools()
+    config.db_pool_size = pool_size
+    database = Database(path)
+    with timed() as elapsed:
+        if threads <= 1:
+            for folder_id in folder_ids:
+                folder_page(database, folder_id)
+        else:
+            with ThreadPoolExecutor(threads) as executor:
+                list(executor.map(lambda f_id: folder_page(database, f_id), folder_ids))
+    close_pools()
+    return len(folder_ids) / elapsed[0]
+
+
+def main():
+    path = build_scaled_database()
+    database = Database(path)
+    with database.connect() as (conn, cursor):
+        cursor.execute("SELECT id FROM folder")
+        all_ids = [row['id'] for row in cursor.fetchall()]
+    rng = random.Random(0)
+    folder_ids = [rng.choice(all_ids) for _ in range(REQUESTS)]
+
+    print(f"Folder page requests/second ({REQUESTS} requests)")
+    for threads in [1, THREADS]:
+        before = run(path, 0, threads, folder_ids)
+        after = run(path, THREADS, threads, folder_ids)
+        print(f"\t{threads} thread(s):\tunpooled {before:10.1f}\tpooled {after:10.1f}\t({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
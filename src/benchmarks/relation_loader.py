@@ -0,0 +1,149 @@
+import random
+from typing import List, Union
+
+from FileTagServer.DBI import relations
+from FileTagServer.DBI.database import Database
+from FileTagServer.DBI.file import queries as file_queries
+from FileTagServer.DBI.folder import queries as folder_queries
+from FileTagServer.DBI.folder.folder import folder_relations
+from FileTagServer.DBI.models import File, Folder
+from FileTagServer.DBI.query_builder import QueryBuilder
+from benchmarks.common import build_scaled_database, timed
+
+REPEAT = 20
+BATCH = 500
+HUGE_FOLDER = 20_000
+
+# The GROUP_CONCAT queries (and parsing) replaced by relations.load_relation
+group_concat_files = QueryBuilder("file", [
+    "file.id", "file.path", "file.mime", "file.name", "file.description",
+    "GROUP_CONCAT(DISTINCT file_tag.tag_id) as tags", "folder_file.folder_id as parent_folder_id"
+], [
+    "LEFT JOIN file_tag on file_tag.file_id = file.id",
+    "LEFT JOIN folder_file on folder_file.file_id = file.id"
+], group_by="file.id")
+group_concat_folders = QueryBuilder("folder", [
+    "folder.id", "folder.path", "folder.name", "folder.description",
+    "GROUP_CONCAT(DISTINCT folder_tag.tag_id) as tags",
+    "GROUP_CONCAT(DISTINCT folder_folder.child_id) as subfolders",
+    "GROUP_CONCAT(DISTINCT folder_file.file_id) as files"
+], [
+    "LEFT JOIN folder_tag on folder_tag.folder_id = folder.id",
+    "LEFT JOIN folder_folder on folder_folder.parent_id = folder.id",
+    "LEFT JOIN folder_file on folder_file.folder_id = folder.id"
+], group_by="folder.id")
+
+
+def split_ids(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")] if value else None
+
+
+def group_concat_get_files(database: Database, file_ids: List[int], model: bool = True) -> List[File]:
+    with database.connect() as (conn, cursor):
+        sql, args = group_concat_files.copy().where_in("file.id", file_ids).build()
+        cursor.execute(sql, args)
+        results = []
+        for row in cursor.fetchall():
+            d = dict(row)
+            d['tags'] = split_ids(d['tags'])
+            results.append(File(**d) if model else d)
+        return results
+
+
+def group_concat_get_folders(database: Database, folder_ids: List[int], model: bool = True) -> List[Folder]:
+    with database.connect() as (conn, cursor):
+        sql, args = group_concat_folders.copy().where_in("folder.id", folder_ids).build()
+        cursor.execute(sql, args)
+        results = []
+        for row in cursor.fetchall():
+            d = dict(row)
+            d['tags'] = split_ids(d['tags'])
+            d['folders'] = split_ids(d.pop('subfolders'))
+            d['files'] = split_ids(d['files'])
+            results.append(Folder(**d) if model else d)
+        return results
+
+
+def loader_get_files(database: Database, file_ids: List[int]):
+    # FileDBI.get_files without the models
+    with database.connect() as (conn, cursor):
+        sql, args = file_queries.select().where_in("file.id", file_ids).build()
+        cursor.execute(sql, args)
+        rows = [dict(row) for row in cursor.fetchall()]
+        file_tags = relations.load_relation(cursor, relations.file_tags, file_ids)
+        for row in rows:
+            row['tags'] = file_tags.get(row['id'])
+        return rows
+
+
+def loader_get_folders(database: Database, folder_ids: List[int]):
+    # FolderDBI.get_folders without the models
+    with database.connect() as (conn, cursor):
+        sql, args = folder_queries.select().where_in("folder.id", folder_ids).build()
+        cursor.execute(sql, args)
+        rows = [dict(row) for row in cursor.fetchall()]
+        loaded = relations.load_relations(cursor, folder_relations, folder_ids)
+        for row in rows:
+            row.update({name: edges.get(row['id']) for name, edges in loaded.items()})
+        return rows
+
+
+def same(expected: List[Union[File, Folder]], actual: List[Union[File, Folder]], keys: List[str]) -> bool:
+    # GROUP_CONCAT has no defined order
+    def normalize(items):
+        return {item.id: {k: sorted(getattr(item, k) or []) for k in keys} for item in items}
+
+    return normalize(expected) == normalize(actual)
+
+
+def compare(name: str, before, after):
+    with timed() as old:
+        for _ in range(REPEAT):
+            before()
+    with timed() as new:
+        for _ in range(REPEAT):
+            after()
+    print(f"\t{name}:\tgroup_concat {old[0] / REPEAT * 1000:8.2f}ms"
+          f"\tloader {new[0] / REPEAT * 1000:8.2f}ms\t({old[0] / new[0]:.2f}x)")
+
+
+def main():
+    path = build_scaled_database()
+    database = Database(path)
+    rng = random.Random(0)
+    with database.connect() as (conn, cursor):
+        cursor.execute("SELECT id FROM file")
+        file_ids = rng.sample([row['id'] for row in cursor.fetchall()], BATCH)
+        cursor.execute("SELECT id FROM folder")
+        folder_ids = rng.sample([row['id'] for row in cursor.fetchall()], BATCH)
+        # A folder with thousands of files; a single GROUP_CONCAT string of every child
+        cursor.execute("INSERT INTO folder (path, name) VALUES ('/bench/huge', 'huge')")
+        huge_id = cursor.lastrowid
+        cursor.execute(f"INSERT INTO folder_file (folder_id, file_id) SELECT ?, id FROM file LIMIT {HUGE_FOLDER}",
+                       (huge_id,))
+        conn.commit()
+
+    files = database.file.get_files(file_ids)
+    assert same(group_concat_get_files(database, file_ids), files, ['tags'])
+    folders = database.folder.get_folders(folder_ids)
+    assert same(group_concat_get_folders(database, folder_ids), folders, ['tags', 'folders', 'files'])
+
+    print(f"Rows only; average time per call ({REPEAT} calls)")
+    compare(f"{BATCH} files", lambda: group_concat_get_files(database, file_ids, model=False),
+            lambda: loader_get_files(database, file_ids))
+    compare(f"{BATCH} folders", lambda: group_concat_get_folders(database, folder_ids, model=False),
+            lambda: loader_get_folders(database, folder_ids))
+    compare(f"folder of {HUGE_FOLDER} files", lambda: group_concat_get_folders(database, [huge_id], model=False),
+            lambda: loader_get_folders(database, [huge_id]))
+
+    print(f"Including the models; average time per call ({REPEAT} calls)")
+    compare(f"{BATCH} files", lambda: group_concat_get_files(database, file_ids),
+            lambda: database.file.get_files(file_ids))
+    compare(f"{BATCH} folders", lambda: group_concat_get_folders(database, folder_ids),
+            lambda: database.folder.get_folders(folder_ids))
+    compare(f"folder of {HUGE_FOLDER} files", lambda: group_concat_get_folders(database, [huge_id]),
+            lambda: database.folder.get_folders([huge_id]))
+
+
+if __name__ == "__main__":
+    main()
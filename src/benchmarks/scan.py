@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+
+from FileTagServer.scan.walker import ParallelWalker
+from benchmarks.common import timed
+
+# A tree DEPTH levels deep (FANOUT directories per level), holding FILES_PER_FOLDER files each
+FANOUT = 8
+DEPTH = 3
+FILES_PER_FOLDER = 100
+WORKERS = [1, 4, 8, 16]
+
+
+def build_tree(root: str) -> int:
+    files = 0
+    level = [root]
+    for _ in range(DEPTH):
+        level = [os.path.join(parent, f"d{i}") for parent in level for i in range(FANOUT)]
+        for folder in level:
+            os.makedirs(folder, exist_ok=True)
+            for i in range(FILES_PER_FOLDER):
+                with open(os.path.join(folder, f"f{i}.txt"), "w") as file:
+                    file.write(str(i))
+                files += 1
+    return files
+
+
+def os_walk(root: str) -> int:
+    # The listing previously done by 'add_and_update_files'; plus the stat the walker does for every file
+    files = 0
+    for folder, _, names in os.walk(root):
+        for name in names:
+            os.stat(os.path.join(folder, name))
+            files += 1
+    return files
+
+
+def parallel_walk(root: str, workers: int) -> int:
+    return sum(len(listing.files) for listing in ParallelWalker(workers).walk([root]))
+
+
+def main():
+    # e.g. 'python -m benchmarks.scan [root]'; a slow share (e.g. a network mount) shows the difference best
+    if len(sys.argv) > 1:
+        root, temporary = sys.argv[1], None
+    else:
+        temporary = tempfile.TemporaryDirectory()
+        root = temporary.name
+        build_tree(root)
+
+    with timed() as baseline:
+        expected = os_walk(root)
+    print(f"{expected} files; os.walk: {baseline[0]:.2f}s")
+    for workers in WORKERS:
+        with timed() as elapsed:
+            assert parallel_walk(root, workers) == expected
+        print(f"\t{workers} worker(s): {elapsed[0]:.2f}s ({baseline[0] / elapsed[0]:.1f}x)")
+
+    if temporary is not None:
+        temporary.cleanup()
+
+
+if __name__ == "__main__":
+    main()
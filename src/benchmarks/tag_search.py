@@ -0,0 +1,88 @@
+import sqlite3
+from sqlite3 import Connection
+from typing import List
+
+from FileTagServer.DBI import relations
+from FileTagServer.DBI.file import queries as file_queries
+from FileTagServer.DBI.pool import close_pools
+from FileTagServer.DBI.search import SearchQuery, compile_search, search_index
+from FileTagServer.DBI.tag.index import TagIndex, rebuild_tag_index
+from benchmarks.common import build_scaled_database, timed
+
+FILES = 250_000
+TAGS_PER_FILE = 8
+REPEAT = 20
+# Tags on (nearly) every file; a search requiring them should cost no more than one requiring only the rare tags
+SKEWED = {"most": 0.9, "half": 0.5}
+
+
+def add_skewed_tags(path: str):
+    with sqlite3.connect(path) as conn:
+        for name, share in SKEWED.items():
+            tag_id = conn.execute("INSERT INTO tag (name) VALUES (?)", (name,)).lastrowid
+            conn.execute("INSERT OR IGNORE INTO file_tag (file_id, tag_id) "
+                         "SELECT id, ? FROM file WHERE abs(random()) % 1000 < ?", (tag_id, int(share * 1000)))
+        conn.execute("ANALYZE")
+
+
+def group_by_search(conn: Connection, required: List[str]) -> List[int]:
+    # The usual relational division; reads every edge of every required tag
+    placeholder = ", ".join(["?" for _ in required])
+    rows = conn.execute(f"SELECT file.id FROM file WHERE file.id IN ("
+                        f"SELECT file_tag.file_id FROM file_tag JOIN tag ON tag.id = file_tag.tag_id "
+                        f"WHERE tag.name IN ({placeholder}) GROUP BY file_tag.file_id "
+                        f"HAVING COUNT(*) = {len(required)}) ORDER BY file.id", required).fetchall()
+    return [row[0] for row in rows]
+
+
+def compiled_search(conn: Connection, required: List[str], index: TagIndex = None) -> List[int]:
+    # old_file.search_files without the models; with an index, its bitmap is already in id order
+    if index is not None:
+        return list(search_index(conn.cursor(), SearchQuery(required=required), index))
+    builder = file_queries.select(["id"]).order_by("file.id")
+    clauses = compile_search(conn.cursor(), SearchQuery(required=required), relations.file_tags, "file.id")
+    if clauses is None:
+        return []
+    for clause, args in clauses:
+        builder.where(clause, *args)
+    sql, args = builder.build()
+    return [row[0] for row in conn.execute(sql, args).fetchall()]
+
+
+def compare(conn: Connection, required: List[str], index: TagIndex):
+    # Rows only; the matching ids, unpaged
+    expected = group_by_search(conn, required)
+    assert expected == compiled_search(conn, required) == compiled_search(conn, required, index)
+    with timed() as old:
+        for _ in range(REPEAT):
+            group_by_search(conn, required)
+    with timed() as new:
+        for _ in range(REPEAT):
+            compiled_search(conn, required)
+    with timed() as indexed:
+        for _ in range(REPEAT):
+            compiled_search(conn, required, index)
+    print(f"\t{len(required)} required ({', '.join(required)}), {len(expected)} files:\n"
+          f"\t\tgroup by {old[0] / REPEAT * 1000:8.2f}ms\tcompiled {new[0] / REPEAT * 1000:8.2f}ms"
+          f"\t({old[0] / new[0]:.2f}x)\tindexed {indexed[0] / REPEAT * 1000:8.2f}ms\t({old[0] / indexed[0]:.2f}x)")
+
+
+def main():
+    path = build_scaled_database(files=FILES, tags_per_file=TAGS_PER_FILE)
+    add_skewed_tags(path)
+    index = rebuild_tag_index(path)
+    conn = sqlite3.connect(path)
+    edges = conn.execute("SELECT COUNT(*) FROM file_tag").fetchone()[0]
+    usage = index.usage()
+    print(f"Tag index built in {usage.build_time:.2f}s; {usage.bytes / 1024 / 1024:.2f}MB of ids")
+    print(f"Average time per search ({FILES} files, {edges} file tags, {REPEAT} calls)")
+    compare(conn, ["most", "half"], index)
+    compare(conn, ["most", "half", "tag 1"], index)
+    compare(conn, ["most", "half"] + [f"tag {i}" for i in range(1, 9)], index)
+    compare(conn, ["tag 1", "tag 2"], index)
+    conn.close()
+    close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,13 @@
 import json
 import mimetypes
-import os
-import sqlite3
-from os.path import join
+import sys
 from typing import Dict, List
 
 from FileTagServer.DBI.common import initialize_database
-from FileTagServer.DBI.file.old_file import CreateFileQuery, create_file, FilePathQuery, get_file_by_path
-from FileTagServer.DBI.folder.old_folder import create_folder, CreateFolderQuery, FolderPathQuery, \
-    get_folder_by_path
-from FileTagServer.DBI.folder_children import AddSubFolderQuery, AddSubFileQuery, add_folder_to_folder, \
-    add_file_to_folder
+from FileTagServer.DBI.ingest import BulkIngest, IngestStats, folder_mtimes
+from FileTagServer.DBI.reap import Reaper
+from FileTagServer.scan.hashing import Hasher
+from FileTagServer.scan.walker import ParallelWalker
 
 
 def load_settings(path: str = None) -> Dict:
@@ -19,67 +16,43 @@ def load_settings(path: str = None) -> Dict:
         return json.load(settings)
 
 
-def add_and_update_files(paths: List[str]):
-
-    # TODO check if file name exists
-    #   Check that Mimetype matches
-    #       Generate a hash for the local file
-    #           Compare against remote hashes
-    #               For matches; check that file still exists
-    #                   File does not exist; replace record's path to new path and do not insert
-    # TODO After inserting, scan DB for files which no longer exist. and then delete those entires
-    # Currently, only adds all paths
-    for path in paths:
-        print(path)
-        q = CreateFolderQuery(path=path, name=path)
-        try:
-            create_folder(q)
-        except sqlite3.IntegrityError:
-            pass
-
-        for cur_dir, folders, files in os.walk(path):
-            print("\t",cur_dir)
-            q = FolderPathQuery(path=cur_dir)
-            parent_f = get_folder_by_path(q)
-
-            print("\t\t", "Folders")
-            for folder in folders:
-                print("\t\t\t", folder)
-                folder_path = join(cur_dir, folder)
-                try:
-                    q = CreateFolderQuery(path=folder_path, name=folder)
-                    f = create_folder(q)
-                except sqlite3.IntegrityError:
-                    q = FolderPathQuery(path=folder_path)
-                    f = get_folder_by_path(q)
-
-                try:
-                    q = AddSubFolderQuery(parent_id=parent_f.id, child_id=f.id)
-                    add_folder_to_folder(q)
-                except sqlite3.IntegrityError:
-                    continue
-
-            print("\t\t", "Files")
-            for file in files:
-                print("\t\t\t", file)
-                file_path = join(cur_dir, file)
-                mime = mimetypes.guess_type(file_path)[0]
-                try:
-                    q = CreateFileQuery(path=file_path, mime=mime, name=file)
-                    f = create_file(q)
-                except sqlite3.IntegrityError:
-                    q = FilePathQuery(path=file_path)
-                    f = get_file_by_path(q)
-
-                try:
-                    q = AddSubFileQuery(folder_id=parent_f.id, file_id=f.id)
-                    add_file_to_folder(q)
-                except sqlite3.IntegrityError:
-                    continue
+def add_and_update_files(paths: List[str], db_path: str = None, full: bool = False) -> IngestStats:
+
+    # Adds all paths; listed in parallel (see scan.walker) and written by this thread alone in batches
+    #   (see DBI.ingest); existing paths are skipped, folders unchanged since the last scan are not re-written
+    #   A full scan also notices files changed in place in unchanged folders (see scan.walker)
+    # New & changed files are hashed; a known hash at a new path (and gone from its old one) re-points the file's row
+    #   instead of inserting one, the moved file keeps its tags
+    # Once written, the folders & files no longer found are removed (see DBI.reap)
+    walker = ParallelWalker()
+    reaper = Reaper(db_path)
+    mtimes = None if full else folder_mtimes(db_path)
+    with Hasher() as hasher, BulkIngest(db_path, hash_files=hasher.hash) as ingest:
+        for listing in walker.walk(paths, mtimes):
+            for error in listing.errors:
+                print("\t", error)
+            if listing.unchanged:
+                ingest.add_unchanged(len(listing.folders), len(listing.files))
+                continue
+            # A folder is listed before anything inside it
+            for folder in listing.folders:
+                ingest.add_folder(folder.path, folder.name, folder.parent)
+            for file in listing.files:
+                mime = mimetypes.guess_type(file.path)[0]
+                ingest.add_file(file.path, file.name, mime, file.parent, file.size, file.mtime, file.inode)
+            if listing.directory is not None:
+                ingest.add_listed(listing.directory, listing.mtime)
+                if not listing.errors:
+                    reaper.add_listing(listing.directory, [entry.path for entry in listing.folders + listing.files])
+    print(ingest.stats)
+    print(reaper.reap())
+    return ingest.stats
 
 
 if __name__ == "__main__":
+    # e.g. 'python main.py [settings.json] [--full]'
     initialize_database()
-    settings = load_settings()
+    args = [arg for arg in sys.argv[1:] if arg != "--full"]
+    settings = load_settings(args[0] if args else None)
     paths = settings.get('paths', [])
-    add_and_update_files(paths)
+    add_and_update_files(paths, full="--full" in sys.argv)
@@ -49,7 +49,8 @@ def files_list_page(request: Request) -> Response:
     PAGE_NEIGHBORS = 4
 
     search = GET.get("search", None)
-    total_files = 3  # ApiPageGroup.get_file_count_internal(search=search)
+    # Counted without reading the rows (and cached); a large search is an estimate, which is close enough for paging
+    total_files = file_api.count_files(config.db_path, file_api.FileSearchQuery(query=search)).count
     total_pages = PaginationUtil.get_page_count(PAGE_SIZE, total_files)
     # file_list = ApiPageGroup.get_file_list(page=page, size=PAGE_SIZE, search=search)
     files = [dict(f) for f in file_api.get_files()]
@@ -1,3 +1 @@
-SELECT file.id, path, mime, name, description, GROUP_CONCAT(file_tag.tag_id) as tags FROM file
-LEFT JOIN file_tag on file_tag.file_id = file.id
-GROUP BY file.id;
\ No newline at end of file
+SELECT file.id, path, mime, name, description FROM file;
\ No newline at end of file
@@ -1,4 +1,2 @@
-SELECT file.id, path, mime, name, description, GROUP_CONCAT(file_tag.tag_id) as tags FROM file
-LEFT JOIN file_tag on file_tag.file_id = file.id
-WHERE file.path = ?
-GROUP BY file.id;
\ No newline at end of file
+SELECT file.id, path, mime, name, description FROM file
+WHERE file.path = ?;
\ No newline at end of file
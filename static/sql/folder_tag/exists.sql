@@ -0,0 +1 @@
+SELECT EXISTS(SELECT 1 FROM folder_tag WHERE folder_id=? and tag_id=?);
\ No newline at end of file
@@ -1 +0,0 @@
-SELECT name from tag where name LIKE ? ESCAPE ?;
\ No newline at end of file
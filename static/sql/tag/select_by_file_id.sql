@@ -1,6 +1,4 @@
-SELECT id, name, description, count FROM (SELECT tag.id, tag.name, tag.description, COUNT(file_tag.file_id) AS count FROM tag
-LEFT JOIN file_tag ON tag.id = file_tag.tag_id
-GROUP BY tag.id)
-left JOIN file_tag ON id = file_tag.tag_id
-where file_tag.file_id = ?
-GROUP BY id;
\ No newline at end of file
+SELECT tag.id, tag.name, tag.description, tag_count.file_count AS count FROM file_tag
+INNER JOIN tag ON tag.id = file_tag.tag_id
+LEFT JOIN tag_count ON tag_count.tag_id = tag.id
+WHERE file_tag.file_id = ?;
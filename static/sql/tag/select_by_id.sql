@@ -1,4 +1,3 @@
-SELECT tag.id, tag.name, tag.description, COUNT(file_tag.file_id) AS count FROM tag
-LEFT JOIN file_tag ON tag.id = file_tag.tag_id
-WHERE tag.id = ?
-GROUP BY tag.id;
\ No newline at end of file
+SELECT tag.id, tag.name, tag.description, tag_count.file_count AS count FROM tag
+LEFT JOIN tag_count ON tag_count.tag_id = tag.id
+WHERE tag.id = ?;
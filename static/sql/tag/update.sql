@@ -0,0 +1,3 @@
+UPDATE tag
+SET name = :name, description = :description
+WHERE id = :id;
\ No newline at end of file
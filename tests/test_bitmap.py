@@ -0,0 +1,202 @@
+import random
+import sqlite3
+from typing import Set
+
+import pytest
+
+from FileTagServer.DBI.bitmap import Bitmap, CHUNK_BITS, SPARSE_LIMIT
+from FileTagServer.DBI.tag.index import TagIndex, TagIndexJournal
+
+CHUNK = 1 << CHUNK_BITS
+
+
+def ids_near_chunks(count: int = 64) -> Set[int]:
+    # Either side of the first few chunk boundaries
+    return {boundary + offset for boundary in range(0, 4 * CHUNK, CHUNK) for offset in range(-count, count)
+            if boundary + offset >= 0}
+
+
+def dense(high: int, count: int = SPARSE_LIMIT + 1, seed: int = 0) -> Set[int]:
+    # 'count' random ids of the chunk
+    return {high * CHUNK + low for low in random.Random(seed).sample(range(CHUNK), count)}
+
+
+def sparse(high: int, seed: int = 0) -> Set[int]:
+    return dense(high, 100, seed)
+
+
+def assert_same(bitmap: Bitmap, expected: Set[int]):
+    assert list(bitmap) == sorted(expected)
+    assert len(bitmap) == len(expected)
+    assert bool(bitmap) == bool(expected)
+
+
+SETS = {
+    "empty": set(),
+    "near chunks": ids_near_chunks(),
+    "sparse": sparse(0) | sparse(2),
+    "dense": dense(0) | dense(1, seed=1),
+    "mixed": dense(0, seed=2) | sparse(1, 3) | dense(3, seed=4),
+    "at limit": dense(0, SPARSE_LIMIT, seed=5),
+    "full chunk": set(range(CHUNK, 2 * CHUNK)),
+}
+PAIRS = [(a, b) for a in SETS for b in SETS]
+
+
+@pytest.mark.parametrize("name", SETS)
+def test_construct(name: str):
+    assert_same(Bitmap(SETS[name]), SETS[name])
+
+
+@pytest.mark.parametrize("count", [SPARSE_LIMIT - 1, SPARSE_LIMIT, SPARSE_LIMIT + 1])
+def test_sparse_dense_threshold(count: int):
+    ids = dense(1, count)
+    bitmap = Bitmap(ids)
+    assert isinstance(bitmap.chunks[1], int) == (count > SPARSE_LIMIT)
+    assert_same(bitmap, ids)
+
+
+def test_add_converts_to_dense():
+    ids = dense(0, SPARSE_LIMIT)
+    bitmap = Bitmap(ids)
+    assert not isinstance(bitmap.chunks[0], int)
+    missing = next(id for id in range(CHUNK) if id not in ids)
+    bitmap.add(missing)
+    assert isinstance(bitmap.chunks[0], int)
+    assert_same(bitmap, ids | {missing})
+
+
+def test_add_discard():
+    bitmap = Bitmap()
+    expected = set()
+    rng = random.Random(6)
+    for _ in range(20000):
+        id = rng.choice([rng.randrange(4 * CHUNK), rng.randrange(CHUNK - 8, CHUNK + 8)])
+        if rng.random() < 0.7:
+            bitmap.add(id)
+            expected.add(id)
+        else:
+            bitmap.discard(id)
+            expected.discard(id)
+        assert (id in bitmap) == (id in expected)
+    assert_same(bitmap, expected)
+    for id in list(expected):
+        bitmap.discard(id)
+    assert_same(bitmap, set())
+    assert bitmap.chunks == {}
+
+
+@pytest.mark.parametrize("a,b", PAIRS)
+def test_set_operations(a: str, b: str):
+    left, right = Bitmap(SETS[a]), Bitmap(SETS[b])
+    assert_same(left & right, SETS[a] & SETS[b])
+    assert_same(left | right, SETS[a] | SETS[b])
+    assert_same(left - right, SETS[a] - SETS[b])
+    # The operands are left unchanged
+    assert_same(left, SETS[a])
+    assert_same(right, SETS[b])
+
+
+@pytest.mark.parametrize("a,b", PAIRS)
+def test_results_fit(a: str, b: str):
+    # A chunk is dense only above the limit, and never empty
+    for result in (Bitmap(SETS[a]) & Bitmap(SETS[b]), Bitmap(SETS[a]) - Bitmap(SETS[b])):
+        for chunk in result.chunks.values():
+            count = bin(chunk).count("1") if isinstance(chunk, int) else len(chunk)
+            assert count > 0
+            assert isinstance(chunk, int) == (count > SPARSE_LIMIT)
+
+
+@pytest.mark.parametrize("name", SETS)
+@pytest.mark.parametrize("descending", [False, True])
+def test_after(name: str, descending: bool):
+    bitmap, ids = Bitmap(SETS[name]), sorted(SETS[name], reverse=descending)
+    assert list(bitmap.after(None, descending)) == ids
+    # From ids in the bitmap, and between them
+    for id in ids[::max(1, len(ids) // 5)] + [0, CHUNK - 1, CHUNK, 4 * CHUNK]:
+        assert list(bitmap.after(id, descending)) == [other for other in ids if (other < id if descending else other > id)]
+
+
+def test_copy_is_independent():
+    result = Bitmap(SETS["mixed"]) | Bitmap()
+    copy = result.copy()
+    copy.add(5 * CHUNK)
+    copy.discard(min(SETS["mixed"]))
+    assert_same(result, SETS["mixed"])
+
+
+@pytest.mark.parametrize("name", SETS)
+def test_count_in(name: str):
+    counts = Bitmap(SETS[name]).count_in({other: Bitmap(ids) for other, ids in SETS.items()})
+    assert counts == {other: len(SETS[name] & ids) for other, ids in SETS.items()}
+
+
+@pytest.fixture
+def cursor() -> sqlite3.Cursor:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE file(id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TABLE file_tag(file_id INTEGER, tag_id INTEGER, PRIMARY KEY (tag_id, file_id))")
+    rng = random.Random(7)
+    file_ids = sorted(ids_near_chunks() | dense(1, seed=8))
+    conn.executemany("INSERT INTO file(id) VALUES (?)", [(id,) for id in file_ids])
+    conn.executemany("INSERT INTO file_tag(file_id, tag_id) VALUES (?, ?)",
+                     [(id, tag_id) for id in file_ids for tag_id in range(1, 6) if rng.random() < 0.3])
+    yield conn.cursor()
+    conn.close()
+
+
+def tagged(cursor: sqlite3.Cursor, tag_id: int) -> Set[int]:
+    cursor.execute("SELECT file_id FROM file_tag WHERE tag_id = ?", (tag_id,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def test_index_build(cursor: sqlite3.Cursor):
+    index = TagIndex.build(cursor)
+    cursor.execute("SELECT id FROM file")
+    assert_same(index.files, {row[0] for row in cursor.fetchall()})
+    for tag_id in range(1, 6):
+        assert_same(index.tag(tag_id), tagged(cursor, tag_id))
+    assert_same(index.tag(100), set())
+    usage = index.usage()
+    cursor.execute("SELECT COUNT(*) FROM file_tag")
+    assert usage.edges == cursor.fetchone()[0]
+
+
+def test_index_changes(cursor: sqlite3.Cursor):
+    index = TagIndex.build(cursor)
+    expected = {tag_id: tagged(cursor, tag_id) for tag_id in range(1, 6)}
+    new_id = 5 * CHUNK
+    index.add_file(new_id)
+    index.add_file_tags(new_id, [1, 6])
+    expected[1].add(new_id)
+    expected[6] = {new_id}
+
+    removed = min(expected[2])
+    index.remove_file(removed, [tag_id for tag_id, ids in expected.items() if removed in ids])
+    for ids in expected.values():
+        ids.discard(removed)
+    index.remove_file_tags(new_id, [6])
+    del expected[6]
+    index.remove_tag(5)
+    del expected[5]
+
+    assert new_id in index.files and removed not in index.files
+    assert set(index.tags) == set(expected)
+    for tag_id, ids in expected.items():
+        assert_same(index.tag(tag_id), ids)
+
+
+def test_journal_replays_writes(cursor: sqlite3.Cursor):
+    previous = TagIndex.build(cursor)
+    journal = TagIndexJournal(previous)
+    new_id = 5 * CHUNK
+    journal.add_file(new_id)
+    journal.add_file_tags(new_id, [1])
+    # Applied to the previous index at once, and to the new one (read before they were committed) on replay
+    assert new_id in previous.tag(1)
+    index = TagIndex.build(cursor)
+    journal.replay(index)
+    assert new_id in index.files and new_id in index.tag(1)
+    # Then forwarded
+    journal.remove_file_tags(new_id, [1])
+    assert new_id not in index.tag(1) and new_id in previous.tag(1)
@@ -0,0 +1,131 @@
+import sqlite3
+from typing import List
+
+import pytest
+
+from FileTagServer.DBI.cache import count_cache, search_cache, write_generation
+from FileTagServer.DBI.changes import outside_changes
+from FileTagServer.DBI.common import _connect, initialize_database
+from FileTagServer.DBI.counts import count_table
+from FileTagServer.DBI.file.old_file import CreateFileQuery, DeleteFileQuery, FileSearchQuery, FullModifyFileQuery, \
+    count_files, create_file, delete_file, modify_file, search_files
+from FileTagServer.DBI.pool import close_pools
+from FileTagServer.DBI.search import SearchQuery
+from FileTagServer.DBI.tag.index import drop_tag_indexes, get_tag_index, rebuild_tag_index
+
+TAGGED = SearchQuery(required=["red"])
+UNTAGGED = SearchQuery(exclude=["red"])
+
+
+def outside(db: str, *statements: str):
+    # Another process; e.g. a scan, or the sqlite3 shell
+    conn = sqlite3.connect(db)
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def search(db: str, search: SearchQuery) -> List[int]:
+    return [file.id for file in search_files(db, FileSearchQuery(search=search, fields=["id"])).files]
+
+
+def checkout(db: str):
+    # Notices writes by other processes; as the next request would
+    with _connect(db):
+        pass
+
+
+@pytest.fixture
+def db(tmp_path) -> str:
+    db = str(tmp_path / "cache.db")
+    initialize_database(db)
+    outside(db, "INSERT INTO tag (name) VALUES ('red')",
+            "INSERT INTO file (path, name) VALUES ('/1', 'one'), ('/2', 'two'), ('/3', 'three')",
+            "INSERT INTO file_tag (file_id, tag_id) VALUES (1, 1)")
+    yield db
+    drop_tag_indexes()
+    search_cache.clear()
+    count_cache.clear()
+    close_pools()
+
+
+def test_own_writes(db: str):
+    assert search(db, TAGGED) == [1]
+    assert search(db, UNTAGGED) == [2, 3]
+    assert count_table(db, "file").count == 3
+    hits = search_cache.usage().hits
+    assert search(db, TAGGED) == [1]
+    assert search_cache.usage().hits == hits + 1
+
+    modify_file(db, FullModifyFileQuery(id=2, name="two", tags=[1]))
+    assert search(db, TAGGED) == [1, 2]
+    assert search(db, UNTAGGED) == [3]
+    create_file(db, CreateFileQuery(path="/4", name="four"))
+    assert search(db, UNTAGGED) == [3, 4]
+    assert count_table(db, "file").count == 4
+    delete_file(db, DeleteFileQuery(id=3))
+    assert search(db, UNTAGGED) == [4]
+    assert count_files(db, FileSearchQuery(search=UNTAGGED)).count == 1
+
+
+def test_outside_writes(db: str):
+    assert search(db, TAGGED) == [1]
+    assert count_files(db, FileSearchQuery(search=TAGGED)).count == 1
+    assert count_table(db, "file").count == 3
+    outside(db, "INSERT INTO file_tag (file_id, tag_id) VALUES (3, 1)", "DELETE FROM file WHERE id = 2")
+    assert search(db, TAGGED) == [1, 3]
+    assert search(db, UNTAGGED) == []
+    assert count_files(db, FileSearchQuery(search=TAGGED)).count == 2
+    assert count_table(db, "file").count == 2
+
+
+def test_change_counts(db: str):
+    checkout(db)
+    with _connect(db) as (conn, cursor):
+        before = outside_changes(conn)
+    # Only writes by other processes are counted
+    modify_file(db, FullModifyFileQuery(id=2, name="two", tags=[1]))
+    with _connect(db) as (conn, cursor):
+        assert outside_changes(conn) == before
+    outside(db, "INSERT INTO file_tag (file_id, tag_id) VALUES (3, 1)", "UPDATE file SET name = 'new' WHERE id = 1")
+    with _connect(db) as (conn, cursor):
+        after = outside_changes(conn)
+    # Tagging a file also updates its tag_count
+    assert {kind: after[kind] - before[kind] for kind in after if after[kind] != before[kind]} == \
+        {'file_tag': 1, 'file_update': 2}
+
+
+def test_index_kept_by_own_writes(db: str):
+    index = rebuild_tag_index(db)
+    generation = write_generation()
+    modify_file(db, FullModifyFileQuery(id=2, name="two", tags=[1]))
+    create_file(db, CreateFileQuery(path="/4", name="four"))
+    checkout(db)
+    # Each write bumped the generation once; nothing was taken for another process's write
+    assert write_generation() == generation + 2
+    assert get_tag_index(db) is index
+    assert search(db, TAGGED) == [1, 2]
+    assert search(db, UNTAGGED) == [3, 4]
+
+
+def test_index_dropped_by_outside_writes(db: str, monkeypatch):
+    index = rebuild_tag_index(db)
+    # Another process's write of anything else does not touch the index
+    outside(db, "INSERT INTO folder (path, name) VALUES ('/', 'root')", "UPDATE file SET name = 'new' WHERE id = 1")
+    generation = write_generation()
+    checkout(db)
+    assert write_generation() > generation
+    assert get_tag_index(db) is index
+
+    monkeypatch.setattr("FileTagServer.config.tag_index_rebuild_delay", 60.0)
+    outside(db, "UPDATE file_tag SET file_id = 2 WHERE file_id = 1")
+    checkout(db)
+    # Searched in SQL until rebuilt
+    assert get_tag_index(db) is None
+    assert search(db, TAGGED) == [2]
+    assert search(db, UNTAGGED) == [1, 3]
+    rebuilt = rebuild_tag_index(db)
+    assert search(db, TAGGED) == [2]
+    checkout(db)
+    assert get_tag_index(db) is rebuilt
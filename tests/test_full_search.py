@@ -0,0 +1,161 @@
+import pytest
+
+from FileTagServer.DBI.error import ApiError
+from FileTagServer.DBI.full_search import SEARCH_AND, SEARCH_NOT, SEARCH_OR, SEARCH_TAG, TRUE, FALSE, normalize, \
+    parse, plan, plan_cache_info, to_search_query, to_string
+from FileTagServer.DBI.search import SearchQuery
+
+
+def tag(name: str):
+    return SEARCH_TAG, name
+
+
+def and_(*nodes):
+    return SEARCH_AND, nodes
+
+
+def or_(*nodes):
+    return SEARCH_OR, nodes
+
+
+def not_(node):
+    return SEARCH_NOT, node
+
+
+a, b, c, d = tag("a"), tag("b"), tag("c"), tag("d")
+
+
+@pytest.mark.parametrize("query,expected", [
+    ("a", a),
+    ("a AND b", and_(a, b)),
+    ("a b", and_(a, b)),
+    ("a OR b", or_(a, b)),
+    # NOT binds tighter than AND, which binds tighter than OR
+    ("a OR b AND c", or_(a, and_(b, c))),
+    ("a AND b OR c", or_(and_(a, b), c)),
+    ("NOT a AND b", and_(not_(a), b)),
+    ("NOT a OR b", or_(not_(a), b)),
+    ("a NOT b", and_(a, not_(b))),
+    ("NOT NOT a", not_(not_(a))),
+    ("(a OR b) AND c", and_(or_(a, b), c)),
+    ("a OR (b OR c) d", or_(a, and_(or_(b, c), d))),
+    ("NOT (a OR b)", not_(or_(a, b))),
+    ("", TRUE),
+    ("   ", TRUE),
+    ("()", TRUE),
+])
+def test_precedence(query: str, expected):
+    assert parse(query) == expected
+
+
+@pytest.mark.parametrize("query,expected", [
+    ('"big bird"', tag("big bird")),
+    ('"a AND b"', tag("a AND b")),
+    ('"(x)"', tag("(x)")),
+    ('"say \\"hi\\""', tag('say "hi"')),
+    ('"back\\\\slash"', tag("back\\slash")),
+    ("sad\\ face", tag("sad face")),
+    ("\\AND", tag("AND")),
+    ("\\NOT a", and_(tag("NOT"), a)),
+    ("a\\(b\\)", tag("a(b)")),
+    ("and or not", and_(tag("and"), tag("or"), tag("not"))),
+    ('cat "big bird"', and_(tag("cat"), tag("big bird"))),
+    ('(dog)"bird"', and_(tag("dog"), tag("bird"))),
+])
+def test_terms(query: str, expected):
+    assert parse(query) == expected
+
+
+@pytest.mark.parametrize("name", ["plain", "big bird", 'say "hi"', "back\\slash", "AND", "(x)", ""])
+def test_to_string_round_trip(name: str):
+    for node in (tag(name), not_(tag(name)), and_(tag(name), or_(a, not_(b)))):
+        assert parse(to_string(node)) == node
+
+
+@pytest.mark.parametrize("query,expected", [
+    # Constant folding
+    ("a AND NOT a", FALSE),
+    ("a OR NOT a", TRUE),
+    ("b AND (a AND NOT a)", FALSE),
+    ("b OR (a AND NOT a)", b),
+    ("a AND ()", a),
+    ("a OR ()", TRUE),
+    ("a AND NOT ()", FALSE),
+    ("a OR NOT ()", a),
+    ("NOT ()", FALSE),
+    ("NOT NOT ()", TRUE),
+    # Double negation, flattening, duplicates
+    ("NOT NOT a", a),
+    ("a AND (b AND c)", and_(a, b, c)),
+    ("a OR (b OR (c OR d))", or_(a, b, c, d)),
+    ("a AND a", a),
+    ("a OR b OR a", or_(a, b)),
+    ("(a OR b) AND (b OR a)", or_(a, b)),
+])
+def test_normalize(query: str, expected):
+    assert normalize(parse(query)) == expected
+
+
+def test_normalize_orders_children():
+    assert normalize(parse("b AND a AND NOT c")) == normalize(parse("NOT c a b"))
+    assert to_string(normalize(parse("(d OR c) b a"))) == to_string(normalize(parse("a b (c OR d)")))
+
+
+@pytest.mark.parametrize("query,message,position", [
+    ("(", "expected a tag", 1),
+    ("a AND", "expected a tag", 5),
+    ("a OR OR b", "expected a tag, found 'OR'", 5),
+    ("NOT", "expected a tag", 3),
+    ("(a OR b", "unclosed group", 0),
+    ("a (b (c)", "unclosed group", 2),
+    ("a)", "unexpected ')'", 1),
+    ("a) AND b", "unexpected ')'", 1),
+    ('a "b', "unterminated literal", 2),
+    ('"a\\"', "unterminated literal", 0),
+    ("AND a", "expected a tag, found 'AND'", 0),
+])
+def test_errors(query: str, message: str, position: int):
+    with pytest.raises(ApiError) as info:
+        parse(query)
+    assert info.value.status_code == 400
+    assert info.value.message == f"Invalid search: {message} at position {position}"
+
+
+@pytest.mark.parametrize("query,expected", [
+    ("", SearchQuery()),
+    ("a", SearchQuery(required=["a"])),
+    ("a NOT b", SearchQuery(required=["a"], exclude=["b"])),
+    ("a OR b", SearchQuery(include=["a", "b"])),
+    ("NOT (a OR b)", SearchQuery(exclude=[SearchQuery(include=["a", "b"])])),
+    ("c (a OR b)", SearchQuery(required=[SearchQuery(include=["a", "b"]), "c"])),
+])
+def test_to_search_query(query: str, expected: SearchQuery):
+    assert to_search_query(normalize(parse(query))) == expected
+
+
+def test_plan():
+    assert plan("a AND NOT a").search is None
+    assert plan("b a").search == SearchQuery(required=["a", "b"])
+    assert plan("b a").normalized == plan("a AND b").normalized == '"a" AND "b"'
+
+
+def test_plan_cache():
+    plan("cache_x OR cache_y")
+    (_, _, _, normalized_size), (plan_hits, _, _, plan_size) = plan_cache_info()
+    # A repeat skips parsing; an equivalent search shares the plan
+    plan("cache_x OR cache_y")
+    plan("cache_y OR cache_x")
+    (normalized_hits, _, _, normalized_size_after), (plan_hits_after, _, _, plan_size_after) = plan_cache_info()
+    assert normalized_size_after == normalized_size + 1
+    assert plan_size_after == plan_size
+    assert plan_hits_after == plan_hits + 2
+
+
+def test_plan_errors_not_cached():
+    (_, normalized_misses, _, normalized_size), _ = plan_cache_info()
+    for _ in range(2):
+        with pytest.raises(ApiError):
+            plan("cache_z AND")
+    (_, normalized_misses_after, _, normalized_size_after), _ = plan_cache_info()
+    assert normalized_misses_after == normalized_misses + 2
+    assert normalized_size_after == normalized_size
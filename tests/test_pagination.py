@@ -0,0 +1,153 @@
+import itertools
+import sqlite3
+from typing import List, Optional
+
+import pytest
+from pydantic import ValidationError
+
+from FileTagServer.DBI.common import SortQuery
+from FileTagServer.DBI.error import ApiError
+from FileTagServer.DBI.file.old_file import FilesQuery
+from FileTagServer.DBI.pagination import decode_cursor, encode_cursor, keyset_sort, keyset_where, order_by, \
+    sort_index, validate_sort
+from FileTagServer.DBI.query_builder import QueryBuilder
+
+INDEXES = {'item': [], 'item_name': ['name'], 'item_name_size': ['name', 'size']}
+# Few distinct values, NULLs included; most rows tie on the sort key
+NAMES = [None, "a", "b", "c"]
+SIZES = [None, 1, 2]
+
+
+@pytest.fixture(scope="module")
+def conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE item(id INTEGER PRIMARY KEY, name TEXT, size INTEGER)")
+    conn.executemany("INSERT INTO item(name, size) VALUES (?, ?)",
+                     [(name, size) for _ in range(3) for name, size in itertools.product(NAMES, SIZES)])
+    yield conn
+    conn.close()
+
+
+def sort(text: str) -> List[SortQuery]:
+    return SortQuery.parse_str(text)
+
+
+def select(conn: sqlite3.Connection, sort: List[SortQuery], values: Optional[List] = None,
+           limit: Optional[int] = None) -> List[tuple]:
+    fields = [part.field for part in sort]
+    builder = QueryBuilder("item", [f"item.{field}" for field in fields]).order_by(*order_by(sort, "item"))
+    if values is not None:
+        builder.where_any(keyset_where(sort, values, "item"))
+    sql, args = builder.limit(limit).build()
+    return conn.execute(sql, args).fetchall()
+
+
+def pages(conn: sqlite3.Connection, sort: List[SortQuery], size: int) -> List[tuple]:
+    # Every row, a page at a time; the cursor holds the last row's sort values
+    rows = []
+    cursor = None
+    while True:
+        page = select(conn, sort, None if cursor is None else decode_cursor(sort, cursor), size)
+        assert len(page) <= size
+        rows.extend(page)
+        if len(page) < size:
+            return rows
+        cursor = encode_cursor(sort, list(page[-1]))
+
+
+SORTS = ["name", "-name", "name,size", "-name,-size", "name,-size", "-name,size", "size,name", "id", "-id"]
+
+
+@pytest.mark.parametrize("text", SORTS)
+@pytest.mark.parametrize("size", [1, 2, 5, 7, 100])
+def test_pages_match_order(conn: sqlite3.Connection, text: str, size: int):
+    paging_sort = keyset_sort(sort(text))
+    assert pages(conn, paging_sort, size) == select(conn, paging_sort)
+
+
+@pytest.mark.parametrize("text", SORTS)
+def test_after_every_row(conn: sqlite3.Connection, text: str):
+    # The rows after each row (NULL or not, first or last) are exactly the rest of the order
+    paging_sort = keyset_sort(sort(text))
+    rows = select(conn, paging_sort)
+    for i, row in enumerate(rows):
+        assert select(conn, paging_sort, list(row)) == rows[i + 1:]
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_null_branches(ascending: bool):
+    paging_sort = keyset_sort([SortQuery(field="name", ascending=ascending)])
+    # A NULL cursor value; ascending, the non-NULL rows and the remaining NULLs follow; descending, only NULLs
+    branches = keyset_where(paging_sort, [None, 5], "item")
+    clauses = [clause for clause, _ in branches]
+    assert ("item.name IS NOT NULL" in clauses) == ascending
+    # Descending, a non-NULL cursor value is followed by the lower values and then every NULL
+    branches = keyset_where(paging_sort, ["b", 5], "item")
+    assert (("item.name IS NULL", []) in branches) == (not ascending)
+
+
+def test_last_row_matches_nothing():
+    # Descending by id alone, with the smallest id; no rows can follow
+    assert keyset_where(keyset_sort(sort("-id")), [None], "item") == [("0", [])]
+
+
+def test_ties_broken_by_id(conn: sqlite3.Connection):
+    for text in ["name", "-name,size"]:
+        paging_sort = keyset_sort(sort(text))
+        assert paging_sort[-1].field == "id"
+        assert paging_sort[-1].ascending == paging_sort[-2].ascending
+        rows = select(conn, paging_sort)
+        # Every row is distinct once the id is included, even though the rest tie
+        assert len(set(rows)) == len(rows)
+        assert len({row[:-1] for row in rows}) < len(rows)
+
+
+def test_keyset_sort():
+    assert keyset_sort(None) == [SortQuery(field="id")]
+    assert keyset_sort(sort("-id,name")) == sort("-id,name")
+    assert keyset_sort(sort("-name")) == sort("-name,-id")
+
+
+@pytest.mark.parametrize("text,index", [
+    (None, 'item'),
+    ("name", 'item_name'),
+    ("-name,-id", 'item_name'),
+    ("name,size", 'item_name_size'),
+    ("name,size,id", 'item_name_size'),
+    ("name,-size", None),
+    ("size", None),
+    ("bogus", None),
+])
+def test_sort_index(text: Optional[str], index: Optional[str]):
+    assert sort_index(sort(text), INDEXES) == index
+
+
+@pytest.mark.parametrize("text", ["bogus", "size", "name,-size", "id,name"])
+def test_validate_sort_rejects(text: str):
+    with pytest.raises(ValueError, match="Unsupported sort"):
+        validate_sort(sort(text), INDEXES)
+
+
+@pytest.mark.parametrize("text", ["bogus", "-bogus", "name,bogus", "name,-tag_count"])
+def test_files_query_rejects_sort(text: str):
+    with pytest.raises(ValidationError):
+        FilesQuery(sort=sort(text))
+
+
+@pytest.mark.parametrize("text", ["name", "-mime,-name", "-path", "tag_count"])
+def test_files_query_accepts_sort(text: str):
+    assert FilesQuery(sort=sort(text)).sort == sort(text)
+
+
+def test_cursor_round_trip():
+    paging_sort = keyset_sort(sort("-name,size"))
+    values = [None, 2, 17]
+    assert decode_cursor(paging_sort, encode_cursor(paging_sort, values)) == values
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor(sort("name,id"), ["a", 1]),
+                                    encode_cursor(sort("-name,-id"), ["a"])])
+def test_cursor_rejects(cursor: str):
+    with pytest.raises(ApiError) as info:
+        decode_cursor(sort("-name,-id"), cursor)
+    assert info.value.status_code == 400
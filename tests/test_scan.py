@@ -0,0 +1,173 @@
+import mimetypes
+import os
+import sqlite3
+from typing import Dict, Set, Tuple
+
+import pytest
+
+from FileTagServer.DBI.common import initialize_database
+from FileTagServer.DBI.ingest import BulkIngest, IngestStats, folder_mtimes
+from FileTagServer.DBI.reap import Reaper, ReapStats
+from FileTagServer.scan.hashing import Hasher
+from FileTagServer.scan.walker import ParallelWalker
+
+# Directories are backdated after every change; a directory changed within the last few seconds is always listed in
+#   full (see scan.walker), so an unchanged one would not be skipped otherwise
+BACKDATE_NS = 60 * 1_000_000_000
+
+
+def write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+
+def backdate(root: str):
+    for folder, _, _ in os.walk(root):
+        mtime = os.stat(folder).st_mtime_ns - BACKDATE_NS
+        os.utime(folder, ns=(mtime, mtime))
+
+
+def scan(db: str, root: str, batch_size: int = 3) -> Tuple[IngestStats, ReapStats]:
+    # As 'add_and_update_files' (main/Local Server); small batches, so every scan spans several, and hashed in process
+    reaper = Reaper(db, batch_size)
+    with Hasher(workers=0) as hasher, BulkIngest(db, batch_size, hasher.hash) as ingest:
+        for listing in ParallelWalker(4).walk([root], folder_mtimes(db)):
+            assert not listing.errors
+            if listing.unchanged:
+                ingest.add_unchanged(len(listing.folders), len(listing.files))
+                continue
+            for folder in listing.folders:
+                ingest.add_folder(folder.path, folder.name, folder.parent)
+            for file in listing.files:
+                ingest.add_file(file.path, file.name, mimetypes.guess_type(file.path)[0], file.parent,
+                                file.size, file.mtime, file.inode)
+            if listing.directory is not None:
+                ingest.add_listed(listing.directory, listing.mtime)
+                reaper.add_listing(listing.directory, [entry.path for entry in listing.folders + listing.files])
+    return ingest.stats, reaper.reap()
+
+
+def rows(db: str, sql: str) -> list:
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def file_ids(db: str) -> Dict[str, int]:
+    return {path: id for id, path in rows(db, "SELECT id, path FROM file")}
+
+
+def folder_ids(db: str) -> Dict[str, int]:
+    return {path: id for id, path in rows(db, "SELECT id, path FROM folder")}
+
+
+def tree(root: str) -> Tuple[Set[str], Set[str]]:
+    folders, files = set(), set()
+    for folder, _, names in os.walk(root):
+        folders.add(folder)
+        files.update(os.path.join(folder, name) for name in names)
+    return folders, files
+
+
+@pytest.fixture
+def root(tmp_path) -> str:
+    root = str(tmp_path / "share")
+    for folder in ["a", "a/b", "c"]:
+        for i in range(3):
+            write(os.path.join(root, folder, f"{i}.txt"), f"{folder} {i}")
+    backdate(root)
+    return root
+
+
+@pytest.fixture
+def db(tmp_path) -> str:
+    db = str(tmp_path / "scan.db")
+    initialize_database(db)
+    return db
+
+
+def test_scan(db: str, root: str):
+    stats, reaped = scan(db, root)
+    folders, files = tree(root)
+    assert set(folder_ids(db)) == folders
+    assert set(file_ids(db)) == files
+    assert (stats.new_folders, stats.new_files, stats.hashed_files) == (len(folders), len(files), len(files))
+    assert reaped.files == reaped.folders == 0
+    # Every entry is linked to its parent
+    assert len(rows(db, "SELECT * FROM folder_folder")) == len(folders) - 1
+    assert rows(db, "SELECT file.path, folder.path FROM folder_file JOIN file ON file.id = folder_file.file_id "
+                    "JOIN folder ON folder.id = folder_file.folder_id") == \
+        [(path, os.path.dirname(path)) for path in sorted(files, key=file_ids(db).get)]
+
+
+def test_rescan_unchanged(db: str, root: str):
+    scan(db, root)
+    before = rows(db, "SELECT * FROM sqlite_sequence ORDER BY name"), folder_ids(db), file_ids(db)
+    stats, reaped = scan(db, root)
+    assert (stats.new_folders, stats.new_files, stats.changed_files, stats.moved_files) == (0, 0, 0, 0)
+    assert stats.hashed_files == 0
+    assert stats.unchanged_folders == len(tree(root)[0])
+    assert reaped.files == reaped.folders == 0
+    # Known paths take no ids
+    assert (rows(db, "SELECT * FROM sqlite_sequence ORDER BY name"), folder_ids(db), file_ids(db)) == before
+
+
+def test_rescan_changed_folder(db: str, root: str):
+    scan(db, root)
+    ids = folder_ids(db)
+    sequence = rows(db, "SELECT seq FROM sqlite_sequence WHERE name = 'folder'")
+    write(os.path.join(root, "a", "new.txt"), "new")
+    stats, _ = scan(db, root)
+    assert (stats.new_folders, stats.new_files) == (0, 1)
+    assert folder_ids(db) == ids
+    assert rows(db, "SELECT seq FROM sqlite_sequence WHERE name = 'folder'") == sequence
+
+
+def test_move_keeps_tags(db: str, root: str):
+    scan(db, root)
+    old, new = os.path.join(root, "a", "b", "1.txt"), os.path.join(root, "c", "moved.txt")
+    id = file_ids(db)[old]
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO tag (name) VALUES ('kept')")
+    conn.execute("INSERT INTO file_tag (file_id, tag_id) SELECT ?, tag.id FROM tag WHERE tag.name = 'kept'", [id])
+    conn.commit()
+    conn.close()
+
+    os.rename(old, new)
+    stats, reaped = scan(db, root)
+    assert (stats.moved_files, stats.new_files) == (1, 0)
+    assert reaped.files == 0
+    assert file_ids(db).get(new) == id
+    assert old not in file_ids(db)
+    assert rows(db, f"SELECT tag.name FROM file_tag JOIN tag ON tag.id = file_tag.tag_id WHERE file_id = {id}") == \
+        [("kept",)]
+    assert rows(db, f"SELECT folder.path FROM folder_file JOIN folder ON folder.id = folder_file.folder_id "
+                    f"WHERE file_id = {id}") == [(os.path.join(root, "c"),)]
+
+
+def test_reap(db: str, root: str):
+    scan(db, root)
+    removed_file = os.path.join(root, "c", "0.txt")
+    removed_folder = os.path.join(root, "a", "b")
+    id = file_ids(db)[os.path.join(removed_folder, "2.txt")]
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO tag (name) VALUES ('gone')")
+    conn.execute("INSERT INTO file_tag (file_id, tag_id) SELECT ?, tag.id FROM tag WHERE tag.name = 'gone'", [id])
+    conn.commit()
+    conn.close()
+
+    os.remove(removed_file)
+    for name in os.listdir(removed_folder):
+        os.remove(os.path.join(removed_folder, name))
+    os.rmdir(removed_folder)
+    stats, reaped = scan(db, root)
+    folders, files = tree(root)
+    assert (reaped.files, reaped.folders) == (4, 1)
+    assert set(file_ids(db)) == files
+    assert set(folder_ids(db)) == folders
+    assert rows(db, "SELECT * FROM file_tag") == []
+    assert rows(db, "SELECT file_count FROM tag_count JOIN tag ON tag.id = tag_count.tag_id "
+                    "WHERE tag.name = 'gone'") == [(0,)]
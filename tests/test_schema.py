@@ -0,0 +1,137 @@
+import sqlite3
+from typing import List
+
+import pytest
+
+from FileTagServer.DBI.common import initialize_database
+from FileTagServer.DBI.file import queries as file_queries
+from FileTagServer.DBI.file.old_file import FileTextQuery, text_search_files
+from FileTagServer.DBI.file.text import check_file_text
+from FileTagServer.DBI.migrations import latest_version, migrate
+from FileTagServer.DBI.pool import close_pools
+from FileTagServer.DBI.tag import queries as tag_queries
+
+
+def connect(db: str) -> sqlite3.Connection:
+    # Written around the DBI; only the triggers keep the counts & the text index
+    conn = sqlite3.connect(db)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def count_errors(conn: sqlite3.Connection) -> List[tuple]:
+    return conn.execute(tag_queries.select_count_errors).fetchall() + \
+        conn.execute("SELECT id, tag_count FROM file "
+                     "WHERE tag_count != (SELECT COUNT(*) FROM file_tag WHERE file_tag.file_id = file.id)").fetchall()
+
+
+def tag_counts(conn: sqlite3.Connection) -> List[tuple]:
+    return conn.execute("SELECT tag_id, file_count, folder_count FROM tag_count ORDER BY tag_id").fetchall()
+
+
+def text_search(db: str, text: str) -> List[int]:
+    return sorted(file.id for file in text_search_files(db, FileTextQuery(text=text, fields=["id"])).files)
+
+
+@pytest.fixture
+def db(tmp_path) -> str:
+    db = str(tmp_path / "schema.db")
+    initialize_database(db)
+    conn = connect(db)
+    conn.executemany("INSERT INTO tag (name) VALUES (?)", [("red",), ("blue",)])
+    conn.executemany("INSERT INTO file (path, name, description) VALUES (?, ?, ?)",
+                     [("/photos/cat.png", "cat", "a red cat"), ("/photos/dog.png", "dog", None),
+                      ("/music/song.mp3", "song", "blue")])
+    conn.execute("INSERT INTO folder (path, name) VALUES ('/photos', 'photos')")
+    conn.commit()
+    conn.close()
+    yield db
+    close_pools()
+
+
+def test_migrate_from_old_version(tmp_path):
+    # Written before the counts & the text index existed; backfilled by their migrations
+    db = str(tmp_path / "old.db")
+    assert migrate(db, target=2) == 2
+    conn = connect(db)
+    conn.executemany("INSERT INTO tag (name) VALUES (?)", [("red",), ("blue",)])
+    conn.executemany("INSERT INTO file (path, name) VALUES (?, ?)", [("/a/one", "one"), ("/a/two", "two")])
+    conn.executemany("INSERT INTO file_tag (file_id, tag_id) VALUES (?, ?)", [(1, 1), (2, 1), (2, 2)])
+    conn.commit()
+
+    assert migrate(db) == latest_version()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == latest_version()
+    assert tag_counts(conn) == [(1, 2, 0), (2, 1, 0)]
+    assert conn.execute("SELECT id, tag_count FROM file ORDER BY id").fetchall() == [(1, 1), (2, 2)]
+    assert count_errors(conn) == []
+    conn.close()
+    assert check_file_text(db) == []
+    assert text_search(db, "two") == [2]
+    assert text_search(db, "a") == [1, 2]
+    # Nothing left to apply
+    assert migrate(db) == latest_version()
+    close_pools()
+
+
+def test_tag_count_triggers(db: str):
+    conn = connect(db)
+    conn.executemany("INSERT INTO file_tag (file_id, tag_id) VALUES (?, ?)", [(1, 1), (2, 1), (3, 2)])
+    conn.execute("INSERT INTO folder_tag (folder_id, tag_id) VALUES (1, 2)")
+    assert tag_counts(conn) == [(1, 2, 0), (2, 1, 1)]
+    assert count_errors(conn) == []
+
+    conn.execute("UPDATE file_tag SET tag_id = 2 WHERE file_id = 2")
+    assert tag_counts(conn) == [(1, 1, 0), (2, 2, 1)]
+    conn.execute("UPDATE file_tag SET file_id = 3 WHERE file_id = 1")
+    conn.execute("DELETE FROM folder_tag")
+    assert tag_counts(conn) == [(1, 1, 0), (2, 2, 0)]
+    assert count_errors(conn) == []
+
+    # A tag's new id keeps its counts; its uses follow it (ON UPDATE CASCADE)
+    conn.execute("UPDATE tag SET id = 10 WHERE id = 1")
+    assert tag_counts(conn) == [(2, 2, 0), (10, 1, 0)]
+    conn.execute("DELETE FROM file_tag WHERE tag_id = 10")
+    conn.execute("DELETE FROM tag WHERE id = 10")
+    conn.execute("INSERT INTO tag (name) VALUES ('green')")
+    assert tag_counts(conn) == [(2, 2, 0), (3, 0, 0)]
+    assert count_errors(conn) == []
+    conn.commit()
+    conn.close()
+
+
+def test_file_text_triggers(db: str):
+    assert text_search(db, "red") == [1]
+    assert text_search(db, "photos") == [1, 2]
+    assert text_search(db, "so*") == [3]
+    conn = connect(db)
+    conn.execute("UPDATE file SET description = 'a red dog', path = '/pets/dog.png' WHERE id = 2")
+    conn.execute("UPDATE file SET name = 'tune' WHERE id = 3")
+    conn.execute("DELETE FROM file WHERE id = 1")
+    conn.execute("INSERT INTO file (path, name) VALUES ('/photos/red.png', 'red')")
+    # Not a text column; the index is not touched
+    conn.execute("UPDATE file SET mime = 'audio/mpeg' WHERE id = 3")
+    conn.commit()
+    conn.close()
+    assert check_file_text(db) == []
+    assert text_search(db, "red") == [2, 4]
+    assert text_search(db, "photos") == [4]
+    assert text_search(db, "song") == [3]
+    assert text_search(db, "tune") == [3]
+    assert text_search(db, "cat") == []
+
+
+def test_file_text_rebuild(db: str):
+    conn = connect(db)
+    conn.execute(f"DROP TRIGGER {file_queries.text_table}_update")
+    conn.execute("UPDATE file SET name = 'kitten' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    assert text_search(db, "kitten") == []
+    # Rebuilt by its migration's backfill
+    conn = connect(db)
+    for statement in file_queries.create_text_triggers + [file_queries.rebuild_text]:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+    assert check_file_text(db) == []
+    assert text_search(db, "kitten") == [1]
@@ -0,0 +1,222 @@
+import random
+import sqlite3
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import pytest
+
+from FileTagServer import config
+from FileTagServer.DBI import relations
+from FileTagServer.DBI.cache import search_cache
+from FileTagServer.DBI.common import SortQuery, _connect, initialize_database
+from FileTagServer.DBI.file.old_file import FileSearchQuery, count_files, search_files
+from FileTagServer.DBI.search import SearchQuery, compile_search, count_search, estimate_search, search_index
+from FileTagServer.DBI.tag.index import drop_tag_indexes, rebuild_tag_index
+
+FILES = 400
+# From almost every file to almost none; 'missing' is not a tag
+TAGS = {"most": 0.9, "half": 0.5, "third": 0.33, "tenth": 0.1, "few": 0.02, "none": 0.0}
+NAMES = list(TAGS) + ["missing"]
+MIMES = ["text/plain", "image/png", None]
+
+Search = Union[SearchQuery, str]
+
+
+def matches(search: Search, tags: Set[str]) -> bool:
+    # What a search means, in Python
+    if isinstance(search, str):
+        return search in tags
+    return all(matches(term, tags) for term in search.required or []) and \
+        (not search.include or any(matches(term, tags) for term in search.include)) and \
+        not any(matches(term, tags) for term in search.exclude or [])
+
+
+def random_search(r: random.Random, depth: int = 2) -> SearchQuery:
+    def terms() -> Optional[List[Search]]:
+        if r.random() < 0.4:
+            return None
+        return [random_search(r, depth - 1) if depth > 0 and r.random() < 0.3 else r.choice(NAMES)
+                for _ in range(r.randint(0, 3))]
+    return SearchQuery(required=terms(), include=terms(), exclude=terms())
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory) -> Tuple[str, Dict[int, Set[str]]]:
+    # The database, and the tags of every file; written around the DBI, like a scan
+    db = str(tmp_path_factory.mktemp("search") / "search.db")
+    initialize_database(db)
+    r = random.Random(0)
+    conn = sqlite3.connect(db)
+    conn.executemany("INSERT INTO tag (name) VALUES (?)", [(name,) for name in TAGS])
+    conn.executemany("INSERT INTO file (path, name, mime) VALUES (?, ?, ?)",
+                     [(f"/{i}", f"file {i}", r.choice(MIMES)) for i in range(FILES)])
+    tag_ids = dict(conn.execute("SELECT name, id FROM tag").fetchall())
+    files = {id: {name for name, p in TAGS.items() if r.random() < p}
+             for id, in conn.execute("SELECT id FROM file").fetchall()}
+    conn.executemany("INSERT INTO file_tag (file_id, tag_id) VALUES (?, ?)",
+                     [(id, tag_ids[name]) for id, names in files.items() for name in names])
+    conn.commit()
+    conn.close()
+    return db, files
+
+
+@pytest.fixture
+def library(database) -> Dict[int, Set[str]]:
+    return database[1]
+
+
+@pytest.fixture
+def db(database) -> str:
+    yield database[0]
+    drop_tag_indexes()
+    search_cache.clear()
+
+
+def expected(library: Dict[int, Set[str]], search: Optional[SearchQuery]) -> List[int]:
+    return sorted(id for id, tags in library.items() if search is None or matches(search, tags))
+
+
+def compiled(db: str, search: SearchQuery) -> List[int]:
+    with _connect(db) as (conn, cursor):
+        clauses = compile_search(cursor, search, relations.file_tags, "file.id")
+        if clauses is None:
+            return []
+        where = " AND ".join(f"({clause})" for clause, _ in clauses) or "1"
+        cursor.execute(f"SELECT file.id FROM file WHERE {where} ORDER BY file.id",
+                       [arg for _, args in clauses for arg in args])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def pages(db: str, limit: int, **kwargs) -> List[int]:
+    ids = []
+    cursor = None
+    while True:
+        page = search_files(db, FileSearchQuery(limit=limit, cursor=cursor, fields=["id"], **kwargs))
+        ids.extend(file.id for file in page.files)
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compile_search(library, db: str, seed: int):
+    r = random.Random(seed)
+    for _ in range(40):
+        search = random_search(r)
+        assert compiled(db, search) == expected(library, search), search
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_search_index(library, db: str, seed: int):
+    # The same searches on the bitmaps; the SQL path above and this one agree with each other and with Python
+    index = rebuild_tag_index(db)
+    r = random.Random(seed)
+    with _connect(db) as (conn, cursor):
+        for _ in range(40):
+            search = random_search(r)
+            ids = expected(library, search)
+            assert list(search_index(cursor, search, index)) == ids, search
+            assert count_search(cursor, search, index) == len(ids), search
+
+
+def test_compile_trivial(db: str):
+    with _connect(db) as (conn, cursor):
+        # Decided without reading a file; an unknown tag matches nothing, an empty search everything
+        assert compile_search(cursor, SearchQuery(required=["missing"]), relations.file_tags, "file.id") is None
+        assert compile_search(cursor, SearchQuery(include=["most"], exclude=["missing"]), relations.file_tags,
+                              "file.id") != []
+        assert compile_search(cursor, SearchQuery(), relations.file_tags, "file.id") == []
+        assert compile_search(cursor, None, relations.file_tags, "file.id") == []
+        # The rarest required tag drives the query
+        clauses = compile_search(cursor, SearchQuery(required=["most", "few"]), relations.file_tags, "file.id")
+        cursor.execute("SELECT id FROM tag WHERE name = 'few'")
+        assert len(clauses) == 1 and clauses[0][1][0] == cursor.fetchone()[0]
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+@pytest.mark.parametrize("cached", [False, True])
+def test_search_files(library, db: str, monkeypatch, indexed: bool, cached: bool):
+    monkeypatch.setattr(search_cache, "max_entries", config.search_cache_entries if cached else 0)
+    if indexed:
+        rebuild_tag_index(db)
+    r = random.Random(10)
+    for limit in [7, 50]:
+        for _ in range(10):
+            search = random_search(r)
+            ids = expected(library, search)
+            assert pages(db, limit, search=search) == ids, search
+            # Ordered by name, only the order differs
+            assert sorted(pages(db, limit, search=search, sort=SortQuery.parse_str("-name"))) == ids, search
+            count = count_files(db, FileSearchQuery(search=search))
+            assert (count.count, count.exact) == (len(ids), True), search
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_search_strings(library, db: str, indexed: bool):
+    # The search strings are the same searches
+    if indexed:
+        rebuild_tag_index(db)
+    searches = {
+        "most AND NOT half": SearchQuery(required=["most"], exclude=["half"]),
+        "few OR tenth": SearchQuery(include=["few", "tenth"]),
+        "NOT most": SearchQuery(exclude=["most"]),
+    }
+    for query, search in searches.items():
+        assert pages(db, 20, query=query) == expected(library, search), query
+    simple = {
+        "most -half": SearchQuery(required=["most"], exclude=["half"]),
+        "~few ~tenth": SearchQuery(include=["few", "tenth"]),
+        "-most": SearchQuery(exclude=["most"]),
+        "half missing": SearchQuery(required=["half", "missing"]),
+    }
+    for query, search in simple.items():
+        assert pages(db, 20, simple=query) == expected(library, search), query
+        assert count_files(db, FileSearchQuery(simple=query)).count == len(expected(library, search)), query
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_facets(library, db: str, indexed: bool):
+    if indexed:
+        rebuild_tag_index(db)
+    with _connect(db) as (conn, cursor):
+        cursor.execute("SELECT id, name FROM tag")
+        tag_ids = {name: id for id, name in cursor.fetchall()}
+        cursor.execute("SELECT id, mime FROM file")
+        mimes = dict(cursor.fetchall())
+    r = random.Random(20)
+    for search in [None, SearchQuery(required=["missing"])] + [random_search(r) for _ in range(15)]:
+        ids = expected(library, search)
+        # Over every match, not just the page
+        facets = search_files(db, FileSearchQuery(limit=5, search=search, facets=3)).facets
+        assert facets.files == len(ids)
+        tags = Counter(tag_ids[name] for id in ids for name in library[id])
+        top = sorted(tags.items(), key=lambda item: (-item[1], item[0]))[:3]
+        assert [(tag.id, tag.count) for tag in facets.tags] == top, search
+        counts = Counter(mimes[id] for id in ids)
+        assert {mime.mime: mime.count for mime in facets.mimes} == \
+            dict(sorted(counts.items(), key=lambda item: (-item[1], item[0] or ""))[:3]), search
+
+
+def test_estimate(library, db: str, monkeypatch):
+    # Without an index, a search that may match more than the limit is estimated from the tag counts
+    monkeypatch.setattr(config, "count_exact_limit", 0)
+    r = random.Random(30)
+    with _connect(db) as (conn, cursor):
+        for _ in range(40):
+            search = random_search(r)
+            actual = len(expected(library, search))
+            estimate, bound = estimate_search(cursor, search, FILES)
+            assert actual <= bound and 0 <= estimate <= bound, search
+        # A single tag is counted exactly
+        for name in TAGS:
+            search = SearchQuery(required=[name])
+            assert estimate_search(cursor, search, FILES)[0] == len(expected(library, search))
+        assert estimate_search(cursor, SearchQuery(required=["missing"]), FILES) == (0, 0)
+        assert estimate_search(cursor, None, FILES) == (FILES, FILES)
+    search = SearchQuery(required=["half"], exclude=["tenth"])
+    count = count_files(db, FileSearchQuery(search=search))
+    assert not count.exact
+    # Once indexed, every count is exact
+    rebuild_tag_index(db)
+    count = count_files(db, FileSearchQuery(search=search))
+    assert (count.count, count.exact) == (len(expected(library, search)), True)